@@ -16,26 +16,17 @@ conda_create ()
     conda create -q -n $ENV_NAME "python=$1" $deps
 }
 
-if [ ! -f "$HOME/env/miniconda.sh" ]; then
+if [ ! -f "$HOME/env/miniconda3.sh" ]; then
     mkdir -p $HOME/env
     pushd $HOME/env
 
         # Download miniconda packages
-        wget http://repo.continuum.io/miniconda/Miniconda-3.16.0-Linux-x86_64.sh -O miniconda.sh;
-
-        # Install both environments
-        bash miniconda.sh -b -p $HOME/env/miniconda27
-        bash miniconda.sh -b -p $HOME/env/miniconda34
-        bash miniconda.sh -b -p $HOME/env/miniconda35
-
-        for version in 2.7 3.4 3.5 ; do
-            if [[ "$version" == "2.7" ]]; then
-                src="$HOME/env/miniconda27"
-            elif [[ "$version" == "3.4" ]]; then
-                src="$HOME/env/miniconda34"
-            else
-                src="$HOME/env/miniconda35"
-            fi
+        wget https://repo.anaconda.com/miniconda/Miniconda3-latest-Linux-x86_64.sh -O miniconda3.sh;
+
+        # Install one environment per Python version, e.g. miniconda38
+        for version in 3.8 3.9 3.10 3.11 ; do
+            src="$HOME/env/miniconda${version/./}"
+            bash miniconda3.sh -b -p $src
             OLDPATH=$PATH
             export PATH="$src/bin:$PATH"
             conda_create $version
@@ -45,7 +36,7 @@ if [ ! -f "$HOME/env/miniconda.sh" ]; then
             pip install pytest pytest-cov
             pip install python-coveralls
 
-            source deactivate
+            conda deactivate
 
             export PATH=$OLDPATH
         done
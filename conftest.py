@@ -1,11 +1,15 @@
+import functools
 import json
 import os
 import pytest
 import tempfile
 import shutil
-import uuid
+from pytest_benchmark.fixture import BenchmarkFixture
 
+import minibench.bench
 import minibench.data
+import minibench.instrument
+import minibench.memory
 
 
 def pytest_addoption(parser):
@@ -19,24 +23,94 @@ def pytest_addoption(parser):
     parser.addoption(
         "--no-clean", action='store_true',
         help="If provided, will not annihilate the data generated.")
+    parser.addoption(
+        "--memory", action='store_true',
+        help="If provided, will record the peak memory and allocations of "
+             "every benchmark, untimed, after timing it (slow).")
+    parser.addoption(
+        "--memory-draws", type=int, default=100,
+        help="With --memory, the maximum number of untimed calls to track "
+             "memory over, for benchmarks timing single calls.")
+    parser.addoption(
+        "--instrument", action='store_true',
+        help="If provided, will record the time spent in each stage of the "
+             "samplers in every benchmark's extra_info.")
 
 
 @pytest.fixture()
 def workspace(request):
-    # TODO: Use pytest.config.option('--workspace')
-    test_workspace = tempfile.mkdtemp()
+    """Scratch directory for a single test, under --workspace if given."""
+    root = request.config.getoption("--workspace")
+    if root is not None and not os.path.exists(root):
+        os.makedirs(root)
+    test_workspace = tempfile.mkdtemp(dir=root)
 
     def fin():
-        # TODO: Add `if not no-clean`
-        if os.path.exists(test_workspace):
+        if not request.config.getoption("--no-clean") and \
+                os.path.exists(test_workspace):
             shutil.rmtree(test_workspace)
 
     request.addfinalizer(fin)
-
-    # Could use a py2 fallback? py3 does this cleanly.
     return test_workspace
 
 
+@pytest.fixture(autouse=True)
+def track_memory(request, monkeypatch):
+    """With --memory, record the peak memory and allocations of what every
+    benchmark times, in its extra_info; see `minibench.memory`."""
+    if not request.config.getoption("--memory") or \
+            'benchmark' not in request.fixturenames:
+        return
+    n_draws = request.config.getoption("--memory-draws")
+    monkeypatch.setattr(
+        BenchmarkFixture, '__call__',
+        minibench.memory.tracking_memory(BenchmarkFixture.__call__, n_draws))
+    monkeypatch.setattr(
+        minibench.bench, 'benchmark_throughput',
+        functools.partial(minibench.bench.benchmark_throughput,
+                          track_memory=True))
+
+
+@pytest.fixture(autouse=True)
+def instrument(request):
+    """With --instrument, time the sampler stages of every benchmark, and
+    record them in its extra_info; see `minibench.instrument`."""
+    if not request.config.getoption("--instrument") or \
+            'benchmark' not in request.fixturenames:
+        return None
+    benchmark = request.getfixturevalue('benchmark')
+    probe = minibench.instrument.Instrument()
+    probe.start()
+
+    def fin():
+        probe.stop()
+        probe.attach(benchmark)
+
+    request.addfinalizer(fin)
+    return probe
+
+
+@pytest.fixture(scope='session')
+def dataset_cache(request):
+    """Cache of generated collections, shared by every test in the session.
+
+    Under --workspace, the cache persists (in its 'datasets' directory) and
+    is reused across sessions; otherwise it lives in a temp directory that
+    is removed at the end of the session, unless --no-clean.
+    """
+    root = request.config.getoption("--workspace")
+    if root is None:
+        root = tempfile.mkdtemp()
+
+        def fin():
+            if not request.config.getoption("--no-clean") and \
+                    os.path.exists(root):
+                shutil.rmtree(root)
+
+        request.addfinalizer(fin)
+    return minibench.data.DatasetCache(os.path.join(root, 'datasets'))
+
+
 # TODO: Ideally it'd be something like the following.
 # param_file = pytest.config.getoption("--param_file")
 # @pytest.fixture(scope='module')
@@ -47,7 +121,7 @@ data_params = json.load(open("./params.json"))
 
 @pytest.fixture(params=data_params,
                 ids=["{}".format(p) for p in data_params])
-def npys_params(request, workspace):
+def npys_params(request, dataset_cache):
     """Populate a temporary stash file with data.
 
     Returns
@@ -58,44 +132,98 @@ def npys_params(request, workspace):
     param : obj
         Each data param item.
     """
-    return minibench.data.create_npy_collection(
+    return dataset_cache.npy_collection(
         shape=request.param['shape'],
-        num_items=request.param['num_items'],
-        output_dir=workspace), \
+        num_items=request.param['num_items']), \
         request.param
 
 
 @pytest.fixture(params=data_params,
                 ids=["{}".format(p) for p in data_params])
-def npzs_params(request, workspace):
-    npz_files = minibench.data.convert_npys_to_npzs(
-        minibench.data.create_npy_collection(
-                shape=request.param['shape'],
-                num_items=request.param['num_items'],
-                output_dir=workspace), 'data', workspace)
+def npzs_params(request, dataset_cache):
+    npz_files = dataset_cache.npz_collection(
+        shape=request.param['shape'],
+        num_items=request.param['num_items'])
     return npz_files, request.param
 
 
 @pytest.fixture(params=data_params,
                 ids=["{}".format(p) for p in data_params])
-def h5py_params(request, workspace):
-    fpath = os.path.join(workspace, "{}.hdf5".format(str(uuid.uuid4())))
-    npy_files = minibench.data.create_npy_collection(
+def h5py_params(request, dataset_cache):
+    fpath = dataset_cache.h5py_file(
         shape=request.param['shape'],
-        num_items=request.param['num_items'],
-        output_dir=workspace)
-    minibench.data.convert_npys_to_h5py(npy_files, fpath)
+        num_items=request.param['num_items'])
     return fpath, request.param
 
 
 @pytest.fixture(params=data_params,
                 ids=["{}".format(p) for p in data_params])
-def stash_params(request, workspace):
-    fpath = os.path.join(workspace, "{}.hdf5".format(str(uuid.uuid4())))
-    npz_files = minibench.data.convert_npys_to_npzs(
-        minibench.data.create_npy_collection(
-                shape=request.param['shape'],
-                num_items=request.param['num_items'],
-                output_dir=workspace), 'data', workspace)
-    minibench.data.convert_npzs_to_biggie(npz_files, fpath)
+def slab_params(request, dataset_cache):
+    fpath = dataset_cache.slab_file(
+        shape=request.param['shape'],
+        num_items=request.param['num_items'])
+    return fpath, request.param
+
+
+@pytest.fixture(params=data_params,
+                ids=["{}".format(p) for p in data_params])
+def stash_params(request, dataset_cache):
+    fpath = dataset_cache.stash_file(
+        shape=request.param['shape'],
+        num_items=request.param['num_items'])
+    return fpath, request.param
+
+
+h5py_variants = [{'chunks': [64, 64], 'compression': None},
+                 {'chunks': [64, 64], 'compression': 'lzf'},
+                 {'chunks': [64, 64], 'compression': 'gzip'}]
+h5py_chunked_params_list = [dict(p, **v)
+                            for p in data_params for v in h5py_variants]
+
+
+@pytest.fixture(params=h5py_chunked_params_list,
+                ids=["{}".format(p) for p in h5py_chunked_params_list])
+def h5py_chunked_params(request, dataset_cache):
+    fpath = dataset_cache.h5py_file(
+        shape=request.param['shape'],
+        num_items=request.param['num_items'],
+        chunks=request.param['chunks'],
+        compression=request.param['compression'])
+    return fpath, request.param
+
+
+npz_storage_variants = [{'compressed': compressed, 'dtype': dtype}
+                        for compressed in [False, True]
+                        for dtype in [None, 'float16', 'uint8']]
+npz_storage_params_list = [dict(p, **v)
+                           for p in data_params for v in npz_storage_variants]
+
+
+@pytest.fixture(params=npz_storage_params_list,
+                ids=["{}".format(p) for p in npz_storage_params_list])
+def npz_storage_params(request, dataset_cache):
+    npz_files = dataset_cache.npz_collection(
+        shape=request.param['shape'],
+        num_items=request.param['num_items'],
+        compressed=request.param['compressed'],
+        dtype=request.param['dtype'])
+    return npz_files, request.param
+
+
+h5py_storage_variants = [{'compression': compression, 'dtype': dtype}
+                         for compression in [None, 'lzf', 'gzip']
+                         for dtype in [None, 'float16', 'uint8']]
+h5py_storage_params_list = [dict(p, **v)
+                            for p in data_params
+                            for v in h5py_storage_variants]
+
+
+@pytest.fixture(params=h5py_storage_params_list,
+                ids=["{}".format(p) for p in h5py_storage_params_list])
+def h5py_storage_params(request, dataset_cache):
+    fpath = dataset_cache.h5py_file(
+        shape=request.param['shape'],
+        num_items=request.param['num_items'],
+        compression=request.param['compression'],
+        dtype=request.param['dtype'])
     return fpath, request.param
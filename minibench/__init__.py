@@ -1,3 +1,12 @@
+from . import bench
+from . import cache
 from . import data
+from . import epoch
+from . import instrument
+from . import memory
+from . import mux
+from . import parallel
+from . import readers
 from . import samplers
+from . import storage
 from . import version
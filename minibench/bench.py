@@ -0,0 +1,270 @@
+"""Sustained-throughput measurements of samplers.
+
+Timing one `next(sampler)` call at a time averages streamer startup, mux
+churn and page-cache effects away; here, each round instead starts a fresh
+sampler, times its first sample on its own, and then times a long run of
+draws, from which samples/s and MB/s follow.
+
+Examples
+--------
+Measure a sampler with pytest-benchmark, recording the throughput in the
+benchmark's extra_info (and so in its saved JSON; see `minibench.parse`).
+
+    > make_stream = functools.partial(
+    >     minibench.samplers.mux_random_slice,
+    >     sampler=minibench.samplers.one_npy_random_slice,
+    >     collec=npy_files, shape=(16, 16))
+    > benchmark_throughput(benchmark, make_stream, n_draws=256)
+"""
+import functools
+import itertools
+import numpy as np
+import os
+import time
+
+from . import instrument
+from . import memory
+
+try:
+    timer = time.perf_counter
+except AttributeError:
+    timer = time.time
+
+# Whether `evict_page_cache` is supported here (py3.3+, on POSIX systems).
+CAN_EVICT = hasattr(os, 'posix_fadvise')
+
+
+def evict_page_cache(fpaths):
+    """Drop files' pages from the OS page cache, so they're next read from
+    storage; no root required.
+
+    Dirty pages are flushed first, since the kernel only drops clean ones.
+    Pages that are still memory-mapped (e.g. by an open memmap) may stay
+    cached regardless. Where the OS can't evict them (see `CAN_EVICT`),
+    OSError is raised.
+
+    Parameters
+    ----------
+    fpaths : list of str
+        Files to evict.
+    """
+    if not CAN_EVICT:
+        raise OSError("Can't evict pages from the page cache: "
+                      "posix_fadvise isn't available here.")
+    for fpath in fpaths:
+        fd = os.open(fpath, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def warm_page_cache(fpaths, chunk_size=2**20):
+    """Read files through once, so they're next read from the page cache
+    (as far as it can hold them).
+
+    Parameters
+    ----------
+    fpaths : list of str
+        Files to read.
+
+    chunk_size : int, default=2**20
+        Number of bytes to read at a time.
+    """
+    for fpath in fpaths:
+        with open(fpath, 'rb') as fhandle:
+            while fhandle.read(chunk_size):
+                pass
+
+
+def page_cache_setup(mode, fpaths):
+    """Return a function preparing the page cache for a benchmark round.
+
+    Parameters
+    ----------
+    mode : str
+        'cold' to evict `fpaths` before each round, or 'warm' to read them
+        into the page cache; 'cold' raises OSError right away where
+        eviction isn't supported (see `CAN_EVICT`).
+
+    fpaths : list of str
+        Files the benchmark reads.
+
+    Returns
+    -------
+    setup : callable
+        Function of no arguments; see `benchmark_throughput`.
+    """
+    if mode == 'cold':
+        if not CAN_EVICT:
+            raise OSError("Can't run cold rounds: posix_fadvise isn't "
+                          "available here.")
+        return functools.partial(evict_page_cache, fpaths)
+    elif mode == 'warm':
+        return functools.partial(warm_page_cache, fpaths)
+    raise ValueError("Unknown page cache mode '{}'.".format(mode))
+
+
+def time_to_first(make_stream):
+    """Start a stream, and time how long it takes to produce its first
+    observation.
+
+    Parameters
+    ----------
+    make_stream : callable
+        Function of no arguments returning a new stream.
+
+    Returns
+    -------
+    stream : iterator
+        The stream, with its first observation drawn.
+
+    elapsed : float
+        Seconds from the call to `make_stream` to the first observation.
+    """
+    start = timer()
+    stream = make_stream()
+    next(stream)
+    return stream, timer() - start
+
+
+def drain(stream, n_draws, materialize=True):
+    """Draw a number of observations from a stream.
+
+    Parameters
+    ----------
+    stream : iterator
+        Stream of observations, with data under 'X'.
+
+    n_draws : int
+        Number of observations to draw.
+
+    materialize : bool, default=True
+        Copy each observation's data into a reused buffer, so that lazy
+        views (e.g. of memmaps) are actually read.
+
+    Returns
+    -------
+    count : int
+        Number of observations drawn, fewer if the stream ran out.
+
+    n_bytes : int
+        Total size of their data.
+    """
+    count, n_bytes, buffer = 0, 0, None
+    copyto = instrument.timed_function('copy', np.copyto)
+    for obs in itertools.islice(stream, n_draws):
+        data = obs['X']
+        if materialize:
+            if buffer is None or buffer.shape != data.shape or \
+                    buffer.dtype != data.dtype:
+                buffer = np.empty(data.shape, dtype=data.dtype)
+            copyto(buffer, data)
+        count += 1
+        n_bytes += data.nbytes
+    return count, n_bytes
+
+
+def close_stream(stream):
+    """Close a stream (e.g. a generator, releasing its resources), if it
+    can be closed."""
+    close = getattr(stream, 'close', None)
+    if close is not None:
+        close()
+
+
+def benchmark_throughput(benchmark, make_stream, n_draws, batch_size=1,
+                         rounds=5, materialize=True, before_round=None,
+                         track_memory=False):
+    """Benchmark the sustained throughput of a stream.
+
+    Each round calls `before_round`, if given, then starts a fresh stream
+    with `make_stream` and draws its first observation, all untimed by the
+    benchmark; it then draws `n_draws` more, timed, and closes the stream,
+    untimed. The benchmark's extra_info records the mean throughput, and
+    time to first sample, over the rounds:
+
+    - samples_per_s: samples drawn per second, counting `batch_size`
+      samples per draw.
+    - MB_per_s: megabytes (1e6) of data drawn per second.
+    - first_sample_s: seconds from starting a stream to its first sample.
+    - n_samples: samples timed per round.
+
+    With `track_memory`, one more round follows the timed ones, untimed,
+    its stream started and drained under a `minibench.memory.MemoryTracker`;
+    its memory use is recorded too (per draw, see `minibench.memory`).
+
+    Parameters
+    ----------
+    benchmark : pytest_benchmark.fixture.BenchmarkFixture
+        The benchmark fixture.
+
+    make_stream : callable
+        Function of no arguments returning a new stream.
+
+    n_draws : int
+        Number of observations to time per round.
+
+    batch_size : int, default=1
+        Number of samples per observation, for streams of minibatches.
+
+    rounds : int, default=5
+        Number of rounds.
+
+    materialize : bool, default=True
+        See `drain`.
+
+    before_round : callable, default=None
+        Function of no arguments to call before starting each round's
+        stream, untimed, e.g. from `page_cache_setup`.
+
+    Returns
+    -------
+    extra_info : dict
+        The recorded throughput.
+    """
+    streams, first_times, sizes = [], [], []
+
+    def setup():
+        if before_round is not None:
+            before_round()
+        stream, elapsed = time_to_first(make_stream)
+        streams.append(stream)
+        first_times.append(elapsed)
+        return (stream,), dict()
+
+    def run(stream):
+        sizes.append(drain(stream, n_draws, materialize=materialize))
+
+    def replay():
+        stream = make_stream()
+        streams.append(stream)
+        count, _ = drain(stream, n_draws + 1, materialize=materialize)
+        return count
+
+    try:
+        benchmark.pedantic(run, setup=setup, teardown=close_stream,
+                           rounds=rounds)
+        if track_memory:
+            if before_round is not None:
+                before_round()
+            memory.track_call(benchmark, replay)
+    finally:
+        # Disabled benchmarks skip the teardown.
+        for stream in streams:
+            close_stream(stream)
+    count, n_bytes = np.mean(sizes, axis=0)
+    if count < n_draws:
+        raise ValueError("The stream ran out after {} of {} draws.".format(
+            count, n_draws))
+
+    benchmark.extra_info.update(first_sample_s=float(np.mean(first_times)),
+                                n_samples=int(count * batch_size))
+    # Disabled benchmarks (--benchmark-disable) run once, untimed.
+    if benchmark.stats is not None:
+        elapsed = benchmark.stats.stats.mean
+        benchmark.extra_info.update(
+            samples_per_s=count * batch_size / elapsed,
+            MB_per_s=n_bytes / elapsed / 1e6)
+    return benchmark.extra_info
@@ -0,0 +1,329 @@
+"""Caches shared across samplers, to avoid redoing expensive work (decoding,
+opening files) every time a streamer is (re)activated.
+
+Examples
+--------
+Share decoded NPZ arrays, up to 512MB in total, across every streamer in a
+mux.
+
+    > cache = ArrayCache(512 * 2**20)
+    > sampler = minibench.samplers.mux_random_slice(
+    >     sampler=minibench.samplers.one_npz_random_slice,
+    >     collec=npz_files, shape=(16, 16), field='data', cache=cache)
+
+Keep at most 256 memmaps open at once, no matter how many streamers come
+and go.
+
+    > pool = HandlePool(functools.partial(np.load, mmap_mode='r'), 256)
+    > sampler = minibench.samplers.mux_random_slice(
+    >     sampler=minibench.samplers.one_npy_random_slice,
+    >     collec=npy_files, shape=(16, 16), pool=pool)
+"""
+import collections
+import contextlib
+import threading
+
+from . import instrument
+
+
+class LRUCache(object):
+    """Least-recently-used mapping with a bounded total cost.
+
+    Each value has a cost (1 by default, see `weigh`); once the total cost
+    exceeds `capacity`, least-recently-used entries are evicted. Values that
+    cost more than `capacity` on their own are never stored.
+
+    Caches are safe to share across threads; note that concurrent misses on
+    the same key in `get_or_load` may each load the value.
+    """
+
+    def __init__(self, capacity, weigh=None):
+        """Create an empty cache.
+
+        Parameters
+        ----------
+        capacity : scalar, > 0
+            Maximum total cost of the stored values.
+
+        weigh : callable, default=None
+            Function mapping a value to its cost; if None, every value costs 1.
+        """
+        self.capacity = capacity
+        self._weigh = weigh if weigh is not None else (lambda value: 1)
+        self._data = collections.OrderedDict()
+        self._lock = threading.RLock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __repr__(self):
+        return "{}(capacity={}, size={}, n_items={})".format(
+            self.__class__.__name__, self.capacity, self.size, len(self))
+
+    def get(self, key, default=None):
+        """Return the value for `key`, marking it as recently used.
+
+        Parameters
+        ----------
+        key : hashable
+            Key to look up.
+
+        default : obj, default=None
+            Value to return if `key` is not cached.
+
+        Returns
+        -------
+        value : obj
+            The cached value, or `default`.
+        """
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return default
+            self.hits += 1
+            value, cost = self._data.pop(key)
+            self._data[key] = (value, cost)
+            return value
+
+    def put(self, key, value):
+        """Store `value` under `key`, evicting old entries as needed.
+
+        Parameters
+        ----------
+        key : hashable
+            Key to store the value under.
+
+        value : obj
+            Value to store.
+
+        Returns
+        -------
+        stored : bool
+            False if the value alone exceeds the capacity, else True.
+        """
+        cost = self._weigh(value)
+        with self._lock:
+            self.discard(key)
+            if cost > self.capacity:
+                return False
+            self._data[key] = (value, cost)
+            self.size += cost
+            while self.size > self.capacity:
+                old_key = next(iter(self._data))
+                self.discard(old_key)
+                self.evictions += 1
+            return True
+
+    def get_or_load(self, key, loader):
+        """Return the value for `key`, loading and storing it on a miss.
+
+        Parameters
+        ----------
+        key : hashable
+            Key to look up.
+
+        loader : callable
+            Function of no arguments producing the value for `key`.
+
+        Returns
+        -------
+        value : obj
+            The cached or newly loaded value.
+        """
+        with self._lock:
+            if key in self._data:
+                return self.get(key)
+            self.misses += 1
+        # Load outside the lock, so other keys aren't held up meanwhile.
+        value = loader()
+        self.put(key, value)
+        return value
+
+    def discard(self, key):
+        """Remove `key` from the cache, if present."""
+        with self._lock:
+            if key in self._data:
+                value, cost = self._data.pop(key)
+                self.size -= cost
+
+    def clear(self):
+        """Remove everything from the cache."""
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def stats(self):
+        """Return the cache's counters as a dict."""
+        return dict(size=self.size, n_items=len(self), hits=self.hits,
+                    misses=self.misses, evictions=self.evictions)
+
+
+class ArrayCache(LRUCache):
+    """LRU cache of ndarrays, bounded by their total size in bytes."""
+
+    def __init__(self, max_bytes):
+        """Create an empty cache.
+
+        Parameters
+        ----------
+        max_bytes : int, > 0
+            Byte budget for the cached arrays.
+        """
+        super(ArrayCache, self).__init__(max_bytes,
+                                         weigh=lambda arr: arr.nbytes)
+
+
+def close_handle(handle):
+    """Close a file handle, if it can be closed.
+
+    Objects with a `close` method (NpzFile, h5py.File, ...) are closed;
+    anything else (e.g. np.memmap, which is unmapped once unreferenced) is
+    left alone.
+    """
+    close = getattr(handle, 'close', None)
+    if close is not None:
+        close()
+
+
+@contextlib.contextmanager
+def closing_handle(handle):
+    """Context manager that closes `handle` (see `close_handle`) on exit."""
+    try:
+        yield handle
+    finally:
+        close_handle(handle)
+
+
+class HandlePool(object):
+    """Bounded pool of open file handles, keyed by path.
+
+    Handles are opened on demand and kept open after use, so streamers that
+    are repeatedly (re)created over the same files don't pay for reopening
+    them. Once more than `max_open` handles are open, the least-recently-used
+    ones that are not currently in use are closed. Handles in use are pinned,
+    so the pool may briefly exceed `max_open` if more than that are in use
+    at once.
+
+    Pools are safe to share across threads, as far as their bookkeeping goes;
+    whether a handle itself can be used from several threads at once is up to
+    the handle.
+    """
+
+    def __init__(self, opener, max_open=64, closer=close_handle):
+        """Create an empty pool.
+
+        Parameters
+        ----------
+        opener : callable
+            Function mapping a path to an open handle, e.g.
+            `functools.partial(np.load, mmap_mode='r')` or `h5py.File`.
+
+        max_open : int, default=64, > 0
+            Number of handles to keep open when idle.
+
+        closer : callable, default=close_handle
+            Function used to close evicted handles.
+        """
+        self.opener = opener
+        self.max_open = max_open
+        self.closer = closer
+        self._handles = collections.OrderedDict()
+        self._pins = collections.defaultdict(int)
+        self._lock = threading.RLock()
+        self.opens = 0
+        self.hits = 0
+        self.closes = 0
+
+    def __len__(self):
+        return len(self._handles)
+
+    def __contains__(self, key):
+        return key in self._handles
+
+    def __repr__(self):
+        return "HandlePool(max_open={}, n_open={}, n_pinned={})".format(
+            self.max_open, len(self), len(self._pins))
+
+    def acquire(self, key):
+        """Return an open handle for `key`, pinning it until `release`.
+
+        Parameters
+        ----------
+        key : str
+            Path to open (passed to `opener`).
+
+        Returns
+        -------
+        handle : obj
+            The open handle.
+        """
+        with self._lock:
+            if key in self._handles:
+                self.hits += 1
+                return self._pin(key, self._handles.pop(key))
+            self.opens += 1
+
+        # Open outside the lock, so that slow opens (e.g. over a network)
+        # don't hold up other threads.
+        with instrument.stage('open'):
+            handle = self.opener(key)
+        instrument.count('opens')
+        with self._lock:
+            if key in self._handles:
+                # Another thread opened it meanwhile; keep theirs.
+                self.closer(handle)
+                self.closes += 1
+                handle = self._handles.pop(key)
+            return self._pin(key, handle)
+
+    def _pin(self, key, handle):
+        self._handles[key] = handle
+        self._pins[key] += 1
+        self._evict()
+        return handle
+
+    def release(self, key):
+        """Unpin a handle previously returned by `acquire`."""
+        with self._lock:
+            self._pins[key] -= 1
+            if self._pins[key] <= 0:
+                del self._pins[key]
+            self._evict()
+
+    @contextlib.contextmanager
+    def open(self, key):
+        """Context manager acquiring, and then releasing, `key`'s handle."""
+        handle = self.acquire(key)
+        try:
+            yield handle
+        finally:
+            self.release(key)
+
+    def _evict(self):
+        excess = len(self._handles) - self.max_open
+        if excess <= 0:
+            return
+        idle = [key for key in self._handles if key not in self._pins]
+        for key in idle[:excess]:
+            self.closer(self._handles.pop(key))
+            self.closes += 1
+
+    def close(self):
+        """Close every open handle, in use or not."""
+        with self._lock:
+            while self._handles:
+                self.closer(self._handles.popitem(last=False)[1])
+                self.closes += 1
+            self._pins.clear()
+
+    def stats(self):
+        """Return the pool's counters as a dict."""
+        return dict(n_open=len(self), opens=self.opens, hits=self.hits,
+                    closes=self.closes)
@@ -1,9 +1,20 @@
 import biggie
 import h5py
+import hashlib
+import itertools
+import json
+import multiprocessing
 import numpy as np
 import os
+import shutil
 import uuid
 
+from . import readers
+
+# Version of the data generation; bump it whenever a given set of parameters
+# would generate different data, to invalidate `DatasetCache`s.
+GENERATOR_VERSION = 1
+
 
 def filebase(fpath):
     """Return the file's base name, e.g. '/x/y.z' -> 'y'
@@ -21,10 +32,38 @@ def filebase(fpath):
     return os.path.splitext(os.path.basename(fpath))[0]
 
 
+def _seed_streams(seed):
+    """Generate independent seed sequences, one per item, from `seed`."""
+    parent = np.random.SeedSequence(seed)
+    while True:
+        yield parent.spawn(1)[0]
+
+
+def _random_ndarray(seed_seq, shape, loc=0, scale=1.0, dtype=np.float64):
+    """Draw a single normally distributed ndarray; see `random_ndarrays`.
+
+    Float32 and float64 values are drawn directly in place; other dtypes are
+    drawn as float32 and then cast.
+    """
+    dtype = np.dtype(dtype)
+    draw_dtype = dtype if dtype in (np.float32, np.float64) else np.float32
+    arr = np.random.default_rng(seed_seq).standard_normal(
+        shape, dtype=draw_dtype)
+    if scale != 1:
+        arr *= scale
+    if loc:
+        arr += loc
+    return arr.astype(dtype, copy=False)
+
+
 def random_ndarrays(shape, num_items=None, loc=0, scale=1.0,
                     dtype=np.float64, seed=12345):
     """Produce a number of key-value, normally distributed ndarrays.
 
+    Each item is drawn from its own stream, spawned from `seed`, so the n-th
+    item is the same however (and in whatever order) the items are drawn;
+    see `create_npy_collection`.
+
     Parameters
     ----------
     shape : array_like
@@ -47,16 +86,80 @@ def random_ndarrays(shape, num_items=None, loc=0, scale=1.0,
     key, ndarray : str, np.ndarray
         Unique key and random value ndarray.
     """
-    rng = np.random.RandomState(seed)
     count = 0
-    while True:
+    for seed_seq in _seed_streams(seed):
         if num_items is not None and count >= num_items:
             break
-        yield uuid.uuid4(), rng.normal(loc, scale, shape).astype(dtype=dtype)
+        yield uuid.uuid4(), _random_ndarray(seed_seq, shape, loc=loc,
+                                            scale=scale, dtype=dtype)
         count += 1
 
 
-def create_npy_collection(shape, num_items, output_dir, **kwargs):
+def quantize(arr, dtype):
+    """Quantize an array to a smaller dtype, with an affine scale and offset.
+
+    Integer dtypes span the array's range in as many steps as they have;
+    float dtypes are a plain cast, with a scale of 1 and an offset of 0.
+
+    Parameters
+    ----------
+    arr : np.ndarray
+        Array to quantize.
+
+    dtype : type
+        Datatype to quantize to, e.g. np.uint8 or np.float16.
+
+    Returns
+    -------
+    values : np.ndarray
+        Quantized array, such that `arr ~= values * scale + offset`.
+
+    scale, offset : float
+        Parameters to dequantize with; see
+        `minibench.samplers.dequantize`.
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'f':
+        return arr.astype(dtype), 1.0, 0.0
+    info = np.iinfo(dtype)
+    low, high = float(arr.min()), float(arr.max())
+    scale = (high - low) / (float(info.max) - info.min) or 1.0
+    offset = low - info.min * scale
+    values = np.clip(np.round((arr - offset) / scale), info.min, info.max)
+    return values.astype(dtype), scale, offset
+
+
+def npy_manifest(npy_files):
+    """Describe a collection of NPY files from their headers.
+
+    Parameters
+    ----------
+    npy_files = list of str
+        Paths to NPY files.
+
+    Returns
+    -------
+    manifest : minibench.readers.Manifest
+        Manifest of the files, keyed by their base names.
+    """
+    rows = []
+    for fpath in npy_files:
+        header = readers.read_npy_header(fpath)
+        nbytes = int(np.prod(header.shape)) * header.dtype.itemsize
+        rows.append((fpath, filebase(fpath), header.offset, nbytes,
+                     header.dtype, header.fortran_order, header.shape))
+    return readers.Manifest.from_rows(rows)
+
+
+def _save_random_ndarray(args):
+    """Draw a random ndarray and save it; a process pool's work item."""
+    fpath, seed_seq, shape, kwargs = args
+    np.save(fpath, _random_ndarray(seed_seq, shape, **kwargs))
+    return fpath
+
+
+def create_npy_collection(shape, num_items, output_dir, manifest=None,
+                          n_jobs=1, seed=12345, **kwargs):
     """Create a number of NPY files.
 
     Parameters
@@ -70,6 +173,17 @@ def create_npy_collection(shape, num_items, output_dir, **kwargs):
     output_dir : str
         Path under which to write data.
 
+    manifest : str, default=None
+        If given, path to write a manifest of the new files to; see
+        `minibench.readers.Manifest`.
+
+    n_jobs : int, default=1
+        Number of processes to generate and write the files with; one per
+        CPU if None. The files' contents don't depend on it.
+
+    seed : int, default=12345
+        Seed for the random number generator.
+
     kwargs : other args to pass to `random_ndarrays`.
 
     Returns
@@ -77,21 +191,27 @@ def create_npy_collection(shape, num_items, output_dir, **kwargs):
     new_files = list of str
         Paths to the created set of files.
     """
-    data_gen = random_ndarrays(shape, num_items=num_items, **kwargs)
-    new_files = []
-    for key, value in data_gen:
-        fpath = os.path.join(output_dir, "{}.npy".format(key))
-        np.save(fpath, value)
-        if not os.path.exists(fpath):
-            raise ValueError("Expected output doesn't exist?? fpath={}"
-                             "".format(fpath))
-        new_files.append(fpath)
-
+    tasks = [(os.path.join(output_dir, "{}.npy".format(uuid.uuid4())),
+              seed_seq, shape, kwargs)
+             for seed_seq in itertools.islice(_seed_streams(seed), num_items)]
+    if n_jobs == 1:
+        new_files = [_save_random_ndarray(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(n_jobs)
+        try:
+            new_files = pool.map(_save_random_ndarray, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    if manifest is not None:
+        npy_manifest(new_files).save(manifest)
     return new_files
 
 
-def convert_npys_to_npzs(npy_files, arr_key, output_dir):
-    """Create a number of NPY files.
+def convert_npys_to_npzs(npy_files, arr_key, output_dir, manifest=None,
+                         compressed=False, dtype=None):
+    """Create a number of NPZ files.
 
     Parameters
     ----------
@@ -104,22 +224,46 @@ def convert_npys_to_npzs(npy_files, arr_key, output_dir):
     output_dir : str
         Path under which to write data.
 
+    manifest : str, default=None
+        If given, path to write a manifest of the new files to; see
+        `minibench.readers.Manifest`.
+
+    compressed : bool, default=False
+        Deflate the archives, with np.savez_compressed.
+
+    dtype : type, default=None
+        If given, quantize the arrays to this datatype (see `quantize`),
+        storing the scale and offset under '{arr_key}_scale' and
+        '{arr_key}_offset'.
+
     Returns
     -------
     npz_files : list of str
         Newly created NPZ files.
     """
-    npz_files = []
+    savez = np.savez_compressed if compressed else np.savez
+    npz_files, rows = [], []
     for fpath in npy_files:
         data = {arr_key: np.load(fpath)}
+        if dtype is not None:
+            data[arr_key], scale, offset = quantize(data[arr_key], dtype)
+            data["{}_scale".format(arr_key)] = scale
+            data["{}_offset".format(arr_key)] = offset
         npz_path = os.path.join(output_dir, "{}.npz".format(filebase(fpath)))
-        np.savez(npz_path, **data)
+        savez(npz_path, **data)
         npz_files.append(npz_path)
+        arr = data[arr_key]
+        rows.append((npz_path, filebase(fpath), -1, arr.nbytes, arr.dtype,
+                     False, arr.shape))
 
+    if manifest is not None:
+        readers.Manifest.from_rows(rows).save(manifest)
     return npz_files
 
 
-def convert_npys_to_h5py(npy_files, fpath):
+def convert_npys_to_h5py(npy_files, fpath, chunks=None, compression=None,
+                         compression_opts=None, shuffle=False, manifest=None,
+                         dtype=None):
     """Convert a collection of NPY files into h5py.
 
     Note: It will (should?) do this in a flat manner. This is suspected to be
@@ -133,17 +277,60 @@ def convert_npys_to_h5py(npy_files, fpath):
     fpath : str
         Filepath to write h5py file.
 
+    chunks : tuple, True or None, default=None
+        Chunk shape of each dataset, clipped to the dataset's shape; True
+        lets h5py guess, and None stores the data contiguously (unless
+        compressing, which requires chunking).
+
+    compression : str or int, default=None
+        Compression filter, e.g. 'gzip' or 'lzf'; see h5py's create_dataset.
+
+    compression_opts : obj, default=None
+        Options for the compression filter, e.g. the gzip level.
+
+    shuffle : bool, default=False
+        Apply the byte-shuffle filter, which often helps compression.
+
+    manifest : str, default=None
+        If given, path to write a manifest of the new datasets to; see
+        `minibench.readers.Manifest`. Offsets are only recorded for
+        contiguous datasets.
+
+    dtype : type, default=None
+        If given, quantize the arrays to this datatype (see `quantize`),
+        storing the scale and offset in each dataset's 'scale' and 'offset'
+        attributes.
+
     Returns
     -------
     success : bool
         True if `fpath` exists, else False.
     """
-    fhandle = h5py.File(fpath)
-    for fpath in npy_files:
-        data = np.load(fpath)
-        fhandle.create_dataset(filebase(fpath), data=data)
+    fhandle = h5py.File(fpath, 'a')
+    rows = []
+    for npy_file in npy_files:
+        data, quantization = np.load(npy_file), None
+        if dtype is not None:
+            data, scale, offset = quantize(data, dtype)
+            quantization = dict(scale=scale, offset=offset)
+        dset_chunks = chunks
+        if chunks is not None and chunks is not True:
+            dset_chunks = tuple([min(chunk, dim)
+                                 for chunk, dim in zip(chunks, data.shape)])
+        dset = fhandle.create_dataset(
+            filebase(npy_file), data=data, chunks=dset_chunks,
+            compression=compression, compression_opts=compression_opts,
+            shuffle=shuffle)
+        if quantization is not None:
+            dset.attrs.update(quantization)
+        offset = dset.id.get_offset()
+        rows.append((fpath, filebase(npy_file),
+                     -1 if offset is None else offset, data.nbytes,
+                     data.dtype, False, data.shape))
 
     fhandle.close()
+    if manifest is not None:
+        readers.Manifest.from_rows(rows).save(manifest)
     return os.path.exists(fpath)
 
 
@@ -170,3 +357,250 @@ def convert_npzs_to_biggie(npz_files, fpath):
 
     stash.close()
     return os.path.exists(fpath)
+
+
+def convert_npys_to_slab(npy_files, fpath, alignment=64):
+    """Pack a collection of NPY files into a single binary slab.
+
+    Each array is written in C order, starting on an `alignment`-byte
+    boundary, and a manifest of every array's key, byte offset, size, dtype
+    and shape is written alongside as its index (see
+    `minibench.readers.Slab`).
+
+    Parameters
+    ----------
+    npy_files = list of str
+        Paths to the created set of files.
+
+    fpath : str
+        Filepath to write the slab file; the index is written to
+        `minibench.readers.slab_index_path(fpath)`.
+
+    alignment : int, default=64
+        Byte alignment of each array in the slab.
+
+    Returns
+    -------
+    success : bool
+        True if `fpath` and its index exist, else False.
+    """
+    rows = []
+    with open(fpath, 'wb') as fhandle:
+        for npy_file in npy_files:
+            data = np.ascontiguousarray(np.load(npy_file, mmap_mode='r'))
+            padding = -fhandle.tell() % alignment
+            fhandle.write(b'\0' * padding)
+            rows.append((fpath, filebase(npy_file), fhandle.tell(),
+                         data.nbytes, data.dtype, False, data.shape))
+            data.tofile(fhandle)
+
+    index_path = readers.slab_index_path(fpath)
+    readers.Manifest.from_rows(rows).save(index_path)
+    return os.path.exists(fpath) and os.path.exists(index_path)
+
+
+class DatasetCache(object):
+    """On-disk cache of generated collections, addressed by their content.
+
+    Each collection lives in its own directory under `root`, named for a
+    hash of its format, its parameters and the `GENERATOR_VERSION`, so the
+    same request always maps to the same data, across tests and sessions.
+    Converted collections (NPZ, HDF5, slab, biggie) are derived from the
+    cached NPY collection with the same generation parameters.
+
+    Examples
+    --------
+    > cache = DatasetCache('/tmp/minibench-data')
+    > npy_files = cache.npy_collection((2048, 256), 500)
+    > h5py_file = cache.h5py_file((2048, 256), 500, compression='lzf')
+    """
+
+    INDEX = 'index.json'
+
+    def __init__(self, root, n_jobs=None):
+        """Open (or start) a cache.
+
+        Parameters
+        ----------
+        root : str
+            Directory holding the cache; created if needed.
+
+        n_jobs : int, default=None
+            Number of processes to generate NPY collections with; see
+            `create_npy_collection`.
+        """
+        self.root = root
+        self.n_jobs = n_jobs
+        if not os.path.exists(root):
+            os.makedirs(root)
+
+    def __repr__(self):
+        return "DatasetCache(root='{}')".format(self.root)
+
+    def entry_path(self, fmt, params):
+        """Return the directory for a collection.
+
+        Parameters
+        ----------
+        fmt : str
+            Name of the collection's format.
+
+        params : dict
+            JSON-serializable parameters that determine its content.
+
+        Returns
+        -------
+        path : str
+            Directory under `root`.
+        """
+        spec = json.dumps(dict(format=fmt, params=params,
+                               version=GENERATOR_VERSION),
+                          sort_keys=True, default=str)
+        digest = hashlib.sha1(spec.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.root, "{}-{}".format(fmt, digest))
+
+    def get(self, fmt, params, build):
+        """Return a collection's files, building them on a miss.
+
+        Entries are only complete once their index is written; partial ones
+        (e.g. left by an interrupted build) are rebuilt from scratch.
+
+        Parameters
+        ----------
+        fmt, params : see `entry_path`
+
+        build : callable
+            Function of an (empty) output directory, writing the collection
+            there and returning the list of its files.
+
+        Returns
+        -------
+        fpaths : list of str
+            The collection's files.
+        """
+        entry = self.entry_path(fmt, params)
+        index = os.path.join(entry, self.INDEX)
+        if not os.path.exists(index):
+            if os.path.exists(entry):
+                shutil.rmtree(entry)
+            os.makedirs(entry)
+            fpaths = build(entry)
+            with open(index + '.tmp', 'w') as fhandle:
+                json.dump(dict(format=fmt, params=params,
+                               version=GENERATOR_VERSION,
+                               fpaths=[os.path.relpath(fpath, entry)
+                                       for fpath in fpaths]),
+                          fhandle, default=str)
+            os.rename(index + '.tmp', index)
+
+        with open(index) as fhandle:
+            fpaths = json.load(fhandle)['fpaths']
+        return [os.path.join(entry, fpath) for fpath in fpaths]
+
+    def npy_collection(self, shape, num_items, **kwargs):
+        """Return a cached `create_npy_collection`.
+
+        Parameters
+        ----------
+        shape, num_items : see `create_npy_collection`
+
+        kwargs : other args to pass to `create_npy_collection`.
+
+        Returns
+        -------
+        npy_files : list of str
+            Paths to the collection's files.
+        """
+        params = dict(shape=list(shape), num_items=num_items, **kwargs)
+        return self.get('npy', params, lambda output_dir: (
+            create_npy_collection(shape, num_items, output_dir,
+                                  n_jobs=self.n_jobs, **kwargs)))
+
+    def npz_collection(self, shape, num_items, arr_key='data', **kwargs):
+        """Return a cached `convert_npys_to_npzs` of the default NPY
+        collection of this shape and size.
+
+        Parameters
+        ----------
+        shape, num_items : see `create_npy_collection`
+
+        arr_key : str, default='data'
+            Name to write the arrays under.
+
+        kwargs : other args to pass to `convert_npys_to_npzs`.
+
+        Returns
+        -------
+        npz_files : list of str
+            Paths to the collection's files.
+        """
+        npy_files = self.npy_collection(shape, num_items)
+        params = dict(shape=list(shape), num_items=num_items,
+                      arr_key=arr_key, **kwargs)
+        return self.get('npz', params, lambda output_dir: (
+            convert_npys_to_npzs(npy_files, arr_key, output_dir, **kwargs)))
+
+    def _single_file(self, fmt, ext, convert, npy_files, params, kwargs):
+        def build(output_dir):
+            fpath = os.path.join(output_dir, "data.{}".format(ext))
+            convert(npy_files, fpath, **kwargs)
+            return [fpath]
+        return self.get(fmt, dict(params, **kwargs), build)[0]
+
+    def h5py_file(self, shape, num_items, **kwargs):
+        """Return a cached `convert_npys_to_h5py` of the default NPY
+        collection of this shape and size.
+
+        Parameters
+        ----------
+        shape, num_items : see `create_npy_collection`
+
+        kwargs : other args to pass to `convert_npys_to_h5py`.
+
+        Returns
+        -------
+        fpath : str
+            Path to the HDF5 file.
+        """
+        return self._single_file(
+            'h5py', 'hdf5', convert_npys_to_h5py,
+            self.npy_collection(shape, num_items),
+            dict(shape=list(shape), num_items=num_items), kwargs)
+
+    def slab_file(self, shape, num_items, **kwargs):
+        """Return a cached `convert_npys_to_slab` of the default NPY
+        collection of this shape and size.
+
+        Parameters
+        ----------
+        shape, num_items : see `create_npy_collection`
+
+        kwargs : other args to pass to `convert_npys_to_slab`.
+
+        Returns
+        -------
+        fpath : str
+            Path to the slab file.
+        """
+        return self._single_file(
+            'slab', 'slab', convert_npys_to_slab,
+            self.npy_collection(shape, num_items),
+            dict(shape=list(shape), num_items=num_items), kwargs)
+
+    def stash_file(self, shape, num_items):
+        """Return a cached `convert_npzs_to_biggie` of the default NPZ
+        collection of this shape and size.
+
+        Parameters
+        ----------
+        shape, num_items : see `create_npy_collection`
+
+        Returns
+        -------
+        fpath : str
+            Path to the biggie stash.
+        """
+        return self._single_file(
+            'biggie', 'hdf5', convert_npzs_to_biggie,
+            self.npz_collection(shape, num_items),
+            dict(shape=list(shape), num_items=num_items), dict())
@@ -0,0 +1,269 @@
+"""Exhaustive, reproducible epochs over every (item, offset) pair.
+
+Where the random samplers draw offsets with replacement forever, an epoch
+visits each valid slice of a collection exactly once, in a shuffled order.
+The space of slices is never materialized: `SliceSpace` maps flat indices to
+(item, offset) pairs arithmetically, and `FeistelPermutation` shuffles the
+flat indices with a keyed bijection, so an epoch over hundreds of millions
+of slices needs no more memory than one block of them.
+
+Examples
+--------
+Visit every 16x16 slice (on a stride of 8) of a collection of NPY files
+once, in a seeded order.
+
+    > manifest = minibench.data.npy_manifest(npy_files)
+    > sampler = epoch_random_slice(npy_files, (16, 16), stride=8,
+    >                              manifest=manifest, seed=1)
+    > n_slices = sum(1 for obs in sampler)
+"""
+import numpy as np
+
+from . import mux
+
+
+class FeistelPermutation(object):
+    """Pseudo-random permutation of range(n), computed one index at a time.
+
+    A balanced Feistel network over the smallest even number of bits that
+    covers `n` is a bijection on its (up to 4x larger) domain; indices that
+    land outside range(n) are mapped again until they land inside ("cycle
+    walking"), which keeps the whole a bijection on range(n).
+    """
+
+    # Multipliers of the round function (a 64-bit integer hash).
+    _MULTIPLIERS = (np.uint64(0x9E3779B97F4A7C15),
+                    np.uint64(0xBF58476D1CE4E5B9))
+
+    def __init__(self, n, seed=None, rounds=4):
+        """Create a permutation.
+
+        Parameters
+        ----------
+        n : int, >= 0
+            Size of the permuted range.
+
+        seed : int, default=None
+            Seed for the round keys.
+
+        rounds : int, default=4
+            Number of Feistel rounds.
+        """
+        self.n = int(n)
+        bits = max(int(np.ceil(np.log2(max(self.n, 2)))), 2)
+        self._half = np.uint64((bits + 1) // 2)
+        self._mask = np.uint64((1 << int(self._half)) - 1)
+        self._keys = np.random.RandomState(seed).randint(
+            0, 2 ** 32, size=rounds).astype(np.uint64)
+
+    def __len__(self):
+        return self.n
+
+    def __repr__(self):
+        return "FeistelPermutation(n={}, rounds={})".format(
+            self.n, len(self._keys))
+
+    def _round(self, right, key):
+        mult, mix = self._MULTIPLIERS
+        hashed = (right + key) * mult
+        hashed ^= hashed >> np.uint64(29)
+        hashed *= mix
+        hashed ^= hashed >> np.uint64(32)
+        return hashed & self._mask
+
+    def _encrypt(self, values):
+        left, right = values >> self._half, values & self._mask
+        for key in self._keys:
+            left, right = right, left ^ self._round(right, key)
+        return (left << self._half) | right
+
+    def __call__(self, indices):
+        """Map indices to their position in the permutation.
+
+        Parameters
+        ----------
+        indices : array_like of int, shape=(m,)
+            Indices in range(n).
+
+        Returns
+        -------
+        permuted : np.ndarray of int64, shape=(m,)
+            The permuted indices, also in range(n).
+        """
+        values = np.atleast_1d(np.asarray(indices, dtype=np.uint64))
+        if values.size and values.max() >= self.n:
+            raise ValueError("Indices must be less than {}.".format(self.n))
+        values = self._encrypt(values)
+        outside = np.flatnonzero(values >= self.n)
+        while len(outside):
+            values[outside] = self._encrypt(values[outside])
+            outside = outside[values[outside] >= self.n]
+        return values.astype(np.int64)
+
+
+class SliceSpace(object):
+    """The (item, offset) pairs of every valid slice in a collection.
+
+    Pairs are numbered item by item, and within an item in C order of their
+    offsets; that is, in the order their data is laid out in storage, for
+    C-ordered arrays stored back to back.
+    """
+
+    def __init__(self, shapes, slice_shape, stride=None):
+        """Describe the space of slices.
+
+        Parameters
+        ----------
+        shapes : array_like, shape=(n_items, n_dims)
+            Shape of each item.
+
+        slice_shape : tuple, len=n_dims
+            Shape of the slices.
+
+        stride : int or tuple, default=None
+            Step between neighbouring offsets, along each dimension; 1 if
+            None, i.e. every offset.
+        """
+        self.shapes = np.asarray(shapes, dtype=np.int64).reshape(
+            -1, len(slice_shape))
+        self.slice_shape = np.asarray(slice_shape, dtype=np.int64)
+        self.stride = np.broadcast_to(
+            np.asarray(1 if stride is None else stride, dtype=np.int64),
+            self.slice_shape.shape)
+        if (self.stride < 1).any():
+            raise ValueError("Strides must be positive.")
+        spans = self.shapes - self.slice_shape
+        self.grids = np.where(spans >= 0, spans // self.stride + 1, 0)
+        self.counts = np.prod(self.grids, axis=1)
+        self.ends = np.cumsum(self.counts)
+        if not len(self):
+            raise ValueError("No item is large enough for a slice of shape "
+                             "{}.".format(tuple(slice_shape)))
+
+    def __len__(self):
+        return int(self.ends[-1]) if len(self.ends) else 0
+
+    def __repr__(self):
+        return "SliceSpace(n_items={}, n_slices={})".format(
+            len(self.shapes), len(self))
+
+    def locate(self, indices):
+        """Map flat indices to (item, offset) pairs.
+
+        Parameters
+        ----------
+        indices : array_like of int, shape=(n,)
+            Indices in range(len(self)).
+
+        Returns
+        -------
+        items : np.ndarray of int, shape=(n,)
+            Index of the item holding each slice.
+
+        offsets : np.ndarray of int, shape=(n, n_dims)
+            Offset of each slice within its item.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        items = np.searchsorted(self.ends, indices, side='right')
+        local = indices - (self.ends[items] - self.counts[items])
+        grids = self.grids[items]
+        offsets = np.empty((len(indices), grids.shape[1]), dtype=np.int64)
+        for dim in reversed(range(grids.shape[1])):
+            local, offsets[:, dim] = np.divmod(local, grids[:, dim])
+        return items, offsets * self.stride
+
+
+def epoch_plan(shapes, slice_shape, stride=None, n_epochs=1, block_size=256,
+               sort_blocks=True, seed=None):
+    """Plan epochs over every (item, offset) pair, in blocks.
+
+    Parameters
+    ----------
+    shapes : array_like, shape=(n_items, n_dims)
+        Shape of each item.
+
+    slice_shape : tuple, len=n_dims
+        Shape of the slices.
+
+    stride : int or tuple, default=None
+        Step between neighbouring offsets; see `SliceSpace`.
+
+    n_epochs : int, default=1
+        Number of epochs to plan, each in a fresh order; infinite if None.
+
+    block_size : int, default=256
+        Number of pairs per block.
+
+    sort_blocks : bool, default=True
+        Serve each block in storage order, rather than shuffled; blocks
+        still come in a random order, and hold a random subset of pairs.
+
+    seed : int, default=None
+        Seed for the order of the epochs.
+
+    Yields
+    ------
+    items : np.ndarray of int, shape=(block_size,)
+        Item of each pair in the block (the last may be shorter).
+
+    offsets : np.ndarray of int, shape=(block_size, n_dims)
+        Offset of each pair in the block.
+    """
+    space = SliceSpace(shapes, slice_shape, stride)
+    rng = np.random.RandomState(seed)
+    epoch = 0
+    while n_epochs is None or epoch < n_epochs:
+        permutation = FeistelPermutation(len(space),
+                                         seed=rng.randint(2 ** 31))
+        for start in range(0, len(space), block_size):
+            indices = permutation(np.arange(
+                start, min(start + block_size, len(space))))
+            if sort_blocks:
+                indices.sort()
+            yield space.locate(indices)
+        epoch += 1
+
+
+def epoch_random_slice(collec, shape, stride=None, opener=None,
+                       manifest=None, pool=None, n_epochs=1, block_size=256,
+                       sort_blocks=True, seed=None):
+    """Sample every slice of a collection once per epoch, in random order.
+
+    Parameters
+    ----------
+    collec : iterable
+        An iterable collection of items.
+
+    shape : tuple
+        Shape of the slices to extract.
+
+    stride : int or tuple, default=None
+        Step between neighbouring offsets; every offset if None.
+
+    opener, manifest, pool : see `minibench.mux.vmux_random_slice`
+
+    n_epochs : int, default=1
+        Number of epochs to sample; infinite if None.
+
+    block_size : int, default=256
+        Number of slices to plan (and sort; see `epoch_plan`) at a time.
+
+    sort_blocks : bool, default=True
+        Read each block of slices in storage order.
+
+    seed : int, default=None
+        Seed for the order of the epochs.
+
+    Yields
+    ------
+    obs : dict
+        Observation with the slice under 'X'.
+    """
+    collec = list(collec)
+    with mux.collection_pool(opener, manifest, pool) as pool:
+        shapes = mux.collection_shapes(collec, manifest, pool)
+        plan = epoch_plan(shapes, shape, stride=stride, n_epochs=n_epochs,
+                          block_size=block_size, sort_blocks=sort_blocks,
+                          seed=seed)
+        for obs in mux.serve_plan(plan, collec, shape, pool):
+            yield obs
@@ -0,0 +1,243 @@
+"""Per-stage timers and counters for the sampling hot path.
+
+The samplers in `minibench.samplers` mark their stages (opening files,
+parsing headers, decoding, slicing) and count what they do (opens, bytes
+served, streamer activations); `mux_random_slice` marks its own
+bookkeeping. Bytes served are the size of the observations sampled: for
+memmaps, that's not necessarily what was read from disk. While an
+`Instrument` is active, it accumulates all of them. Stage times are
+exclusive: time spent in a stage nested in another (e.g. a streamer's
+'slice' within the mux's 'mux') only counts toward the innermost one.
+
+While no instrument is active, the hooks cost nothing per sample: samplers
+check for one when they start, and run their plain loops if there's none;
+`timed` and `timed_function` hand back what they're given, untouched; and
+the other hooks only run once per opened file or activated streamer.
+Samplers report to the instrument that was active when they started.
+
+Examples
+--------
+Break a benchmark's time down by stage, in its extra_info.
+
+    > with Instrument() as probe:
+    >     benchmark(next, sampler)
+    > probe.attach(benchmark)
+
+Or, from the benchmark suites, pass --instrument to do so for every
+benchmark.
+"""
+import collections
+import contextlib
+import functools
+import threading
+import time
+
+try:
+    timer = time.perf_counter
+except AttributeError:
+    timer = time.time
+
+# The active instrument, if any.
+_ACTIVE = None
+
+
+class Instrument(object):
+    """Accumulator of exclusive stage times, stage calls and counters.
+
+    Instruments may be shared across threads; each thread nests its stages
+    on its own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._previous = []
+        self._paused = 0
+        self.reset()
+
+    def __repr__(self):
+        return "Instrument(stages={}, counts={})".format(
+            sorted(self.seconds), dict(self.counts))
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """Make this the active instrument, until `stop`."""
+        global _ACTIVE
+        self._previous.append(_ACTIVE)
+        _ACTIVE = self
+
+    def stop(self):
+        """Restore the instrument that was active before `start`."""
+        global _ACTIVE
+        _ACTIVE = self._previous.pop()
+
+    def reset(self):
+        """Clear every timer and counter."""
+        with self._lock:
+            self.seconds = collections.defaultdict(float)
+            self.calls = collections.defaultdict(int)
+            self.counts = collections.defaultdict(int)
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _enter(self):
+        # Each open stage accumulates the time of the stages nested in it.
+        self._stack().append(0.0)
+        return timer()
+
+    def _exit(self, name, start, record=True):
+        elapsed = timer() - start
+        stack = self._stack()
+        nested = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        if record and not self._paused:
+            with self._lock:
+                self.seconds[name] += elapsed - nested
+                self.calls[name] += 1
+
+    @contextlib.contextmanager
+    def paused(self):
+        """Context manager within which nothing is recorded, e.g. for
+        untimed draws (see `minibench.memory`)."""
+        with self._lock:
+            self._paused += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._paused -= 1
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Context manager timing a stage."""
+        start = self._enter()
+        try:
+            yield
+        finally:
+            self._exit(name, start)
+
+    def timed(self, iterable, name, count=None):
+        """Iterate over `iterable`, timing every step as a stage.
+
+        Parameters
+        ----------
+        iterable : iterable
+            Iterable to time, e.g. a generator doing the stage's work.
+
+        name : str
+            Name of the stage.
+
+        count : str, default=None
+            Name of a counter to add each item's `nbytes` to.
+
+        Yields
+        ------
+        item : obj
+            The items of `iterable`.
+        """
+        iterator = iter(iterable)
+        while True:
+            start = self._enter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self._exit(name, start, record=False)
+                return
+            except BaseException:
+                self._exit(name, start)
+                raise
+            self._exit(name, start)
+            if count is not None:
+                self.count(count, item.nbytes)
+            yield item
+
+    def timed_call(self, name, func, *args, **kwargs):
+        """Call `func` with the given arguments, timing it as a stage."""
+        with self.stage(name):
+            return func(*args, **kwargs)
+
+    def count(self, name, value=1):
+        """Add `value` to a counter."""
+        with self._lock:
+            if not self._paused:
+                self.counts[name] += value
+
+    def to_dict(self):
+        """Return the timers and counters as a flat dict.
+
+        Returns
+        -------
+        record : dict
+            '{stage}_s', the seconds spent in each stage; '{stage}_calls',
+            the number of times each stage ran; and each counter, by name.
+        """
+        with self._lock:
+            record = dict(self.counts)
+            for name, seconds in self.seconds.items():
+                record['{}_s'.format(name)] = seconds
+                record['{}_calls'.format(name)] = self.calls[name]
+        return record
+
+    def attach(self, benchmark):
+        """Record the timers and counters in a pytest-benchmark fixture's
+        extra_info (and so its saved JSON; see `minibench.parse`)."""
+        benchmark.extra_info.update(self.to_dict())
+        return benchmark.extra_info
+
+
+def active():
+    """Return the active Instrument, or None."""
+    return _ACTIVE
+
+
+class _NullStage(object):
+    """Stage that does nothing, for when no instrument is active."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name):
+    """Context manager timing a stage on the active instrument, if any."""
+    if _ACTIVE is None:
+        return _NULL_STAGE
+    return _ACTIVE.stage(name)
+
+
+def timed(iterable, name, count=None):
+    """Time every step of `iterable` on the active instrument, if any (see
+    `Instrument.timed`); otherwise, return `iterable` itself."""
+    if _ACTIVE is None:
+        return iterable
+    return _ACTIVE.timed(iterable, name, count=count)
+
+
+def timed_function(name, func):
+    """Return `func`, timed as a stage on the active instrument if any;
+    otherwise, return `func` itself."""
+    if _ACTIVE is None:
+        return func
+    return functools.partial(_ACTIVE.timed_call, name, func)
+
+
+def count(name, value=1):
+    """Add `value` to a counter of the active instrument, if any."""
+    if _ACTIVE is not None:
+        _ACTIVE.count(name, value)
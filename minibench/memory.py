@@ -0,0 +1,272 @@
+"""Peak memory and allocations of benchmarked code.
+
+Tracing allocations slows every one of them down, so memory is measured on
+its own, untimed: once a benchmark's timed a function, `track_draws` calls
+it a number of times more under a `MemoryTracker`, recording in the
+benchmark's extra_info (and so in its saved JSON, see `minibench.parse`):
+
+- peak_rss_MB: peak resident set size of the process, in MB (1e6 bytes),
+  while drawing. The peak is reset first where the OS allows it (Linux 4.0+);
+  elsewhere, it's the peak since the process started.
+- tracemalloc_peak_MB: peak size of the memory allocated while drawing,
+  including numpy's array data.
+- retained_blocks_per_draw: net number of memory blocks allocated while
+  drawing and still live after (e.g. arrays held by streamers, or caches),
+  per draw. This is not a count of allocations: blocks allocated and freed
+  within a draw only show up in the peak.
+
+Examples
+--------
+Record the memory of a sampler's draws along with its timing.
+
+    > benchmark(next, sampler)
+    > track_draws(benchmark, next, 100, sampler)
+    > benchmark.extra_info['peak_rss_MB']
+
+Tracking is slow, so the benchmark suites only do it when run with
+--memory: every call to the benchmark fixture is then patched with
+`tracking_memory`, and `minibench.bench.benchmark_throughput` replays one
+round of draws under a tracker (see `track_call`).
+
+Or, track a block of code by hand.
+
+    > with MemoryTracker() as tracker:
+    >     arrays = [np.load(fpath) for fpath in npy_files]
+    > tracker.to_dict(n_draws=len(npy_files))
+"""
+import contextlib
+import functools
+import resource
+import sys
+import time
+
+from . import instrument
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+STATUS_PATH = '/proc/self/status'
+CLEAR_REFS_PATH = '/proc/self/clear_refs'
+
+
+def peak_rss():
+    """Return the peak resident set size of this process, in bytes."""
+    try:
+        with open(STATUS_PATH) as fhandle:
+            for line in fhandle:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def reset_peak_rss():
+    """Reset the peak resident set size to the current one, if supported.
+
+    Returns
+    -------
+    reset : bool
+        Whether the peak was reset.
+    """
+    try:
+        with open(CLEAR_REFS_PATH, 'w') as fhandle:
+            fhandle.write('5')
+        return True
+    except (IOError, OSError):
+        return False
+
+
+class MemoryTracker(object):
+    """Track the peak RSS, and allocations, between `start` and `stop`.
+
+    Allocations are traced with tracemalloc, which is started and stopped
+    along with the tracker, unless it was already tracing (py3.4+; without
+    it, only the peak RSS is tracked).
+    """
+
+    def __init__(self):
+        self.peak_rss = None
+        self.traced_peak = None
+        self.blocks = None
+        self._started_tracing = False
+        self._traced_start = 0
+        self._blocks_start = 0
+
+    def __repr__(self):
+        return "MemoryTracker(peak_rss={}, traced_peak={}, blocks={})".format(
+            self.peak_rss, self.traced_peak, self.blocks)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """Reset the peaks, and start tracing allocations."""
+        reset_peak_rss()
+        if tracemalloc is None:
+            return
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+        elif hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        self._traced_start, _ = tracemalloc.get_traced_memory()
+        self._blocks_start = len(tracemalloc.take_snapshot().traces)
+
+    def stop(self):
+        """Record the peaks and blocks since `start`, and stop tracing."""
+        self.peak_rss = peak_rss()
+        if tracemalloc is None:
+            return
+        _, peak = tracemalloc.get_traced_memory()
+        self.traced_peak = max(peak - self._traced_start, 0)
+        self.blocks = len(tracemalloc.take_snapshot().traces) - \
+            self._blocks_start
+        if self._started_tracing:
+            tracemalloc.stop()
+
+    def to_dict(self, n_draws=None):
+        """Return what was tracked, as a dict (see the module docstring).
+
+        Parameters
+        ----------
+        n_draws : int, default=None
+            Number of draws made while tracking; if None, blocks are
+            reported in total, as 'retained_blocks'.
+
+        Returns
+        -------
+        record : dict
+            Memory use, in MB and blocks.
+        """
+        record = dict(peak_rss_MB=self.peak_rss / 1e6)
+        if self.traced_peak is not None:
+            record['tracemalloc_peak_MB'] = self.traced_peak / 1e6
+            if n_draws:
+                record['retained_blocks_per_draw'] = \
+                    float(self.blocks) / n_draws
+            else:
+                record['retained_blocks'] = self.blocks
+        return record
+
+    def attach(self, benchmark, n_draws=None):
+        """Record what was tracked in a pytest-benchmark fixture's
+        extra_info."""
+        benchmark.extra_info.update(self.to_dict(n_draws=n_draws))
+        return benchmark.extra_info
+
+
+@contextlib.contextmanager
+def _no_pause():
+    yield
+
+
+def track_call(benchmark, func, *args, **kwargs):
+    """Call `func` once, untimed, tracking memory, and record it in a
+    benchmark's extra_info, per draw.
+
+    The active instrument, if any, is paused meanwhile, so the call doesn't
+    add to its stages.
+
+    Parameters
+    ----------
+    benchmark : pytest_benchmark.fixture.BenchmarkFixture
+        The benchmark fixture.
+
+    func : callable
+        Function to call; returns the number of draws it made.
+
+    args, kwargs
+        Arguments to call `func` with.
+
+    Returns
+    -------
+    extra_info : dict
+        The benchmark's extra_info.
+    """
+    probe = instrument.active()
+    paused = probe.paused() if probe else _no_pause()
+    with paused, MemoryTracker() as tracker:
+        n_draws = func(*args, **kwargs)
+    return tracker.attach(benchmark, n_draws=n_draws)
+
+
+def track_draws(benchmark, func, n_draws, *args, **kwargs):
+    """Call `func` a number of times, untimed, tracking memory, and record
+    it in a benchmark's extra_info.
+
+    Parameters
+    ----------
+    benchmark : pytest_benchmark.fixture.BenchmarkFixture
+        The benchmark fixture.
+
+    func : callable
+        Function to call, e.g. `next`, to draw from a sampler.
+
+    n_draws : int, > 0
+        Number of calls; fewer if `func` raises StopIteration (e.g. a
+        finite sampler ran out), or once `max_time` is up.
+
+    args, kwargs
+        Arguments to call `func` with; `max_time` (float, default=None),
+        if given, is the number of seconds after which to stop calling,
+        checked between calls.
+
+    Returns
+    -------
+    extra_info : dict
+        The benchmark's extra_info.
+    """
+    max_time = kwargs.pop('max_time', None)
+
+    def draws():
+        start = time.time()
+        for count in range(n_draws):
+            if max_time is not None and count and \
+                    time.time() - start > max_time:
+                return count
+            try:
+                func(*args, **kwargs)
+            except StopIteration:
+                return count
+        return n_draws
+
+    return track_call(benchmark, draws)
+
+
+def tracking_memory(call, n_draws=100, max_time=1.0):
+    """Wrap pytest-benchmark's `BenchmarkFixture.__call__`, so that every
+    function it times is then tracked by `track_draws`.
+
+    Parameters
+    ----------
+    call : callable
+        The original `BenchmarkFixture.__call__`.
+
+    n_draws : int, default=100
+        Maximum number of untimed calls to track memory over.
+
+    max_time : float, default=1.0
+        Seconds after which to stop tracking, however many calls were made
+        (at least one); None for no limit.
+
+    Returns
+    -------
+    wrapper : callable
+        Replacement `__call__`; returns what the timed call returned.
+    """
+    @functools.wraps(call)
+    def wrapper(benchmark, func, *args, **kwargs):
+        result = call(benchmark, func, *args, **kwargs)
+        track_draws(benchmark, func, n_draws, *args,
+                    max_time=max_time, **kwargs)
+        return result
+    return wrapper
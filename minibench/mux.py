@@ -0,0 +1,618 @@
+"""A vectorized replacement for `pescador.mux`, specialized to random slices.
+
+Rather than activating one generator per item and drawing one sample at a
+time, `MuxEngine` simulates the mux's active set directly, and plans whole
+blocks of (item, offset) pairs with a handful of numpy calls. The plans are
+then served by `vmux_random_slice`, which only touches the data.
+
+Examples
+--------
+Sample 16x16 slices from a collection of NPY files, memmapped straight from
+a manifest.
+
+    > manifest = minibench.data.npy_manifest(npy_files)
+    > sampler = vmux_random_slice(npy_files, (16, 16), manifest=manifest,
+    >                             working_size=10, lam=25, seed=1)
+    > obs = next(sampler)
+"""
+import contextlib
+import functools
+import numpy as np
+
+from . import cache as cache_
+from . import samplers
+
+
+class AliasTable(object):
+    """Draw indices in proportion to fixed weights, in O(1) per draw.
+
+    This is Walker's alias method: each index owns a column of unit mass,
+    split between itself (with probability `prob`) and one other index (its
+    `alias`). Draws pick a column uniformly, then one of its two indices.
+    """
+
+    def __init__(self, weights):
+        """Build the table, in O(n log n).
+
+        Parameters
+        ----------
+        weights : array_like, shape=(n,)
+            Nonnegative weights, not all zero.
+        """
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.ndim != 1 or not len(weights) or (weights < 0).any() or \
+                not weights.sum() > 0:
+            raise ValueError("Weights must be a nonempty, nonnegative vector "
+                             "with a positive sum.")
+        scaled = weights * (len(weights) / weights.sum())
+        self.prob = np.ones(len(weights))
+        self.alias = np.arange(len(weights))
+
+        # Line the larges' excess mass up end to end, and the smalls'
+        # deficits likewise. Each small borrows from the large whose excess
+        # covers the start of its deficit; whatever that overdraws from a
+        # large, the large borrows in turn from the next one.
+        smalls = np.flatnonzero(scaled < 1)
+        larges = np.flatnonzero(scaled >= 1)
+        if not len(smalls) or not len(larges):
+            return
+        deficits = np.cumsum(1 - scaled[smalls])
+        starts = np.concatenate([[0], deficits[:-1]])
+        excess = np.cumsum(scaled[larges] - 1)
+
+        owner = np.searchsorted(excess, starts, side='right')
+        self.prob[smalls] = scaled[smalls]
+        self.alias[smalls] = larges[np.minimum(owner, len(larges) - 1)]
+
+        n_owned = np.searchsorted(starts, excess, side='left')
+        ends = np.where(n_owned > 0, deficits[np.maximum(n_owned - 1, 0)], 0)
+        overdraft = np.clip(ends - excess, 0, 1)
+        self.prob[larges[:-1]] = 1 - overdraft[:-1]
+        self.alias[larges[:-1]] = larges[1:]
+
+    def __len__(self):
+        return len(self.prob)
+
+    def __repr__(self):
+        return "AliasTable(n={})".format(len(self))
+
+    def draw(self, rng, size=None):
+        """Draw indices in proportion to the table's weights.
+
+        Parameters
+        ----------
+        rng : np.random.RandomState
+            Random number generator to draw from.
+
+        size : int, default=None
+            Number of indices to draw; a single int if None.
+
+        Returns
+        -------
+        idx : int or np.ndarray
+            The drawn index, or indices.
+        """
+        columns = rng.randint(len(self.prob), size=size)
+        keep = rng.random_sample(size) < self.prob[columns]
+        return np.where(keep, columns, self.alias[columns])
+
+
+class MuxEngine(object):
+    """Plan (item, offset) pairs the way `pescador.mux` would sample them.
+
+    The engine keeps `working_size` items active. Each one is activated for
+    1 + Poisson(`lam`) samples (or forever, if `lam` is None), and every
+    sample goes to an active item chosen in proportion to its pool weight.
+    Items are activated at random from those eligible, uniformly or in
+    proportion to `item_weights` (in O(1), with an `AliasTable`); without
+    replacement, an item is only eligible once (or, with `revive`, whenever
+    it isn't active). Items too small to hold a slice are never activated.
+
+    Note that, as in pescador, pool weights only decide how active items are
+    interleaved: with replacement, every activation yields the same number
+    of samples on average, whatever its weight. To sample items in
+    proportion to their data, weight their activation instead, e.g. with
+    `minibench.samplers.count_slice_positions`, under which every valid
+    (item, offset) pair is equally likely.
+
+    With replacement, activations are independent of each other, so each
+    slot runs as its own clock: its samples come at exponential intervals,
+    scaled by the active item's weight. Merging the slots by time picks
+    each sample's slot with exactly the mux's probabilities, and lets whole
+    runs of activations be drawn at once. Without replacement, activations
+    depend on each other, so the engine steps from one expiry to the next,
+    drawing the choices in between in bulk.
+
+    The engine draws from its own RandomState, so plans are reproducible
+    given a seed and the sequence of block sizes requested.
+    """
+
+    def __init__(self, shapes, slice_shape, working_size=10, lam=25,
+                 pool_weights=None, with_replacement=True, revive=False,
+                 item_weights=None, seed=None):
+        """Set up the engine, and activate the first `working_size` items.
+
+        Parameters
+        ----------
+        shapes : array_like, shape=(n_items, ndim)
+            Shape of each item.
+
+        slice_shape : tuple, len=ndim
+            Shape of the slices to plan.
+
+        working_size : int, default=10, > 0
+            Number of items to keep active at any point in time.
+
+        lam : scalar, default=25
+            Rate of the Poisson distribution of activation lifetimes; if
+            None, items stay active forever.
+
+        pool_weights : array_like, default=None
+            Relative weight of each item among the active ones; uniform if
+            None. Items with zero weight are never activated.
+
+        with_replacement : bool, default=True
+            Allow items to be activated more than once, even concurrently.
+
+        revive : bool, default=False
+            Without replacement, make items eligible again once they expire.
+
+        item_weights : array_like, default=None
+            Relative probability of activating each item; uniform if None.
+            Items with zero weight are never activated.
+
+        seed : int, default=None
+            Seed for the engine's random number generator.
+        """
+        slice_shape = tuple(slice_shape)
+        shapes = np.asarray(shapes, dtype=np.int64).reshape(
+            -1, len(slice_shape))
+        self.slice_shape = slice_shape
+        self.n_items = len(shapes)
+        self.max_offsets = shapes - np.asarray(slice_shape, dtype=np.int64) \
+            + 1
+        if pool_weights is None:
+            pool_weights = np.ones(self.n_items)
+        self.pool_weights = np.asarray(pool_weights, dtype=np.float64)
+        if self.pool_weights.shape != (self.n_items,):
+            raise ValueError("pool_weights must have one weight per item.")
+        self.item_weights = None
+        if item_weights is not None:
+            self.item_weights = np.asarray(item_weights, dtype=np.float64)
+            if self.item_weights.shape != (self.n_items,):
+                raise ValueError("item_weights must have one weight per "
+                                 "item.")
+        eligible = (self.max_offsets > 0).all(axis=1) & \
+            (self.pool_weights > 0)
+        if self.item_weights is not None:
+            eligible &= self.item_weights > 0
+        if not eligible.any():
+            raise ValueError("No item can hold a slice of shape {} with "
+                             "nonzero weight.".format(slice_shape))
+
+        self.working_size = working_size
+        self.lam = lam
+        self.with_replacement = with_replacement
+        self.revive = revive
+        self.rng = np.random.RandomState(seed)
+
+        # Eligible items live in pool[:n_eligible]; `where` tracks each
+        # item's position, so it can be removed or revived in O(1).
+        self._pool = np.concatenate([np.flatnonzero(eligible),
+                                     np.flatnonzero(~eligible)])
+        self._where = np.empty(self.n_items, dtype=np.int64)
+        self._where[self._pool] = np.arange(self.n_items)
+        self._n_eligible = int(eligible.sum())
+        self._table = None
+        if self.item_weights is not None:
+            self._build_table()
+
+        self.slot_items = -np.ones(working_size, dtype=np.int64)
+        self.slot_weights = np.zeros(working_size)
+        self.slot_remaining = np.zeros(working_size)
+        if with_replacement:
+            # Per slot: time of its last planned sample, and the planned
+            # samples (times and items) not yet merged into `_ready`.
+            self._clocks = np.zeros(working_size)
+            self._pending = [(np.zeros(0), np.zeros(0, dtype=np.int64))
+                             for _ in range(working_size)]
+            self._ready = np.zeros(0, dtype=np.int64)
+            if lam is None:
+                self.slot_items[:] = self._draw_items(working_size)
+        else:
+            for slot in range(working_size):
+                self._activate(slot)
+
+    def __repr__(self):
+        return "MuxEngine(n_items={}, working_size={}, lam={})".format(
+            self.n_items, self.working_size, self.lam)
+
+    def _swap(self, pos, other):
+        item, other_item = self._pool[pos], self._pool[other]
+        self._pool[pos], self._pool[other] = other_item, item
+        self._where[item], self._where[other_item] = other, pos
+
+    def _build_table(self):
+        """(Re)build the alias table over the currently eligible items."""
+        self._table_items = self._pool[:self._n_eligible].copy()
+        weights = self.item_weights[self._table_items]
+        self._table = AliasTable(weights)
+        self._table_mass = self._eligible_mass = weights.sum()
+        self._in_table = np.zeros(self.n_items, dtype=bool)
+        self._in_table[self._table_items] = True
+
+    def _draw_items(self, size):
+        """Draw `size` eligible items, with replacement."""
+        if self._table is None:
+            return self._pool[self.rng.randint(self._n_eligible, size=size)]
+        return self._table_items[self._table.draw(self.rng, size)]
+
+    def _draw_eligible(self):
+        """Draw one eligible item, when items are being used up."""
+        if self._table is None:
+            return self._pool[self.rng.randint(self._n_eligible)]
+        # Draw from the table, skipping items that are no longer eligible;
+        # rebuilding once half its mass is gone keeps this O(1) amortized.
+        if self._eligible_mass < 0.5 * self._table_mass:
+            self._build_table()
+        while True:
+            item = self._table_items[self._table.draw(self.rng)]
+            if self._where[item] < self._n_eligible:
+                return item
+
+    def _activate(self, slot):
+        """Replace the item in `slot` with a newly drawn one, if any."""
+        expired = self.slot_items[slot]
+        if expired >= 0 and self.revive and not self.with_replacement:
+            self._swap(self._where[expired], self._n_eligible)
+            self._n_eligible += 1
+            if self._table is not None:
+                self._eligible_mass += self.item_weights[expired]
+                if not self._in_table[expired]:
+                    self._build_table()
+
+        if not self._n_eligible:
+            self.slot_items[slot] = -1
+            self.slot_weights[slot] = 0.0
+            self.slot_remaining[slot] = np.inf
+            return
+
+        if self.with_replacement:
+            item = self._draw_items(None)
+        else:
+            item = self._draw_eligible()
+            self._n_eligible -= 1
+            self._swap(self._where[item], self._n_eligible)
+            if self._table is not None:
+                self._eligible_mass -= self.item_weights[item]
+        self.slot_items[slot] = item
+        self.slot_weights[slot] = self.pool_weights[item]
+        self.slot_remaining[slot] = np.inf if self.lam is None else \
+            1 + self.rng.poisson(self.lam)
+
+    def _plan_slot(self, slot, num):
+        """Plan at least `num` more samples for `slot`'s clock."""
+        if self.lam is None:
+            items = np.repeat(self.slot_items[slot], num)
+        else:
+            n_acts = int(np.ceil(num / (1.0 + self.lam)))
+            acts = self._draw_items(n_acts)
+            items = np.repeat(acts, 1 + self.rng.poisson(self.lam, n_acts))
+        times = self._clocks[slot] + np.cumsum(
+            self.rng.standard_exponential(len(items)) /
+            self.pool_weights[items])
+        self._clocks[slot] = times[-1]
+        pending_times, pending_items = self._pending[slot]
+        self._pending[slot] = (np.concatenate([pending_times, times]),
+                               np.concatenate([pending_items, items]))
+
+    def _next_items_clocked(self, n):
+        while len(self._ready) < n:
+            num = (n - len(self._ready)) // self.working_size + 1
+            for slot in range(self.working_size):
+                if len(self._pending[slot][1]) < num:
+                    self._plan_slot(slot, num)
+
+            # Everything up to the earliest clock is settled.
+            horizon = self._clocks.min()
+            times, items = [], []
+            for slot, (slot_times, slot_items) in enumerate(self._pending):
+                cut = np.searchsorted(slot_times, horizon, side='right')
+                times.append(slot_times[:cut])
+                items.append(slot_items[:cut])
+                self._pending[slot] = (slot_times[cut:], slot_items[cut:])
+            times, items = np.concatenate(times), np.concatenate(items)
+            self._ready = np.concatenate(
+                [self._ready, items[np.argsort(times, kind='mergesort')]])
+
+        items, self._ready = self._ready[:n], self._ready[n:]
+        return items
+
+    def next_items(self, n):
+        """Plan the items of the next `n` samples.
+
+        Parameters
+        ----------
+        n : int
+            Number of samples to plan.
+
+        Returns
+        -------
+        items : np.ndarray, shape=(N,)
+            Index of the item for each sample; N < n only once every
+            eligible item has been used up (i.e. without replacement).
+        """
+        if self.with_replacement:
+            return self._next_items_clocked(n)
+
+        blocks, count = [], 0
+        while count < n:
+            total = self.slot_weights.sum()
+            if total <= 0:
+                break
+            # Some active item must expire within this many samples; draws
+            # past that point would use stale weights.
+            num = n - count
+            live = self.slot_weights > 0
+            if self.lam is not None:
+                num = min(num, int((self.slot_remaining[live] - 1).sum()) + 1)
+
+            bounds = np.cumsum(self.slot_weights)
+            choices = np.searchsorted(
+                bounds, self.rng.random_sample(num) * total, side='right')
+            np.minimum(choices, self.working_size - 1, out=choices)
+
+            # The time of each slot's expiry within the block, if any.
+            counts = np.bincount(choices, minlength=self.working_size)
+            expiring = np.flatnonzero(counts >= self.slot_remaining)
+            if len(expiring):
+                order = np.argsort(choices, kind='mergesort')
+                starts = np.cumsum(counts) - counts
+                last = starts[expiring] + \
+                    self.slot_remaining[expiring].astype(np.int64) - 1
+                num = int(order[last].min()) + 1
+                choices = choices[:num]
+                counts = np.bincount(choices, minlength=self.working_size)
+
+            blocks.append(self.slot_items[choices])
+            self.slot_remaining -= counts
+            for slot in np.flatnonzero(self.slot_remaining <= 0):
+                self._activate(slot)
+            count += num
+
+        if not blocks:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(blocks)
+
+    def next_block(self, n):
+        """Plan the next `n` samples.
+
+        Parameters
+        ----------
+        n : int
+            Number of samples to plan.
+
+        Returns
+        -------
+        items : np.ndarray, shape=(N,)
+            Index of the item for each sample; see `next_items`.
+
+        offsets : np.ndarray, shape=(N, ndim)
+            Starting index of each sample's slice, uniform over the item's
+            valid positions.
+        """
+        items = self.next_items(n)
+        high = self.max_offsets[items]
+        offsets = np.floor(self.rng.random_sample(high.shape) * high)
+        return items, offsets.astype(np.int64)
+
+    def plan(self, n_samples=None, block_size=256):
+        """Generate blocks of planned samples; see `next_block`.
+
+        Parameters
+        ----------
+        n_samples : int, default=None
+            Total number of samples to plan; until exhaustion if None.
+
+        block_size : int, default=256
+            Number of samples per block.
+
+        Yields
+        ------
+        items, offsets : np.ndarray
+            Items and slice offsets for each sample in the block.
+        """
+        n_samples = np.inf if n_samples is None else n_samples
+        count = 0
+        while count < n_samples:
+            items, offsets = self.next_block(
+                int(min(block_size, n_samples - count)))
+            if not len(items):
+                break
+            count += len(items)
+            yield items, offsets
+
+
+def _weights(weights, shapes, shape):
+    """Resolve named item weights ('size' or 'positions') to an array."""
+    if not isinstance(weights, str):
+        return weights
+    elif weights == 'size':
+        return np.prod(np.asarray(shapes, dtype=np.float64), axis=1)
+    elif weights == 'positions':
+        return samplers.count_slice_positions(shapes, shape)
+    raise ValueError("Unknown weights '{}'.".format(weights))
+
+
+def vmux_random_slice(collec, shape, opener=None, manifest=None, pool=None,
+                      pool_weights=None, item_weights=None, n_samples=None,
+                      block_size=256, seed=None, **kwargs):
+    """Sample random slices from a collection, planned by a `MuxEngine`.
+
+    A drop-in alternative to `mux_random_slice`, for items that can be
+    opened as arrays (or array-likes, such as h5py datasets).
+
+    Parameters
+    ----------
+    collec : iterable
+        An iterable collection of items.
+
+    shape : tuple
+        Shape of the random slice to extract.
+
+    opener : callable, default=None
+        Function mapping an item to an open array; defaults to memmapping
+        from `manifest` if given, else to np.load with mmap_mode='r'.
+
+    manifest : minibench.readers.Manifest, default=None
+        Manifest of the collection, to get item shapes from without opening
+        them. Without one, every item is opened once up front.
+
+    pool : minibench.cache.HandlePool, default=None
+        Pool of open handles to draw from, in which case `opener` is up to
+        the pool; if None, a private pool is used.
+
+    pool_weights, item_weights : array_like or str, default=None
+        See `MuxEngine`; 'size' weights each item by its number of elements,
+        and 'positions' by its number of valid slice offsets (which samples
+        every (item, offset) pair with equal probability). Named pool
+        weights only shape item shares without replacement, so they're
+        refused with it; use item_weights instead.
+
+    n_samples : int, default=None
+        Number of observations to produce; until exhaustion if None.
+
+    block_size : int, default=256
+        Number of samples to plan at a time.
+
+    seed : int, default=None
+        Seed for the engine's random number generator.
+
+    kwargs : dict
+        Arguments to forward on to `MuxEngine`, i.e. working_size, lam,
+        with_replacement and revive.
+
+    Yields
+    ------
+    obs : dict
+        Observation with the slice under 'X'.
+    """
+    if isinstance(pool_weights, str) and \
+            kwargs.get('with_replacement', True):
+        raise ValueError("pool_weights='{0}' has no effect on item shares "
+                         "with replacement; use item_weights='{0}'."
+                         "".format(pool_weights))
+    collec = list(collec)
+    with collection_pool(opener, manifest, pool) as pool:
+        shapes = collection_shapes(collec, manifest, pool)
+        engine = MuxEngine(
+            shapes, shape, pool_weights=_weights(pool_weights, shapes, shape),
+            item_weights=_weights(item_weights, shapes, shape), seed=seed,
+            **kwargs)
+        for obs in serve_plan(engine.plan(n_samples, block_size), collec,
+                              shape, pool):
+            yield obs
+
+
+@contextlib.contextmanager
+def collection_pool(opener=None, manifest=None, pool=None):
+    """Context manager providing a pool of handles to a collection's items.
+
+    Parameters
+    ----------
+    opener : callable, default=None
+        Function mapping an item to an open array; defaults to memmapping
+        from `manifest` if given, else to np.load with mmap_mode='r'.
+
+    manifest : minibench.readers.Manifest, default=None
+        Manifest of the collection.
+
+    pool : minibench.cache.HandlePool, default=None
+        Pool to provide as is; if None, a private pool is created, and closed
+        on exit.
+
+    Yields
+    ------
+    pool : minibench.cache.HandlePool
+        The pool of handles.
+    """
+    if pool is not None:
+        yield pool
+        return
+    if opener is None and manifest is not None:
+        opener = functools.partial(manifest.memmap, mode='r')
+    elif opener is None:
+        opener = functools.partial(np.load, mmap_mode='r')
+    pool = cache_.HandlePool(opener)
+    try:
+        yield pool
+    finally:
+        pool.close()
+
+
+def collection_shapes(collec, manifest=None, pool=None):
+    """Return the shape of each item in a collection.
+
+    Parameters
+    ----------
+    collec : list
+        Items of the collection.
+
+    manifest : minibench.readers.Manifest, default=None
+        Manifest to read the shapes from; if None, every item is opened
+        from `pool` instead.
+
+    pool : minibench.cache.HandlePool, default=None
+        Pool of handles to the items.
+
+    Returns
+    -------
+    shapes : list of tuple
+        Shape of each item.
+    """
+    if manifest is not None:
+        return [manifest.shape(item) for item in collec]
+    shapes = []
+    for item in collec:
+        with pool.open(item) as handle:
+            shapes.append(np.shape(handle))
+    return shapes
+
+
+def serve_plan(plan, collec, shape, pool):
+    """Slice the blocks of (item, offset) pairs in a plan out of the data.
+
+    Each item in a block is acquired from the pool once, however many
+    slices are taken from it.
+
+    Parameters
+    ----------
+    plan : iterable
+        Blocks of (items, offsets) arrays, as from `MuxEngine.plan`.
+
+    collec : list
+        Items of the collection, indexed by the plan's items.
+
+    shape : tuple
+        Shape of the slices.
+
+    pool : minibench.cache.HandlePool
+        Pool of handles to the items.
+
+    Yields
+    ------
+    obs : dict
+        Observation with the slice under 'X'.
+    """
+    for items, offsets in plan:
+        handles = dict()
+        try:
+            for item in np.unique(items).tolist():
+                handles[item] = pool.acquire(collec[item])
+            for item, offset in zip(items.tolist(), offsets.tolist()):
+                slc = tuple([slice(start, start + dim)
+                             for start, dim in zip(offset, shape)])
+                yield {'X': handles[item][slc]}
+        finally:
+            for item in handles:
+                pool.release(collec[item])
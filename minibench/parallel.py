@@ -0,0 +1,573 @@
+"""Samplers that produce observations in other processes or threads.
+
+Examples
+--------
+Run four `mux_random_slice` workers over a collection of NPY files, each
+over a quarter of it, and consume their observations from shared memory.
+
+    > sampler = process_random_slice(
+    >     sampler=minibench.samplers.one_npy_random_slice,
+    >     collec=npy_files, shape=(16, 16), n_workers=4, mmap_mode='r')
+    > obs = next(sampler)
+    > sampler.close()  # Shuts down the workers.
+
+Or run a single `mux_random_slice` in another process, in place of
+`zmq_random_slice`, receiving aligned arrays over shared memory.
+
+    > sampler = shm_random_slice(
+    >     sampler=minibench.samplers.one_npy_random_slice,
+    >     collec=npy_files, shape=(16, 16), mmap_mode='r')
+
+Or, for backends whose reads release the GIL, use threads instead.
+
+    > sampler = threaded_random_slice(
+    >     sampler=minibench.samplers.one_npy_pread_random_slice,
+    >     collec=npy_files, shape=(16, 16), n_threads=4)
+"""
+import multiprocessing
+import numpy as np
+import sys
+import threading
+import traceback
+from queue import Empty, Full, Queue
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+from . import instrument
+from . import samplers
+
+ALIGNMENT = 64
+
+
+class SharedRing(object):
+    """Fixed number of equally sized array slots in one shared memory block.
+
+    Every slot starts on a 64-byte boundary, so slot arrays are C-contiguous
+    and aligned for vectorized consumers.
+    """
+
+    def __init__(self, n_slots, slot_shape, dtype, name=None):
+        """Create a new ring, or attach to an existing one by `name`.
+
+        Parameters
+        ----------
+        n_slots : int, > 0
+            Number of slots.
+
+        slot_shape : tuple
+            Shape of each slot's array.
+
+        dtype : np.dtype
+            Datatype of each slot's array.
+
+        name : str, default=None
+            Name of an existing ring's shared memory block to attach to; if
+            None, a new block is created (and owned) by this object.
+        """
+        if shared_memory is None:
+            raise ImportError("SharedRing requires multiprocessing."
+                              "shared_memory (Python >= 3.8).")
+        self.n_slots = n_slots
+        self.slot_shape = tuple(slot_shape)
+        self.dtype = np.dtype(dtype)
+        nbytes = int(np.prod(self.slot_shape)) * self.dtype.itemsize
+        self.slot_bytes = -(-max(nbytes, 1) // ALIGNMENT) * ALIGNMENT
+        self.owner = name is None
+        if self.owner:
+            self._shm = shared_memory.SharedMemory(
+                create=True, size=self.n_slots * self.slot_bytes)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def spec(self):
+        """Arguments with which to attach to this ring from elsewhere."""
+        return (self.n_slots, self.slot_shape, self.dtype.str, self.name)
+
+    def __repr__(self):
+        return "SharedRing(n_slots={}, slot_shape={}, dtype={}, name='{}')" \
+            "".format(self.n_slots, self.slot_shape, self.dtype, self.name)
+
+    def slot(self, idx):
+        """Return the array backed by slot `idx`."""
+        if not 0 <= idx < self.n_slots:
+            raise IndexError("Slot {} out of range.".format(idx))
+        return np.ndarray(self.slot_shape, dtype=self.dtype,
+                          buffer=self._shm.buf,
+                          offset=idx * self.slot_bytes)
+
+    def close(self):
+        """Detach from the shared memory, and free it if this is the owner.
+
+        Detaching is skipped if slot arrays are still referenced; the mapping
+        then goes away with them.
+        """
+        try:
+            self._shm.close()
+        except BufferError:
+            pass
+        if self.owner:
+            self.owner = False
+            self._shm.unlink()
+
+
+def _next_free_slot(free_slots, stop):
+    """Block until a slot is free, or return None once `stop` is set."""
+    while not stop.is_set():
+        try:
+            return free_slots.get(timeout=0.1)
+        except Empty:
+            pass
+    return None
+
+
+def _ring_worker(worker_id, ring_spec, free_slots, full_slots, stop, seed,
+                 sampler, collec, shape, kwargs):
+    """Run a `mux_random_slice` over `collec`, writing into the ring.
+
+    Messages put on `full_slots` are (worker_id, msg), where msg is a slot
+    index, None once the mux is exhausted, or a traceback string on error.
+    """
+    ring = SharedRing(*ring_spec[:3], name=ring_spec[3])
+    try:
+        # pescador's mux draws from numpy's global RNG, which forked
+        # workers would otherwise share the state of.
+        np.random.seed(seed)
+        stream = samplers.mux_random_slice(sampler, collec, shape, **kwargs)
+        for obs in stream:
+            idx = _next_free_slot(free_slots, stop)
+            if idx is None:
+                return
+            ring.slot(idx)[...] = obs['X']
+            full_slots.put((worker_id, idx))
+        full_slots.put((worker_id, None))
+    except Exception:
+        full_slots.put((worker_id, traceback.format_exc()))
+    finally:
+        ring.close()
+
+
+def process_random_slice(sampler, collec, shape, n_workers=2, n_slots=None,
+                         dtype=np.float64, n_samples=None, seed=None,
+                         timeout=1.0, **kwargs):
+    """Sample random slices from a collection, using a pool of processes.
+
+    Each of `n_workers` processes runs a `mux_random_slice` over its own
+    partition of `collec`, writing observations into a shared memory ring
+    buffer. Only slot indices cross process boundaries; observations are
+    neither pickled nor copied on the consumer's side.
+
+    Note that a yielded observation is a view into the ring, and is only
+    valid until the next one is requested. Closing the generator (or letting
+    it be collected) shuts the workers down; an exception in any worker is
+    re-raised here as a RuntimeError.
+
+    Parameters
+    ----------
+    sampler : func
+        A bag generator, from `minibench.samplers`; must be picklable.
+
+    collec : iterable
+        An iterable collection of items, partitioned across the workers.
+
+    shape : tuple
+        Shape of the random slice to extract.
+
+    n_workers : int, default=2, > 0
+        Number of worker processes.
+
+    n_slots : int, default=None
+        Number of slots in the ring; defaults to 4 per worker, plus one for
+        the consumer.
+
+    dtype : np.dtype, default=np.float64
+        Datatype of the ring; observations are cast to it.
+
+    n_samples : int, default=None
+        Number of observations to produce; infinite if None.
+
+    seed : int, default=None
+        Seed from which each worker's RNG seed is drawn.
+
+    timeout : scalar, default=1.0
+        Seconds between checks on the workers' health while waiting.
+
+    kwargs : dict
+        Arguments to forward on to `mux_random_slice`, in each worker.
+
+    Yields
+    ------
+    obs : dict
+        Observation with the slice under 'X'.
+    """
+    collec = list(collec)
+    parts = [collec[idx::n_workers] for idx in range(n_workers)]
+    parts = [part for part in parts if part]
+    if not parts:
+        raise ValueError("Cannot sample from an empty collection.")
+    n_slots = 4 * len(parts) + 1 if n_slots is None else n_slots
+    if n_slots < 2:
+        raise ValueError("n_slots must be at least 2.")
+    n_samples = np.inf if n_samples is None else n_samples
+
+    ring = SharedRing(n_slots, shape, dtype)
+    free_slots, full_slots = multiprocessing.Queue(), multiprocessing.Queue()
+    for idx in range(n_slots):
+        free_slots.put(idx)
+    stop = multiprocessing.Event()
+    seeds = np.random.RandomState(seed).randint(2 ** 31, size=len(parts))
+    workers = [multiprocessing.Process(
+               target=_ring_worker,
+               args=(worker_id, ring.spec, free_slots, full_slots, stop,
+                     seeds[worker_id], sampler, part, shape, kwargs))
+               for worker_id, part in enumerate(parts)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+
+    try:
+        held, count, n_done = None, 0, 0
+        while count < n_samples and n_done < len(workers):
+            try:
+                worker_id, msg = full_slots.get(timeout=timeout)
+            except Empty:
+                for worker in workers:
+                    if worker.exitcode not in (None, 0):
+                        raise RuntimeError(
+                            "Worker {} died with exit code {}.".format(
+                                worker.name, worker.exitcode))
+                continue
+
+            if msg is None:
+                n_done += 1
+            elif isinstance(msg, str):
+                raise RuntimeError("Worker {} failed:\n{}".format(worker_id,
+                                                                 msg))
+            else:
+                if held is not None:
+                    free_slots.put(held)
+                held = msg
+                count += 1
+                yield {'X': ring.slot(msg)}
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+        for queue in (free_slots, full_slots):
+            queue.close()
+            queue.cancel_join_thread()
+        ring.close()
+
+
+def _put(queue, item, stop):
+    """Put `item` on a bounded queue, giving up (False) once `stop` is set."""
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return True
+        except Full:
+            pass
+    return False
+
+
+def _materialize(arr):
+    """Copy `arr` into a new C-contiguous array, even if it already is one
+    (e.g. a memmap view, whose reads would otherwise happen later)."""
+    return np.array(arr, copy=True, order='C')
+
+
+def _prefetch_worker(stream, queue, stop, materialize):
+    """Drain `stream` into `queue` as (obs, exc_info) pairs; obs is None at
+    the end of the stream, and exc_info is set if the stream raised."""
+    copy = instrument.timed_function('copy', _materialize)
+    try:
+        for obs in stream:
+            if materialize:
+                obs = dict(obs)
+                obs['X'] = copy(obs['X'])
+            if not _put(queue, (obs, None), stop):
+                return
+        _put(queue, (None, None), stop)
+    except Exception:
+        _put(queue, (None, sys.exc_info()), stop)
+    finally:
+        close = getattr(stream, 'close', None)
+        if close is not None:
+            close()
+
+
+def prefetch(streams, lookahead=16, materialize=True, n_samples=None):
+    """Run samplers ahead of the consumer, each on its own thread.
+
+    Observations are taken from the streams in turn (round-robin), so the
+    output order only depends on each stream's own sequence, never on thread
+    timing: if the streams are deterministic, so is this. Exhausted streams
+    drop out of the rotation. An exception in any stream is re-raised here,
+    and closing the generator stops the threads.
+
+    Threads only help if the work they do releases the GIL, e.g. h5py and
+    `os.pread` reads, or large numpy copies (which `materialize` forces for
+    lazily read data, such as memmap views).
+
+    Parameters
+    ----------
+    streams : iterable, or list of iterables
+        Sampler(s) to run ahead; a single sampler gets a single thread.
+
+    lookahead : int, default=16, > 0
+        Number of observations each thread may run ahead.
+
+    materialize : bool, default=True
+        Copy each observation into a C-contiguous array on its thread, so
+        lazy reads (e.g. from memmaps) happen off the consumer's thread.
+
+    n_samples : int, default=None
+        Number of observations to produce; until exhaustion if None.
+
+    Yields
+    ------
+    obs : dict
+        Observation with the slice under 'X'.
+    """
+    if not isinstance(streams, (list, tuple)):
+        streams = [streams]
+    stop = threading.Event()
+    queues = [Queue(maxsize=lookahead) for _ in streams]
+    threads = [threading.Thread(target=_prefetch_worker,
+                                args=(stream, queue, stop, materialize))
+               for stream, queue in zip(streams, queues)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    n_samples = np.inf if n_samples is None else n_samples
+    try:
+        active, count = list(queues), 0
+        while active and count < n_samples:
+            for queue in list(active):
+                obs, exc_info = queue.get()
+                if exc_info is not None:
+                    raise exc_info[1].with_traceback(exc_info[2])
+                elif obs is None:
+                    active.remove(queue)
+                else:
+                    count += 1
+                    yield obs
+                    if count >= n_samples:
+                        break
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def threaded_random_slice(sampler, collec, shape, n_threads=4, lookahead=16,
+                          materialize=True, n_samples=None, seed=None,
+                          **kwargs):
+    """Sample random slices from a collection, using a pool of threads.
+
+    Each of `n_threads` threads runs a `mux_random_slice` over its own
+    partition of `collec`, and their observations are interleaved by
+    `prefetch`. Each thread's mux draws from its own generator, seeded from
+    `seed` (see `mux_random_slice`'s random_state), as does every sampler
+    it activates; so given a seed, the output is reproducible.
+
+    Parameters
+    ----------
+    sampler : func
+        A bag generator, from `minibench.samplers`.
+
+    collec : iterable
+        An iterable collection of items, partitioned across the threads.
+
+    shape : tuple
+        Shape of the random slice to extract.
+
+    n_threads : int, default=4, > 0
+        Number of threads.
+
+    lookahead, materialize, n_samples : see `prefetch`
+
+    seed : int, default=None
+        Seed from which each thread's random number generator is drawn.
+
+    kwargs : dict
+        Arguments to forward on to `mux_random_slice`, in each thread.
+
+    Yields
+    ------
+    obs : dict
+        Observation with the slice under 'X'.
+    """
+    collec = list(collec)
+    parts = [part for part in (collec[idx::n_threads]
+                               for idx in range(n_threads)) if part]
+    seeds = np.random.RandomState(seed).randint(2 ** 31, size=len(parts))
+    streams = [samplers.mux_random_slice(sampler, part, shape,
+                                         random_state=part_seed, **kwargs)
+               for part, part_seed in zip(parts, seeds)]
+    if not streams:
+        raise ValueError("Cannot sample from an empty collection.")
+    return prefetch(streams, lookahead=lookahead, materialize=materialize,
+                    n_samples=n_samples)
+
+
+class _HungUp(Exception):
+    """The other end of a socket was closed."""
+
+
+def _send(conn, msg):
+    """Send `msg` over `conn`, raising _HungUp if the other end's closed."""
+    try:
+        conn.send(msg)
+    except (EOFError, ConnectionError):
+        raise _HungUp()
+
+
+def _recv(conn):
+    """Receive from `conn`, raising _HungUp if the other end's closed."""
+    try:
+        return conn.recv()
+    except (EOFError, ConnectionError):
+        raise _HungUp()
+
+
+def _socket_worker(conn, ring_spec, seed, sampler, collec, shape, kwargs):
+    """Run a `mux_random_slice` over `collec`, writing into the ring.
+
+    Messages sent over `conn` are a slot index, None once the mux is
+    exhausted, or a traceback string on error; the consumer sends back the
+    indices of slots it is done with. The consumer closing its end of the
+    socket stops the worker.
+    """
+    ring = SharedRing(*ring_spec[:3], name=ring_spec[3])
+    free_slots = list(range(ring.n_slots))
+    try:
+        np.random.seed(seed)
+        stream = samplers.mux_random_slice(sampler, collec, shape, **kwargs)
+        for obs in stream:
+            while conn.poll(0) or not free_slots:
+                free_slots.append(_recv(conn))
+            idx = free_slots.pop()
+            ring.slot(idx)[...] = obs['X']
+            _send(conn, idx)
+        _send(conn, None)
+    except _HungUp:
+        pass
+    except Exception:
+        try:
+            _send(conn, traceback.format_exc())
+        except _HungUp:
+            pass
+    finally:
+        conn.close()
+        ring.close()
+
+
+def shm_random_slice(sampler, collec, shape, n_slots=4, dtype=np.float64,
+                     n_samples=None, seed=None, timeout=1.0, **kwargs):
+    """Sample random slices in another process, over shared memory.
+
+    A drop-in replacement for `zmq_random_slice`: a single worker process
+    runs a `mux_random_slice`, writing each observation into a shared memory
+    ring buffer, and a Unix socket carries only slot indices back and forth.
+    Observations are never serialized, and arrive C-contiguous and 64-byte
+    aligned, so they can be handed to numerical code as they are.
+
+    As with `process_random_slice`, a yielded observation is a view into the
+    ring, and is only valid until the next one is requested.
+
+    Parameters
+    ----------
+    sampler : func
+        A bag generator, from `minibench.samplers`.
+
+    collec : iterable
+        An iterable collection of items.
+
+    shape : tuple
+        Shape of the random slice to extract.
+
+    n_slots : int, default=4, >= 2
+        Number of slots in the ring.
+
+    dtype : np.dtype, default=np.float64
+        Datatype of the ring; observations are cast to it.
+
+    n_samples : int, default=None
+        Number of observations to produce; infinite if None.
+
+    seed : int, default=None
+        Seed for the worker's RNG.
+
+    timeout : scalar, default=1.0
+        Seconds between checks on the worker's health while waiting.
+
+    kwargs : dict
+        Arguments to forward on to `mux_random_slice`, in the worker.
+
+    Yields
+    ------
+    obs : dict
+        Observation with the slice under 'X'.
+    """
+    if n_slots < 2:
+        raise ValueError("n_slots must be at least 2.")
+    n_samples = np.inf if n_samples is None else n_samples
+    seed = np.random.RandomState(seed).randint(2 ** 31)
+
+    ring = SharedRing(n_slots, shape, dtype)
+    # A duplex Pipe is a Unix socket pair on POSIX systems.
+    conn, worker_conn = multiprocessing.Pipe(duplex=True)
+    worker = multiprocessing.Process(
+        target=_socket_worker,
+        args=(worker_conn, ring.spec, seed, sampler, list(collec), shape,
+              kwargs))
+    worker.daemon = True
+    worker.start()
+    worker_conn.close()
+
+    try:
+        held, count = None, 0
+        while count < n_samples:
+            if not conn.poll(timeout):
+                if worker.exitcode not in (None, 0):
+                    raise RuntimeError("Worker died with exit code {}."
+                                       "".format(worker.exitcode))
+                continue
+            try:
+                msg = conn.recv()
+            except EOFError:
+                raise RuntimeError("Worker exited unexpectedly.")
+
+            if msg is None:
+                break
+            elif isinstance(msg, str):
+                raise RuntimeError("Worker failed:\n{}".format(msg))
+            if held is not None:
+                try:
+                    conn.send(held)
+                except (IOError, OSError):
+                    # The worker is done, and hung up; what it sent before
+                    # that is still to be read.
+                    pass
+            held = msg
+            count += 1
+            yield {'X': ring.slot(msg)}
+    finally:
+        conn.close()
+        worker.join(timeout)
+        if worker.is_alive():
+            worker.terminate()
+            worker.join()
+        ring.close()
@@ -22,11 +22,23 @@ parameters.
     > df.keys()
 
     [u'{"shape": [2048, 256], "num_items": 100}', u'{"shape": [64, 64], "num_items": 100}', u'{"shape": [64, 64], "num_items": 10}', u'{"shape": [2048, 256], "num_items": 10}']
+
+The stats only summarize each benchmark; for its tail latencies, save the
+timing of every round too (py.test --benchmark-save-data), and get their
+percentiles, or a histogram, as tidy data frames.
+
+    > benchmarks.percentiles_df(percentiles=[50, 99, 99.9])
+    > benchmarks.histogram_df(buckets_per_decade=10)
+
+Tail percentiles need many rounds (1000 for the 99.9th; see `min_rounds`),
+and rounds of a single iteration; raise them with --benchmark-min-rounds,
+and check the 'rounds' and 'iterations' columns.
 """
 
 import collections
 import json
 import logging
+import numpy as np
 import os
 import pandas
 
@@ -34,6 +46,11 @@ logger = logging.getLogger(__name__)
 
 BENCHMARKS_DIR = os.path.join(os.path.dirname(__file__), ".benchmarks")
 BENCHMARK_STR = "'py.test -vs testbench_performance.py --benchmark-save=bench1'"
+# Recorded by `minibench.memory`; placed right after the timing stats.
+MEMORY_COLUMNS = ['peak_rss_MB', 'tracemalloc_peak_MB',
+                  'retained_blocks_per_draw']
+# Default percentiles of the round timings, for `percentiles_df`.
+PERCENTILES = [50, 90, 99, 99.9]
 
 
 def parse_benchmark_name(name):
@@ -76,6 +93,124 @@ def parse_benchmark_name(name):
     return test_name, params_str
 
 
+def benchmark_row(benchmark):
+    """Flatten a benchmark's results into a single row.
+
+    Parameters
+    ----------
+    benchmark : dict
+        One entry of a benchmark file's 'benchmarks'.
+
+    Returns
+    -------
+    row : dict
+        The benchmark's stats, along with anything it recorded in its
+        extra_info (e.g. the throughput recorded by
+        `minibench.bench.benchmark_throughput`).
+    """
+    row = dict(benchmark['stats'])
+    row.update(benchmark.get('extra_info', {}))
+    return row
+
+
+def benchmark_columns(benchmarks):
+    """Order the columns of a set of benchmarks' rows: the timing stats,
+    then the memory columns (see `MEMORY_COLUMNS`), then anything else in
+    their extra_info, each in the order first seen.
+
+    Parameters
+    ----------
+    benchmarks : list of dict
+        Entries of a benchmark file's 'benchmarks'.
+
+    Returns
+    -------
+    columns : list of str
+        Every column of their rows (see `benchmark_row`).
+    """
+    stats, extra = [], []
+    for benchmark in benchmarks:
+        stats += [key for key in benchmark['stats'] if key not in stats]
+        extra += [key for key in benchmark.get('extra_info', {})
+                  if key not in extra and key not in stats]
+    memory = [key for key in MEMORY_COLUMNS if key in extra]
+    return stats + memory + [key for key in extra if key not in memory]
+
+
+def round_timings(benchmark):
+    """Return the timing of every round of a benchmark, if they were saved
+    (py.test --benchmark-save-data).
+
+    Parameters
+    ----------
+    benchmark : dict
+        One entry of a benchmark file's 'benchmarks'.
+
+    Returns
+    -------
+    timings : np.ndarray, or None
+        Seconds per iteration of each round, in the order they ran; None if
+        they weren't saved.
+    """
+    data = benchmark['stats'].get('data')
+    return None if data is None else np.asarray(data, dtype=float)
+
+
+def min_rounds(percentile):
+    """Return the number of rounds needed to estimate a percentile: enough
+    for one round to be expected beyond it (e.g. 10 for the 90th, 1000 for
+    the 99.9th); with fewer, it's just the max, or min, interpolated.
+
+    Parameters
+    ----------
+    percentile : float
+        Percentile, in [0, 100]; the 0th and 100th, the min and max, only
+        need one round.
+
+    Returns
+    -------
+    n_rounds : int
+        Number of rounds.
+    """
+    tail = min(percentile, 100 - percentile)
+    if tail <= 0:
+        return 1
+    # Rounded, since e.g. 100 - 99.9 isn't exactly 0.1.
+    return int(np.ceil(np.round(100. / tail, 6)))
+
+
+def log_histogram(timings, buckets_per_decade=10):
+    """Count timings in logarithmically spaced buckets, keeping only the
+    non-empty ones.
+
+    Parameters
+    ----------
+    timings : array_like
+        Timings, in seconds.
+
+    buckets_per_decade : int, default=10
+        Number of buckets per power of ten; bucket bounds are powers of
+        10 ** (1 / buckets_per_decade).
+
+    Returns
+    -------
+    lower, upper : np.ndarray
+        Bounds of each non-empty bucket, in increasing order; a bucket
+        counts the timings t with lower <= t < upper.
+
+    counts : np.ndarray
+        Number of timings in each bucket.
+    """
+    # Non-positive timings (clock resolution) go in the lowest bucket.
+    timings = np.maximum(np.asarray(timings, dtype=float),
+                         np.finfo(float).tiny)
+    buckets = np.floor(np.log10(timings) * buckets_per_decade).astype(int)
+    buckets, counts = np.unique(buckets, return_counts=True)
+    lower = 10.0 ** (buckets / float(buckets_per_decade))
+    upper = 10.0 ** ((buckets + 1) / float(buckets_per_decade))
+    return lower, upper, counts
+
+
 class PytestBenchmarkFile(object):
     """Thin wrapper on a py.test benchmarking json file with utilities for
     dealing with data stored in them."""
@@ -89,6 +224,7 @@ class PytestBenchmarkFile(object):
             File path to the benchmark file.
         """
         self._path = file_path
+        self._timings = None
         with open(file_path, 'r') as fh:
             self.data = json.load(fh)
 
@@ -115,7 +251,8 @@ class PytestBenchmarkFile(object):
         -------
         df_result : pandas.DataFrame or dict
             If split_on_params is False, returns a single DataFrame
-            with all results.
+            with all results; see `benchmark_row` for the columns, and
+            `benchmark_columns` for their order.
 
             If True, returns a dictionary where the keys are the
             parameter strings, and the values are dataframes
@@ -123,26 +260,124 @@ class PytestBenchmarkFile(object):
         """
         if not split_on_params:
             labels = [x["name"] for x in self.data['benchmarks']]
-            stats = [x["stats"] for x in self.data['benchmarks']]
+            stats = [benchmark_row(x) for x in self.data['benchmarks']]
 
-            return pandas.DataFrame(stats, index=labels)
+            return pandas.DataFrame(
+                stats, index=labels,
+                columns=benchmark_columns(self.data['benchmarks']))
         else:
             labels = collections.defaultdict(list)
             stats = collections.defaultdict(list)
+            benchmarks = collections.defaultdict(list)
             # Collect the data
             for benchmark in self.data['benchmarks']:
                 name, params = parse_benchmark_name(benchmark['name'])
                 labels[params] += [name]
-                stats[params] += [benchmark['stats']]
+                stats[params] += [benchmark_row(benchmark)]
+                benchmarks[params] += [benchmark]
             # make a dataframe for each params value and return it as
             # a dict.
             dataframes = {}
             for key in labels.keys():
                 dataframes[key] = pandas.DataFrame(
                     stats[key],
-                    index=labels[key])
+                    index=labels[key],
+                    columns=benchmark_columns(benchmarks[key]))
             return dataframes
 
+    @property
+    def timings(self):
+        """The timing of every round, by benchmark name, for the
+        benchmarks that saved them (see `round_timings`); converted once,
+        on first use, and shared by every query."""
+        if self._timings is None:
+            self._timings = collections.OrderedDict()
+            for benchmark in self.data['benchmarks']:
+                timings = round_timings(benchmark)
+                if timings is not None:
+                    self._timings[benchmark['name']] = timings
+            if not self._timings:
+                logger.warning("No round timings in {}; save them with "
+                               "py.test --benchmark-save-data"
+                               .format(self._path))
+        return self._timings
+
+    def _timings_df(self, columns, summarize):
+        """Build a tidy dataframe from the rows `summarize(label, timings)`
+        returns for each benchmark's timings, prefixed by the benchmark's
+        full name, test name, parameter string, and number of rounds and of
+        iterations per round.
+
+        Round timings are means over the round's iterations, which hide
+        the slowest of them; benchmarks with more than one get a warning.
+        """
+        stats = dict((x['name'], x['stats']) for x in self.data['benchmarks'])
+        rows = []
+        for label, timings in self.timings.items():
+            name, params = parse_benchmark_name(label)
+            iterations = stats[label].get('iterations', 1)
+            if iterations > 1:
+                logger.warning("The rounds of {} timed {} iterations each; "
+                               "their timings are means, which hide the "
+                               "tail.".format(label, iterations))
+            rows += [(label, name, params, len(timings), iterations) +
+                     tuple(row) for row in summarize(label, timings)]
+        return pandas.DataFrame(
+            rows, columns=['benchmark', 'name', 'params', 'rounds',
+                           'iterations'] + columns)
+
+    def percentiles_df(self, percentiles=PERCENTILES):
+        """Return percentiles of each benchmark's round timings.
+
+        Parameters
+        ----------
+        percentiles : list of float, default=PERCENTILES
+            Percentiles to compute, in [0, 100].
+
+        Returns
+        -------
+        df : pandas.DataFrame
+            One row per benchmark and percentile, with columns 'benchmark'
+            (the name it has in `to_df`), 'name', 'params' (as returned by
+            `parse_benchmark_name`), 'rounds', 'iterations' (per round),
+            'percentile' and 'seconds'. Benchmarks without saved timings
+            are left out, as are percentiles of benchmarks with too few
+            rounds to estimate them (see `min_rounds`), with a warning.
+        """
+        def summarize(label, timings):
+            resolved = [x for x in percentiles
+                        if len(timings) >= min_rounds(x)]
+            if len(resolved) < len(percentiles):
+                logger.warning(
+                    "{} has too few rounds ({}) for percentiles {}; left "
+                    "out.".format(label, len(timings), [
+                        x for x in percentiles if x not in resolved]))
+            if not resolved:
+                return []
+            return zip(resolved, np.percentile(timings, resolved))
+        return self._timings_df(['percentile', 'seconds'], summarize)
+
+    def histogram_df(self, buckets_per_decade=10):
+        """Return a log-bucketed histogram of each benchmark's round
+        timings (see `log_histogram`).
+
+        Parameters
+        ----------
+        buckets_per_decade : int, default=10
+            Number of buckets per power of ten.
+
+        Returns
+        -------
+        df : pandas.DataFrame
+            One row per benchmark and non-empty bucket, with columns
+            'benchmark', 'name', 'params', 'rounds', 'iterations' (as in
+            `percentiles_df`), 'lower_s' and 'upper_s', the bucket's bounds,
+            and 'count'.
+        """
+        def summarize(label, timings):
+            return zip(*log_histogram(timings, buckets_per_decade))
+        return self._timings_df(['lower_s', 'upper_s', 'count'], summarize)
+
 
 def last_benchmark():
     """Get the most recent benchmarking file produced by the py.test
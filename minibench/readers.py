@@ -0,0 +1,498 @@
+"""Low-level readers that pull slices out of files without loading them.
+
+Examples
+--------
+Read a 16x16 window at offset (100, 20) from an NPY file on disk, touching
+only the rows it spans.
+
+    > reader = NpyReader("/data/item.npy")
+    > obs = reader.read((100, 20), (16, 16))
+    > reader.close()
+
+Or, from a slab written by `minibench.data.convert_npys_to_slab`, take the
+same window from one of the packed arrays.
+
+    > slab = Slab("/data/items.slab")
+    > obs = slab[key][100:116, 20:36]
+"""
+import collections
+import numpy as np
+import os
+import threading
+
+from . import instrument
+
+NpyHeader = collections.namedtuple(
+    'NpyHeader', ['shape', 'dtype', 'fortran_order', 'offset'])
+
+
+def read_npy_header(fpath):
+    """Parse the header of an NPY file.
+
+    Parameters
+    ----------
+    fpath : str
+        Path to an NPY file.
+
+    Returns
+    -------
+    header : NpyHeader
+        Shape, dtype, storage order and byte offset of the array data.
+    """
+    with open(fpath, 'rb') as fh, instrument.stage('header'):
+        version = np.lib.format.read_magic(fh)
+        if version == (1, 0):
+            header = np.lib.format.read_array_header_1_0(fh)
+        elif version == (2, 0):
+            header = np.lib.format.read_array_header_2_0(fh)
+        else:
+            raise ValueError("Unsupported NPY format version {} for {}"
+                             "".format(version, fpath))
+        shape, fortran_order, dtype = header
+        return NpyHeader(tuple(shape), np.dtype(dtype), fortran_order,
+                         fh.tell())
+
+
+def _pread_into(fd, view, offset):
+    """Fill a writable, byte-typed memoryview from `fd` at `offset`.
+
+    Reads may return fewer bytes than asked for (e.g. when interrupted by a
+    signal, or from network filesystems); they're continued from where they
+    stopped, and only reaching the end of the file is an error.
+    """
+    filled = 0
+    while filled < len(view):
+        rest = view[filled:]
+        if hasattr(os, 'preadv'):
+            nbytes = os.preadv(fd, [rest], offset + filled)
+        else:
+            data = os.pread(fd, len(rest), offset + filled)
+            nbytes = len(data)
+            rest[:nbytes] = data
+        if not nbytes:
+            raise IOError("Short read: expected {} bytes at offset {}, got "
+                          "{}.".format(len(view), offset, filled))
+        filled += nbytes
+
+
+class NpyReader(object):
+    """Serve slices of an NPY file with positional reads (`os.pread`).
+
+    The header is parsed once; afterwards, each slice only reads the span of
+    rows it covers, and is written into a caller-supplied (or new) array.
+    Nothing else in the file is read, so this is cheap even for very large
+    items. Readers may be shared across threads.
+    """
+
+    def __init__(self, fpath, header=None, coalesce_bytes=65536):
+        """Open the file and parse its header.
+
+        Parameters
+        ----------
+        fpath : str
+            Path to an NPY file.
+
+        header : NpyHeader, default=None
+            Previously parsed header, to skip re-reading it.
+
+        coalesce_bytes : int, default=65536
+            Windows whose span in the file is at most this many bytes (or at
+            most four times the window size) are read with a single call;
+            others are read one contiguous run at a time.
+        """
+        self.fpath = fpath
+        self.header = read_npy_header(fpath) if header is None else header
+        if self.header.dtype.hasobject:
+            raise ValueError("Cannot pread object arrays from {}"
+                             "".format(fpath))
+        self.coalesce_bytes = coalesce_bytes
+
+        # Work in storage order; Fortran arrays are C arrays, transposed.
+        self._storage_shape = self.shape[::-1] if self.fortran_order \
+            else self.shape
+        strides = [1] * len(self.shape)
+        for axis in range(len(self.shape) - 2, -1, -1):
+            strides[axis] = strides[axis + 1] * self._storage_shape[axis + 1]
+        self._strides = tuple(strides)
+        self._local = threading.local()
+        self._fd = os.open(fpath, os.O_RDONLY)
+
+    @property
+    def shape(self):
+        return self.header.shape
+
+    @property
+    def dtype(self):
+        return self.header.dtype
+
+    @property
+    def fortran_order(self):
+        return self.header.fortran_order
+
+    def __repr__(self):
+        return "NpyReader(fpath='{}', shape={}, dtype={})".format(
+            self.fpath, self.shape, self.dtype)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Close the underlying file descriptor."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _read_at(self, view, offset):
+        """Fill a writable, byte-typed memoryview from the file at
+        `offset`; every read of the file goes through here."""
+        _pread_into(self._fd, view, offset)
+
+    def _scratch(self, nbytes):
+        """Return this thread's scratch buffer, grown to `nbytes` if needed."""
+        scratch = getattr(self._local, 'scratch', None)
+        if scratch is None or len(scratch) < nbytes:
+            scratch = self._local.scratch = bytearray(nbytes)
+        return scratch
+
+    def read(self, offset, shape, out=None):
+        """Read the window of size `shape` starting at `offset`.
+
+        Parameters
+        ----------
+        offset : array_like, len=n
+            Starting index of the window, for each dimension.
+
+        shape : tuple, len=n
+            Shape of the window to read.
+
+        out : np.ndarray, default=None
+            Array of shape `shape` and this file's dtype to write into;
+            allocated if None.
+
+        Returns
+        -------
+        out : np.ndarray
+            The window's data.
+        """
+        if self._fd is None:
+            raise ValueError("Reader for {} is closed.".format(self.fpath))
+        # Plain ints throughout; this is called once per observation, and
+        # numpy's per-call overhead would dwarf the arithmetic.
+        shape = tuple(shape)
+        offset = tuple([int(x) for x in offset])
+        if len(offset) != len(self.shape) or len(shape) != len(self.shape):
+            raise ValueError("offset and shape must have {} dimensions."
+                             "".format(len(self.shape)))
+        for start, dim, size in zip(offset, shape, self.shape):
+            if start < 0 or start + dim > size:
+                raise ValueError("Window {} at {} is out of bounds for shape "
+                                 "{}.".format(shape, offset, self.shape))
+        if out is None:
+            out = np.empty(shape, dtype=self.dtype)
+
+        if self.fortran_order:
+            offset, window, target = offset[::-1], shape[::-1], out.T
+        else:
+            window, target = shape, out
+        itemsize = self.dtype.itemsize
+        num_items = 1
+        for dim in window:
+            num_items *= dim
+        if not num_items:
+            return out
+
+        first, span = 0, 1
+        for start, dim, stride in zip(offset, window, self._strides):
+            first += start * stride
+            span += (dim - 1) * stride
+        start = self.header.offset + first * itemsize
+
+        if span == num_items and target.flags.c_contiguous and \
+                target.dtype == self.dtype:
+            # Contiguous on disk and in memory; read straight into `out`.
+            self._read_at(memoryview(target).cast('B'), start)
+        elif span * itemsize <= max(self.coalesce_bytes,
+                                    4 * num_items * itemsize):
+            # One read covering every row the window touches.
+            scratch = self._scratch(span * itemsize)
+            self._read_at(memoryview(scratch)[:span * itemsize], start)
+            target[...] = np.ndarray(
+                window, dtype=self.dtype, buffer=scratch,
+                strides=tuple([x * itemsize for x in self._strides]))
+        else:
+            # One read per contiguous run; trailing full dimensions merge
+            # into a single run.
+            split = len(window) - 1
+            while split > 0 and window[split] == self._storage_shape[split]:
+                split -= 1
+            run_bytes = itemsize
+            for dim in window[split:]:
+                run_bytes *= dim
+            scratch = self._scratch(num_items * itemsize)
+            view = memoryview(scratch)
+            for count, index in enumerate(np.ndindex(*window[:split])):
+                run_start = start + itemsize * sum(
+                    [idx * stride
+                     for idx, stride in zip(index, self._strides)])
+                self._read_at(
+                    view[count * run_bytes:(count + 1) * run_bytes],
+                    run_start)
+            target[...] = np.frombuffer(
+                scratch, dtype=self.dtype,
+                count=num_items).reshape(window)
+        return out
+
+    def read_many(self, offsets, shape, out=None):
+        """Read a window of size `shape` at each of `offsets`.
+
+        Parameters
+        ----------
+        offsets : np.ndarray, shape=(N, n)
+            Starting index of each window, e.g. from
+            `minibench.samplers.random_offsets`.
+
+        shape : tuple, len=n
+            Shape of every window.
+
+        out : np.ndarray, shape=(N,) + shape, default=None
+            Array to write into; allocated if None.
+
+        Returns
+        -------
+        out : np.ndarray, shape=(N,) + shape
+            The windows' data.
+        """
+        shape = tuple(shape)
+        if out is None:
+            out = np.empty((len(offsets),) + shape, dtype=self.dtype)
+        for idx, offset in enumerate(offsets):
+            self.read(offset, shape, out=out[idx])
+        return out
+
+
+def slab_index_path(fpath):
+    """Return the path of the index (a Manifest) for the slab at `fpath`."""
+    return "{}.index.npy".format(fpath)
+
+
+class Manifest(object):
+    """Compact, array-backed description of the items in a collection.
+
+    Each entry records an item's path and key, the byte offset and size of
+    its raw data within that path (offset is -1 if the data isn't stored
+    raw, e.g. compressed), and its dtype, storage order and shape. Entries
+    can be looked up by path or by key, so samplers and muxes can learn an
+    item's shape, size or header without opening it.
+    """
+
+    def __init__(self, entries):
+        """Wrap a structured array of entries; see `from_rows`.
+
+        Parameters
+        ----------
+        entries : np.ndarray
+            Structured array with fields path, key, offset, nbytes, dtype,
+            fortran_order, ndim and shape.
+        """
+        self.entries = entries
+        self._rows = dict()
+        for idx, key in enumerate(entries['key']):
+            self._rows.setdefault(str(key), idx)
+        for idx, path in enumerate(entries['path']):
+            self._rows[str(path)] = idx
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build a manifest from
+        (path, key, offset, nbytes, dtype, fortran_order, shape) rows.
+
+        Parameters
+        ----------
+        rows : iterable of tuples
+            One row per item; `dtype` is anything np.dtype accepts.
+
+        Returns
+        -------
+        manifest : Manifest
+            The manifest; shapes are padded with zeros to the largest ndim.
+        """
+        rows = list(rows)
+        path_len = max([len(row[0]) for row in rows] + [1])
+        key_len = max([len(row[1]) for row in rows] + [1])
+        max_ndim = max([len(row[6]) for row in rows] + [1])
+        entries = np.zeros(len(rows), dtype=[
+            ('path', 'U{}'.format(path_len)), ('key', 'U{}'.format(key_len)),
+            ('offset', '<i8'), ('nbytes', '<i8'), ('dtype', 'U16'),
+            ('fortran_order', '?'), ('ndim', '<i8'),
+            ('shape', '<i8', (max_ndim,))])
+        for idx, row in enumerate(rows):
+            path, key, offset, nbytes, dtype, fortran_order, shape = row
+            entries['path'][idx] = path
+            entries['key'][idx] = key
+            entries['offset'][idx] = offset
+            entries['nbytes'][idx] = nbytes
+            entries['dtype'][idx] = np.dtype(dtype).str
+            entries['fortran_order'][idx] = fortran_order
+            entries['ndim'][idx] = len(shape)
+            entries['shape'][idx, :len(shape)] = shape
+        return cls(entries)
+
+    @classmethod
+    def load(cls, fpath):
+        """Load a manifest saved with `save`."""
+        return cls(np.load(fpath))
+
+    def save(self, fpath):
+        """Save the manifest to `fpath`, as an NPY file."""
+        np.save(fpath, self.entries)
+
+    def __repr__(self):
+        return "Manifest(n_items={})".format(len(self))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, item):
+        return item in self._rows
+
+    @property
+    def paths(self):
+        return [str(path) for path in self.entries['path']]
+
+    @property
+    def keys(self):
+        return [str(key) for key in self.entries['key']]
+
+    def row(self, item):
+        """Return the position of `item`, a path or key, in the manifest."""
+        try:
+            return self._rows[item]
+        except KeyError:
+            raise KeyError("{} is not in the manifest.".format(item))
+
+    def shape(self, item):
+        """Return the shape of `item`, a path or key."""
+        entry = self.entries[self.row(item)]
+        return tuple([int(dim) for dim in entry['shape'][:entry['ndim']]])
+
+    def dtype(self, item):
+        """Return the dtype of `item`, a path or key."""
+        return np.dtype(str(self.entries['dtype'][self.row(item)]))
+
+    def header(self, item):
+        """Return the NpyHeader of `item`, a path or key, e.g. to pass on to
+        `NpyReader`."""
+        idx = self.row(item)
+        return NpyHeader(self.shape(item), self.dtype(item),
+                         bool(self.entries['fortran_order'][idx]),
+                         int(self.entries['offset'][idx]))
+
+    def sizes(self, items=None):
+        """Return the number of elements in each of `items`.
+
+        Parameters
+        ----------
+        items : iterable, default=None
+            Paths or keys to look up; every entry, in order, if None.
+
+        Returns
+        -------
+        sizes : np.ndarray, dtype=int
+            Number of elements in each item.
+        """
+        shapes, ndims = self.entries['shape'], self.entries['ndim']
+        if items is not None:
+            rows = [self.row(item) for item in items]
+            shapes, ndims = shapes[rows], ndims[rows]
+        # Shapes are zero-padded past each item's ndim.
+        used = np.arange(shapes.shape[1]) < ndims[:, np.newaxis]
+        return np.prod(np.where(used, shapes, 1), axis=1)
+
+    def memmap(self, item, mode='r'):
+        """Memory-map the raw data of `item`, a path or key, without parsing
+        its file's header.
+
+        Parameters
+        ----------
+        item : str
+            Path or key of an item stored raw (offset >= 0).
+
+        mode : ['r', 'r+', 'c'], default='r'
+            Memory mapping mode; see np.memmap.
+
+        Returns
+        -------
+        data : np.memmap
+            The item's data.
+        """
+        header = self.header(item)
+        if header.offset < 0:
+            raise ValueError("{} isn't stored raw, and can't be memmapped."
+                             "".format(item))
+        order = 'F' if header.fortran_order else 'C'
+        return np.memmap(str(self.entries['path'][self.row(item)]),
+                         dtype=header.dtype, mode=mode, offset=header.offset,
+                         shape=header.shape, order=order)
+
+
+class Slab(object):
+    """Arrays packed into a single file, served as views of one memmap.
+
+    The file is mapped once; afterwards, getting an item, and any slice of
+    it, is pure arithmetic on that mapping. Views are built on access, from
+    the item's manifest entry, so opening a slab doesn't depend on how many
+    items it holds (given its manifest).
+    """
+
+    def __init__(self, fpath, manifest=None):
+        """Map the slab and read its index.
+
+        Parameters
+        ----------
+        fpath : str
+            Path to a slab file.
+
+        manifest : Manifest, default=None
+            Previously loaded index, to skip re-reading it.
+        """
+        self.fpath = fpath
+        if manifest is None:
+            manifest = Manifest.load(slab_index_path(fpath))
+        self.manifest = manifest
+        if os.path.getsize(fpath):
+            self._data = np.memmap(fpath, dtype=np.uint8, mode='r')
+        else:
+            self._data = np.zeros(0, dtype=np.uint8)
+
+    def __repr__(self):
+        return "Slab(fpath='{}', n_items={})".format(self.fpath, len(self))
+
+    def __len__(self):
+        return len(self.manifest)
+
+    def __contains__(self, key):
+        return key in self.manifest
+
+    def __getitem__(self, key):
+        if self._data is None:
+            raise ValueError("{} is closed.".format(self))
+        header = self.manifest.header(key)
+        return np.ndarray(header.shape, dtype=header.dtype,
+                          buffer=self._data, offset=header.offset)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def keys(self):
+        """Return the keys of the packed arrays, in slab order."""
+        return self.manifest.keys
+
+    def close(self):
+        """Drop this slab's mapping; it's unmapped once no views remain."""
+        self._data = None
@@ -1,10 +1,70 @@
+import contextlib
+import functools
+import h5py
+import itertools
 import numpy as np
 import pescador
 
+from . import cache as cache_
+from . import instrument
+from . import readers
 
-def random_slices(arr_shape, slc_shape, max_count=None, seed=None):
+
+def random_offsets(arr_shape, slc_shape, max_count=None, seed=None,
+                   block_size=256):
+    """Generate blocks of slice offsets within the valid limits of the given
+    array shape.
+
+    All offsets in a block are drawn in a single vectorized call. Blocks start
+    small and double in size up to `block_size`, so that short-lived consumers
+    (e.g. streamers with a small `lam`) don't pay for draws they never use.
+
+    Parameters
+    ----------
+    arr_shape : tuple, len=n
+        Dimensions of the object to slice.
+
+    slc_shape : tuple, len=n
+        Dimensions of the slice to extract.
+
+    max_count : int, default=None
+        Total number of offsets to produce. Infinite generator if None.
+
+    seed : int, default=None
+        Seed for the random number generator.
+
+    block_size : int, default=256, > 0
+        Maximum number of offsets to draw per block.
+
+    Yields
+    ------
+    offsets : np.ndarray, shape=(N, n)
+        Starting index of each slice, for each dimension.
+    """
+    if len(arr_shape) != len(slc_shape):
+        raise ValueError("shapes must have same length.")
+    max_dims = np.array([(x - y + 1) for x, y in zip(arr_shape, slc_shape)],
+                        dtype=int)
+    if (max_dims < 1).any():
+        raise ValueError("slice shape {} does not fit in array shape {}."
+                         "".format(slc_shape, arr_shape))
+    rng = np.random.RandomState(seed)
+    max_count = np.inf if max_count is None else max_count
+    num_offsets = min(16, block_size)
+    while max_count > 0:
+        num_offsets = int(min(num_offsets, max_count))
+        yield rng.randint(0, max_dims, size=(num_offsets, len(max_dims)))
+        max_count -= num_offsets
+        num_offsets = min(2 * num_offsets, block_size)
+
+
+def random_slices(arr_shape, slc_shape, max_count=None, seed=None,
+                  block_size=256):
     """Generate slice objects within the valid limits of the given array shape.
 
+    This is a thin view over `random_offsets`; see it for the details of
+    how offsets are drawn.
+
     TODO: Move to utils?
 
     Parameters
@@ -15,22 +75,198 @@ def random_slices(arr_shape, slc_shape, max_count=None, seed=None):
     scl_shape : tuple, len=n
         Dimensions of the slice to extract, or full if [None]*len(arr_shape).
 
+    max_count : int, default=None
+        Number of slices to produce. Infinite generator if None.
+
+    seed : int, default=None
+        Seed for the random number generator.
+
+    block_size : int, default=256
+        Maximum number of offsets to draw at once.
+
     Yields
     ------
     slc : slice
         Slice object to use for indexing.
     """
-    if len(arr_shape) != len(slc_shape):
-        raise ValueError("shapes must have same length.")
-    max_dims = [(x - y + 1) for x, y in zip(arr_shape, slc_shape)]
-    rng = np.random.RandomState(seed)
-    max_count = np.inf if max_count is None else max_count
-    while max_count:
-        offsets = [rng.randint(x) for x in max_dims]
-        slcs = [slice(start, start + dim)
-                for start, dim in zip(offsets, slc_shape)]
-        yield tuple(slcs)
-        max_count -= 1
+    for offsets in random_offsets(arr_shape, slc_shape, max_count=max_count,
+                                  seed=seed, block_size=block_size):
+        for row in offsets.tolist():
+            yield tuple([slice(start, start + dim)
+                         for start, dim in zip(row, slc_shape)])
+
+
+def count_slice_positions(shapes, slc_shape):
+    """Count the valid slice offsets in arrays of the given shapes.
+
+    Parameters
+    ----------
+    shapes : array_like, shape=(N, n)
+        Shape of each array.
+
+    slc_shape : tuple, len=n
+        Shape of the slice.
+
+    Returns
+    -------
+    counts : np.ndarray, shape=(N,)
+        Number of distinct offsets `random_offsets` can draw from each
+        array; zero where the slice doesn't fit.
+    """
+    shapes = np.asarray(shapes, dtype=np.int64).reshape(-1, len(slc_shape))
+    spans = shapes - np.asarray(slc_shape, dtype=np.int64) + 1
+    return np.prod(np.maximum(spans, 0), axis=1)
+
+
+def _window_index(strides, shape):
+    """Return the flat element offsets of a window relative to its origin.
+
+    Parameters
+    ----------
+    strides : array_like, len=n
+        Strides of the array being windowed, in elements (not bytes).
+
+    shape : tuple, len=n
+        Shape of the window.
+
+    Returns
+    -------
+    index : np.ndarray, shape=(prod(shape),)
+        Offset of each element of the window, in C order.
+    """
+    index = np.zeros(shape, dtype=np.intp)
+    for axis, (dim, stride) in enumerate(zip(shape, strides)):
+        axis_shape = [1] * len(shape)
+        axis_shape[axis] = dim
+        index += (np.arange(dim, dtype=np.intp) * stride).reshape(axis_shape)
+    return index.ravel()
+
+
+def gather_slices(arr, offsets, shape, out=None, max_window=4096):
+    """Extract many equally shaped slices from an array in one operation.
+
+    For small windows over contiguous data (e.g. NPY memmaps), all windows are
+    pulled out with a single `np.take` over the flat buffer, writing directly
+    into the output; with a memmap, only the pages under the windows are
+    touched. Large windows, or non-contiguous arrays, are copied window by
+    window, where the per-window overhead is negligible anyway.
+
+    Parameters
+    ----------
+    arr : np.ndarray
+        Array (or memmap) to slice.
+
+    offsets : np.ndarray, shape=(N, n)
+        Starting index of each slice, e.g. from `random_offsets`.
+
+    shape : tuple, len=n
+        Shape of every slice.
+
+    out : np.ndarray, shape=(N,) + shape, default=None
+        C-contiguous buffer to write the slices into; allocated if None.
+
+    max_window : int, default=4096
+        Largest window, in elements, to gather with a single flat `np.take`.
+
+    Returns
+    -------
+    out : np.ndarray, shape=(N,) + shape
+        The extracted slices.
+    """
+    offsets = np.asarray(offsets, dtype=np.intp)
+    shape = tuple(shape)
+    num_slices = len(offsets)
+    if out is None:
+        out = np.empty((num_slices,) + shape, dtype=arr.dtype)
+    elif not out.flags.c_contiguous or out.shape != (num_slices,) + shape:
+        raise ValueError("out must be C-contiguous with shape {}, not {}."
+                         "".format((num_slices,) + shape, out.shape))
+    if not num_slices:
+        return out
+
+    contiguous = arr.flags.c_contiguous or arr.flags.f_contiguous
+    if contiguous and int(np.prod(shape)) <= max_window:
+        # Reshaping in memory order ('A') is a view over the raw buffer, so
+        # element strides map indices straight to flat positions.
+        flat = arr.reshape(-1, order='A')
+        strides = np.array(arr.strides, dtype=np.intp) // arr.itemsize
+        index = (offsets.dot(strides)[:, np.newaxis] +
+                 _window_index(strides, shape))
+        np.take(flat, index, out=out.reshape(num_slices, -1), mode='clip')
+    else:
+        for idx, row in enumerate(offsets.tolist()):
+            out[idx] = arr[tuple([slice(start, start + dim)
+                                  for start, dim in zip(row, shape)])]
+    return out
+
+
+class QuantizedArray(np.ndarray):
+    """An array of quantized values, carrying the `scale` and `offset` to
+    dequantize them with (see `dequantize`); so do its slices."""
+
+    def __new__(cls, values, scale=1.0, offset=0.0):
+        obj = np.asarray(values).view(cls)
+        obj.scale, obj.offset = float(scale), float(offset)
+        return obj
+
+    def __array_finalize__(self, obj):
+        self.scale = getattr(obj, 'scale', 1.0)
+        self.offset = getattr(obj, 'offset', 0.0)
+
+
+def dequantize(values, scale=1.0, offset=0.0, dtype=np.float64, out=None):
+    """Map quantized values back to their original range.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        Quantized values; see `minibench.data.quantize`.
+
+    scale, offset : float, defaults=(1.0, 0.0)
+        Affine parameters of the quantization.
+
+    dtype : type, default=np.float64
+        Datatype of the output, if allocated.
+
+    out : np.ndarray, default=None
+        Array to write into; allocated if None.
+
+    Returns
+    -------
+    out : np.ndarray
+        The dequantized values, `values * scale + offset`.
+    """
+    if out is None:
+        out = np.empty(values.shape, dtype=dtype)
+    values = np.asarray(values)
+    if scale == 1:
+        out[...] = values
+    else:
+        np.multiply(values, scale, out=out, casting='unsafe')
+    if offset:
+        out += offset
+    return out
+
+
+def _open(fpath, opener, pool=None):
+    """Context manager for a handle on `fpath`, taken from `pool` if given.
+
+    Without a pool, the handle is opened with `opener` and closed on exit.
+    """
+    if pool is not None:
+        return pool.open(fpath)
+    with instrument.stage('open'):
+        handle = opener(fpath)
+    instrument.count('opens')
+    return cache_.closing_handle(handle)
+
+
+def _npy_opener(mmap_mode, manifest=None):
+    """Return a function loading an NPY file with np.load or, when memory
+    mapping with a `manifest`, mapping its data directly."""
+    if manifest is not None and mmap_mode is not None:
+        return functools.partial(manifest.memmap, mode=mmap_mode)
+    return functools.partial(np.load, mmap_mode=mmap_mode)
 
 
 # ---------------
@@ -96,7 +332,8 @@ def touch_npy_load(fpaths=None, fpath=None):
 #     return True
 
 
-def one_npy_random_slice(fpath, shape, mmap_mode=None, **kwargs):
+def one_npy_random_slice(fpath, shape, mmap_mode=None, pool=None,
+                         manifest=None, **kwargs):
     """Extract random slices from an NPY file, using np.load.
 
     Parameters
@@ -110,6 +347,14 @@ def one_npy_random_slice(fpath, shape, mmap_mode=None, **kwargs):
     mmap_mode : [None, 'r+', 'r', 'w', 'c'], default=None
         Memory mapping mode; see np.memmap for more details on the modes.
 
+    pool : minibench.cache.HandlePool, default=None
+        Pool of open arrays to draw from, in which case `mmap_mode` is up to
+        the pool's opener.
+
+    manifest : minibench.readers.Manifest, default=None
+        Manifest of the collection; when memory mapping, the data is mapped
+        straight from it, without parsing the file's header.
+
     kwargs : dict
         Arguments to forward on to the random_slices
 
@@ -118,18 +363,138 @@ def one_npy_random_slice(fpath, shape, mmap_mode=None, **kwargs):
     obs : np.ndarray
         Extracted observation with size `shape`.
     """
-    np_data = np.load(fpath, mmap_mode)
-    data_shape = np.shape(np_data)
-    # Generate a slice in the bounds of this data.
-    for new_slice in random_slices(data_shape, shape, **kwargs):
-        yield {'X': np_data[new_slice]}
+    opener = _npy_opener(mmap_mode, manifest)
+    with _open(fpath, opener, pool) as np_data:
+        data_shape = np.shape(np_data)
+        # Generate a slice in the bounds of this data.
+        new_slices = random_slices(data_shape, shape, **kwargs)
+        if instrument.active() is None:
+            for new_slice in new_slices:
+                yield {'X': np_data[new_slice]}
+            return
+        slices = (np_data[new_slice] for new_slice in new_slices)
+        for obs in instrument.timed(slices, 'slice', count='bytes_served'):
+            yield {'X': obs}
+
+
+def one_npy_gather_random_slice(fpath, shape, mmap_mode='r', pool=None,
+                                manifest=None, **kwargs):
+    """Extract random slices from an NPY file, gathering them in bulk.
+
+    Each block of offsets drawn by `random_offsets` is served by a single
+    `gather_slices` call, rather than indexing the array once per slice.
+    Unlike `one_npy_random_slice`, observations are C-contiguous copies
+    rather than views into the (memmapped) data.
+
+    Parameters
+    ----------
+    fpath : str
+        Path to an NPY file to load.
+
+    shape : tuple
+        Shape of the random slice to extract.
+
+    mmap_mode : [None, 'r+', 'r', 'w', 'c'], default='r'
+        Memory mapping mode; see np.memmap for more details on the modes.
+
+    pool : minibench.cache.HandlePool, default=None
+        Pool of open arrays to draw from, in which case `mmap_mode` is up to
+        the pool's opener.
+
+    manifest : minibench.readers.Manifest, default=None
+        Manifest of the collection; see `one_npy_random_slice`.
+
+    kwargs : dict
+        Arguments to forward on to the random_offsets
+
+    Yields
+    ------
+    obs : np.ndarray
+        Extracted observation with size `shape`.
+    """
+    opener = _npy_opener(mmap_mode, manifest)
+    with _open(fpath, opener, pool) as np_data:
+        all_offsets = random_offsets(np.shape(np_data), shape, **kwargs)
+        if instrument.active() is None:
+            for offsets in all_offsets:
+                for obs in gather_slices(np_data, offsets, shape):
+                    yield {'X': obs}
+            return
+        blocks = (gather_slices(np_data, offsets, shape)
+                  for offsets in all_offsets)
+        for block in instrument.timed(blocks, 'slice',
+                                      count='bytes_served'):
+            for obs in block:
+                yield {'X': obs}
+
+
+def one_npy_pread_random_slice(fpath, shape, pool=None, manifest=None,
+                               **kwargs):
+    """Extract random slices from an NPY file, using positional reads.
+
+    Only the NPY header is parsed up front; each slice then reads just the
+    rows it spans with `os.pread`, see `minibench.readers.NpyReader`.
+
+    Parameters
+    ----------
+    fpath : str
+        Path to an NPY file to read.
+
+    shape : tuple
+        Shape of the random slice to extract.
+
+    pool : minibench.cache.HandlePool, default=None
+        Pool of open `NpyReader`s to draw from.
+
+    manifest : minibench.readers.Manifest, default=None
+        Manifest of the collection, to take the header from instead of
+        parsing it.
+
+    kwargs : dict
+        Arguments to forward on to the random_offsets
+
+    Yields
+    ------
+    obs : np.ndarray
+        Extracted observation with size `shape`.
+    """
+    header = manifest.header(fpath) if manifest is not None else None
+    opener = functools.partial(readers.NpyReader, header=header)
+    with _open(fpath, opener, pool) as reader:
+        all_offsets = random_offsets(reader.shape, shape, **kwargs)
+        if instrument.active() is None:
+            for offsets in all_offsets:
+                for offset in offsets:
+                    yield {'X': reader.read(offset, shape)}
+            return
+        slices = (reader.read(offset, shape)
+                  for offsets in all_offsets for offset in offsets)
+        for obs in instrument.timed(slices, 'slice', count='bytes_served'):
+            yield {'X': obs}
+
 
+def _load_npz_field(fpath, field, pool=None):
+    """Decode a single array from an NPZ archive, as a QuantizedArray if it
+    was stored with a scale and offset."""
+    with _open(fpath, np.load, pool) as arc, instrument.stage('decode'):
+        keys = ["{}_scale".format(field), "{}_offset".format(field)]
+        if all([key in arc for key in keys]):
+            return QuantizedArray(arc[field], *[arc[key] for key in keys])
+        return arc[field]
 
-def one_npz_random_slice(fpath, field, shape, **kwargs):
+
+def one_npz_random_slice(fpath, field, shape, cache=None, pool=None,
+                         dtype=np.float64, **kwargs):
     """Extract random slices from an NPZ archive.
 
     IOW: I yield observations from a bag of correlated data.
 
+    The array is decoded once per call, rather than once per slice; passing
+    a `cache` shares decoded arrays across calls, e.g. across all of the
+    streamers created by `mux_random_slice`. Quantized arrays (see
+    `minibench.data.convert_npys_to_npzs`) are cached as stored, and
+    dequantized a slice at a time.
+
     Parameters
     ----------
     fpath : str
@@ -141,6 +506,15 @@ def one_npz_random_slice(fpath, field, shape, **kwargs):
     shape : tuple
         Shape of the random slice to extract.
 
+    cache : minibench.cache.ArrayCache, default=None
+        Cache of decoded arrays, keyed on (fpath, field).
+
+    pool : minibench.cache.HandlePool, default=None
+        Pool of open NpzFiles to decode from.
+
+    dtype : type, default=np.float64
+        Datatype to dequantize quantized arrays to.
+
     kwargs : dict
         Arguments to forward on to the random_slices
 
@@ -149,15 +523,37 @@ def one_npz_random_slice(fpath, field, shape, **kwargs):
     obs : np.ndarray
         Extracted observation with size `shape`.
     """
-    arc = np.load(fpath)
-    arr_shape = np.shape(arc[field])
-    for new_slice in random_slices(arr_shape, shape, **kwargs):
-        yield {'X': arc[field][new_slice]}
+    loader = functools.partial(_load_npz_field, fpath, field, pool)
+    if cache is None:
+        arr = loader()
+    else:
+        arr = cache.get_or_load((fpath, field), loader)
+    new_slices = random_slices(arr.shape, shape, **kwargs)
+    if instrument.active() is None:
+        for new_slice in new_slices:
+            if isinstance(arr, QuantizedArray):
+                yield {'X': dequantize(arr[new_slice], arr.scale, arr.offset,
+                                       dtype=dtype)}
+            else:
+                yield {'X': arr[new_slice]}
+        return
+    if isinstance(arr, QuantizedArray):
+        slices = (dequantize(arr[new_slice], arr.scale, arr.offset,
+                             dtype=dtype)
+                  for new_slice in new_slices)
+    else:
+        slices = (arr[new_slice] for new_slice in new_slices)
+    for obs in instrument.timed(slices, 'slice', count='bytes_served'):
+        yield {'X': obs}
 
 
-def one_h5py_random_slice(key, fp, shape, **kwargs):
+def one_h5py_random_slice(key, fp, shape, pool=None, dtype=np.float64,
+                          **kwargs):
     """Extract random slices from an h5py File.
 
+    Quantized datasets (see `minibench.data.convert_npys_to_h5py`) are read
+    as stored, and dequantized a slice at a time.
+
     Parameters
     ----------
     fp : h5py.File
@@ -166,7 +562,8 @@ def one_h5py_random_slice(key, fp, shape, **kwargs):
 
     -- or --
     fpath : str
-        A filepath to an h5py file. This will be slower than the above.
+        A filepath to an h5py file. This will be slower than the above,
+        unless handles are drawn from a `pool`.
 
     key : str
         Full path into the h5py file, pointing to a dataset. In other words,
@@ -175,6 +572,12 @@ def one_h5py_random_slice(key, fp, shape, **kwargs):
     shape : tuple
         Shape of the random slice to extract.
 
+    pool : minibench.cache.HandlePool, default=None
+        Pool of open h5py Files to draw from, when `fp` is a filepath.
+
+    dtype : type, default=np.float64
+        Datatype to dequantize quantized datasets to.
+
     kwargs : dict
         Arguments to forward on to the random_slices
 
@@ -183,10 +586,269 @@ def one_h5py_random_slice(key, fp, shape, **kwargs):
     obs : np.ndarray
         Extracted observation with size `shape`.
     """
-    dset = fp[key]
-    arr_shape = dset.shape
-    for new_slice in random_slices(arr_shape, shape, **kwargs):
-        yield {'X': dset[new_slice]}
+    with _h5py_dataset(key, fp, pool) as dset:
+        with instrument.stage('header'):
+            scale = dset.attrs.get('scale')
+            offset = dset.attrs.get('offset', 0.0)
+        new_slices = random_slices(dset.shape, shape, **kwargs)
+        if instrument.active() is None:
+            for new_slice in new_slices:
+                if scale is None:
+                    yield {'X': dset[new_slice]}
+                else:
+                    yield {'X': dequantize(dset[new_slice], scale, offset,
+                                           dtype=dtype)}
+            return
+        if scale is None:
+            slices = (dset[new_slice] for new_slice in new_slices)
+        else:
+            slices = (dequantize(dset[new_slice], scale, offset, dtype=dtype)
+                      for new_slice in new_slices)
+        for obs in instrument.timed(slices, 'slice', count='bytes_served'):
+            yield {'X': obs}
+
+
+@contextlib.contextmanager
+def _h5py_dataset(key, fp, pool=None):
+    """Context manager for the dataset `key` in `fp`, an h5py File or a
+    filepath to one (opened through `pool`, if given)."""
+    if not isinstance(fp, str):
+        yield fp[key]
+        return
+
+    opener = functools.partial(h5py.File, mode='r')
+    with _open(fp, opener, pool) as fhandle:
+        yield fhandle[key]
+
+
+def chunk_local_offsets(arr_shape, slc_shape, chunks, locality=1, align=False,
+                        max_count=None, seed=None, **kwargs):
+    """Generate blocks of slice offsets that cluster within storage chunks.
+
+    Offsets are drawn in groups of `locality`: a uniformly random offset picks
+    a chunk, and the whole group is then drawn uniformly from the valid
+    offsets starting in that chunk. With `locality=1` (and no alignment) the
+    draws are uniform over the array, exactly as in `random_offsets`.
+
+    Parameters
+    ----------
+    arr_shape : tuple, len=n
+        Dimensions of the object to slice.
+
+    slc_shape : tuple, len=n
+        Dimensions of the slice to extract.
+
+    chunks : tuple, len=n
+        Chunk shape of the storage.
+
+    locality : int, default=1, > 0
+        Number of consecutive offsets to draw from the same chunk.
+
+    align : bool, default=False
+        Snap offsets down to the chunk grid (where valid), so that slices no
+        larger than a chunk touch as few chunks as possible.
+
+    max_count : int, default=None
+        Total number of offsets to produce. Infinite generator if None.
+
+    seed : int, default=None
+        Seed for the random number generator.
+
+    kwargs : dict
+        Arguments to forward on to the random_offsets
+
+    Yields
+    ------
+    offsets : np.ndarray, shape=(N, n)
+        Starting index of each slice, for each dimension.
+    """
+    rng = np.random.RandomState(seed)
+    chunks = np.asarray(chunks, dtype=int)
+    max_dims = np.asarray(arr_shape, dtype=int) - slc_shape + 1
+    num_anchors = None if max_count is None else -(-max_count // locality)
+    max_count = np.inf if max_count is None else max_count
+    for anchors in random_offsets(arr_shape, slc_shape, max_count=num_anchors,
+                                  seed=rng.randint(2 ** 31), **kwargs):
+        origins = anchors // chunks * chunks
+        spans = np.minimum(origins + chunks, max_dims) - origins
+        draws = rng.random_sample((len(anchors), locality, len(chunks)))
+        offsets = origins[:, np.newaxis] + (draws * spans[:, np.newaxis])
+        offsets = offsets.astype(int).reshape(-1, len(chunks))
+        if align:
+            offsets = np.minimum(offsets // chunks * chunks, max_dims - 1)
+        offsets = offsets[:int(min(len(offsets), max_count))]
+        max_count -= len(offsets)
+        yield offsets
+
+
+def read_chunked(dset, offset, shape, cache, out=None):
+    """Read a window from a chunked h5py Dataset, one whole chunk at a time.
+
+    Every chunk the window overlaps is read (and so decompressed) in full,
+    and kept in `cache`, so later windows overlapping the same chunks are
+    served from memory.
+
+    Parameters
+    ----------
+    dset : h5py.Dataset
+        Chunked dataset to read from.
+
+    offset : array_like, len=n
+        Starting index of the window, for each dimension.
+
+    shape : tuple, len=n
+        Shape of the window.
+
+    cache : minibench.cache.LRUCache
+        Cache of decoded chunks, keyed on (filename, dataset name, chunk
+        index); e.g. an ArrayCache, to bound it in bytes.
+
+    out : np.ndarray, default=None
+        Array to write into; allocated if None.
+
+    Returns
+    -------
+    out : np.ndarray
+        The window's data.
+    """
+    chunks, arr_shape = dset.chunks, dset.shape
+    offset = [int(x) for x in offset]
+    if out is None:
+        out = np.empty(shape, dtype=dset.dtype)
+    key_base = (dset.file.filename, dset.name)
+    # Decoded on cache misses only.
+    decode = instrument.timed_function('decode', dset.__getitem__)
+    ranges = [range(start // chunk, (start + dim - 1) // chunk + 1)
+              for start, dim, chunk in zip(offset, shape, chunks)]
+    for index in itertools.product(*ranges):
+        origin = [idx * chunk for idx, chunk in zip(index, chunks)]
+        chunk_slice = tuple([slice(start, min(start + chunk, dim))
+                             for start, chunk, dim in
+                             zip(origin, chunks, arr_shape)])
+        data = cache.get_or_load(key_base + (index,),
+                                 functools.partial(decode, chunk_slice))
+        src, dst = [], []
+        for start, dim, corner, size in zip(offset, shape, origin,
+                                            data.shape):
+            lo, hi = max(start, corner), min(start + dim, corner + size)
+            src.append(slice(lo - corner, hi - corner))
+            dst.append(slice(lo - start, hi - start))
+        out[tuple(dst)] = data[tuple(src)]
+    return out
+
+
+def one_h5py_chunked_random_slice(key, fp, shape, cache=None, locality=1,
+                                  align=False, pool=None, **kwargs):
+    """Extract random slices from an h5py File, reading whole chunks.
+
+    For chunked (e.g. compressed) datasets, each read decodes whole chunks
+    anyway; here decoded chunks are kept in an LRU `cache`, and offsets can
+    be biased (`locality`) or aligned (`align`) so that several samples are
+    served from each decoded chunk. Contiguous datasets are read directly, as
+    in `one_h5py_random_slice`.
+
+    Parameters
+    ----------
+    key : str
+        Full path into the h5py file, pointing to a dataset.
+
+    fp : h5py.File or str
+        An open h5py file, or a filepath to one.
+
+    shape : tuple
+        Shape of the random slice to extract.
+
+    cache : minibench.cache.LRUCache, default=None
+        Cache of decoded chunks, which may be shared across calls (e.g. all
+        streamers of a mux). If None, a private cache of 16 chunks is used.
+
+    locality, align : see `chunk_local_offsets`
+
+    pool : minibench.cache.HandlePool, default=None
+        Pool of open h5py Files to draw from, when `fp` is a filepath.
+
+    kwargs : dict
+        Arguments to forward on to the chunk_local_offsets
+
+    Yields
+    ------
+    obs : np.ndarray
+        Extracted observation with size `shape`.
+    """
+    with _h5py_dataset(key, fp, pool) as dset:
+        probe = instrument.active()
+        if dset.chunks is None:
+            new_slices = random_slices(dset.shape, shape, **kwargs)
+            if probe is None:
+                for new_slice in new_slices:
+                    yield {'X': dset[new_slice]}
+                return
+            slices = (dset[new_slice] for new_slice in new_slices)
+        else:
+            if cache is None:
+                chunk_bytes = int(np.prod(dset.chunks)) * \
+                    dset.dtype.itemsize
+                cache = cache_.ArrayCache(16 * chunk_bytes)
+            all_offsets = chunk_local_offsets(
+                dset.shape, shape, dset.chunks, locality=locality,
+                align=align, **kwargs)
+            if probe is None:
+                for offsets in all_offsets:
+                    for offset in offsets:
+                        yield {'X': read_chunked(dset, offset, shape, cache)}
+                return
+            slices = (read_chunked(dset, offset, shape, cache)
+                      for offsets in all_offsets for offset in offsets)
+        for obs in probe.timed(slices, 'slice', count='bytes_served'):
+            yield {'X': obs}
+
+
+def one_slab_random_slice(key, slab, shape, pool=None, **kwargs):
+    """Extract random slices from an array packed into a slab.
+
+    Parameters
+    ----------
+    key : str
+        Key of the array in the slab.
+
+    slab : minibench.readers.Slab, or str
+        Open slab, or a filepath to one (opened through `pool`, if given).
+
+    shape : tuple
+        Shape of the random slice to extract.
+
+    pool : minibench.cache.HandlePool, default=None
+        Pool of open slabs to draw from, when `slab` is a filepath.
+
+    kwargs : dict
+        Arguments to forward on to the random_slices
+
+    Yields
+    ------
+    obs : np.ndarray
+        Extracted observation with size `shape`.
+    """
+    with _slab_array(key, slab, pool) as arr:
+        new_slices = random_slices(arr.shape, shape, **kwargs)
+        if instrument.active() is None:
+            for new_slice in new_slices:
+                yield {'X': arr[new_slice]}
+            return
+        slices = (arr[new_slice] for new_slice in new_slices)
+        for obs in instrument.timed(slices, 'slice', count='bytes_served'):
+            yield {'X': obs}
+
+
+@contextlib.contextmanager
+def _slab_array(key, slab, pool=None):
+    """Context manager for the array `key` in `slab`, a Slab or a filepath
+    to one (opened through `pool`, if given)."""
+    if not isinstance(slab, str):
+        yield slab[key]
+        return
+
+    with _open(slab, readers.Slab, pool) as handle:
+        yield handle[key]
 
 
 def one_biggie_random_slice(key, stash, field, shape, **kwargs):
@@ -212,15 +874,155 @@ def one_biggie_random_slice(key, stash, field, shape, **kwargs):
     obs : np.ndarray
         Extracted observation with size `shape`.
     """
-    entity = stash.get(key)
-    arr_shape = entity[field].shape
-    for new_slice in random_slices(arr_shape, shape, **kwargs):
-        yield {'X': entity[field].slice(new_slice)}
+    with instrument.stage('open'):
+        entity = stash.get(key)
+        arr_shape = entity[field].shape
+    new_slices = random_slices(arr_shape, shape, **kwargs)
+    if instrument.active() is None:
+        for new_slice in new_slices:
+            yield {'X': entity[field].slice(new_slice)}
+        return
+    slices = (entity[field].slice(new_slice) for new_slice in new_slices)
+    for obs in instrument.timed(slices, 'slice', count='bytes_served'):
+        yield {'X': obs}
+
+
+class LazyStreamers(object):
+    """Sequence of `pescador.Streamer`s over a collection, built on access.
+
+    Only the collection is held; each streamer is created when it's looked
+    up, i.e. when the mux activates it. Startup cost and memory therefore
+    don't depend on the collection's size, only on `working_size`.
+    """
+
+    def __init__(self, sampler, collec, rng=None, **kwargs):
+        """Wrap a collection.
+
+        Parameters
+        ----------
+        sampler : func
+            A bag generator, taking an item as its first argument.
+
+        collec : sequence
+            Collection of items, supporting len() and indexing.
+
+        rng : np.random.RandomState, default=None
+            If given, each streamer gets its own `seed` for `sampler`, drawn
+            from `rng` as it's created; unless kwargs has one.
+
+        kwargs : dict
+            Key-value map for the `sampler` generator.
+        """
+        self.sampler = sampler
+        self.collec = collec
+        self.rng = rng
+        self.kwargs = kwargs
+
+    def __len__(self):
+        return len(self.collec)
+
+    def __getitem__(self, idx):
+        instrument.count('activations')
+        kwargs = self.kwargs
+        if self.rng is not None and 'seed' not in kwargs:
+            kwargs = dict(kwargs, seed=self.rng.randint(2 ** 31))
+        return pescador.Streamer(self.sampler, self.collec[idx], **kwargs)
+
+
+def _activate(seed_pool, idx, pool_weights, distribution, lam,
+              with_replacement, rng):
+    """Activate `seed_pool[idx]`, as `pescador.util.generate_new_seed`."""
+    n_stream = None if lam is None else 1 + rng.poisson(lam=lam)
+    if not with_replacement:
+        distribution[idx] = 0.0
+        if (distribution > 0).any():
+            distribution /= np.sum(distribution)
+    return seed_pool[idx].generate(max_batches=n_stream), pool_weights[idx]
+
+
+def seeded_mux(seed_pool, n_samples, k, lam=256.0, pool_weights=None,
+               with_replacement=True, prune_empty_seeds=True, revive=False,
+               random_state=None):
+    """`pescador.mux`, drawing from its own random number generator.
+
+    pescador's mux draws from numpy's global RNG, so muxes running side by
+    side (e.g. on threads) interfere with each other's sequences. This one
+    makes exactly the same draws, from `random_state`.
+
+    Parameters
+    ----------
+    seed_pool, n_samples, k, lam, pool_weights, with_replacement,
+    prune_empty_seeds, revive
+        See pescador.mux.
+
+    random_state : int or np.random.RandomState, default=None
+        Random number generator, or a seed for a new one.
+
+    Yields
+    ------
+    obs : obj
+        Samples of the activated streamers.
+    """
+    rng = random_state
+    if not isinstance(rng, np.random.RandomState):
+        rng = np.random.RandomState(rng)
+    n_seeds = len(seed_pool)
+    if not n_seeds:
+        raise RuntimeError('Cannot mux an empty seed-pool')
+
+    distribution = np.ones(n_seeds) / n_seeds
+    if pool_weights is None:
+        pool_weights = distribution.copy()
+    pool_weights = np.atleast_1d(np.array(pool_weights, dtype=np.float64))
+    if len(pool_weights) != n_seeds or not (pool_weights > 0).any():
+        raise ValueError("pool_weights must have one weight per seed, and "
+                         "some positive.")
+    pool_weights /= np.sum(pool_weights)
+
+    streams = [None] * k
+    weights = np.zeros(k)
+    counts = np.zeros(k, dtype=int)
+    idxs = np.zeros(k, dtype=int)
+    for slot in range(k):
+        if not (distribution > 0).any():
+            break
+        idxs[slot] = rng.choice(n_seeds, p=distribution)
+        streams[slot], weights[slot] = _activate(
+            seed_pool, idxs[slot], pool_weights, distribution, lam,
+            with_replacement, rng)
+
+    n_samples = np.inf if n_samples is None else n_samples
+    count, weight_norm = 0, np.sum(weights)
+    while count < n_samples and weight_norm > 0.0:
+        slot = rng.choice(k, p=weights / weight_norm)
+        try:
+            obs = next(streams[slot])
+        except StopIteration:
+            if prune_empty_seeds and counts[slot] == 0:
+                distribution[idxs[slot]] = 0.0
+            if revive and not with_replacement:
+                distribution[idxs[slot]] = np.max(distribution) \
+                    if distribution.any() else 1.0
+            if (distribution > 0).any():
+                distribution /= np.sum(distribution)
+                idxs[slot] = rng.choice(n_seeds, p=distribution)
+                streams[slot], weights[slot] = _activate(
+                    seed_pool, idxs[slot], pool_weights, distribution, lam,
+                    with_replacement, rng)
+                counts[slot] = 0
+            else:
+                weights[slot] = 0.0
+            weight_norm = np.sum(weights)
+            continue
+        count += 1
+        counts[slot] += 1
+        yield obs
 
 
 def mux_random_slice(sampler, collec, shape, working_size=10, lam=25,
                      pool_weights=None, with_replacement=True, n_samples=None,
-                     prune_empty_seeds=True, revive=False, **kwargs):
+                     prune_empty_seeds=True, revive=False, manifest=None,
+                     random_state=None, **kwargs):
     """Sample random slices from a collection of stuff.
 
     Parameters
@@ -229,7 +1031,9 @@ def mux_random_slice(sampler, collec, shape, working_size=10, lam=25,
         A bag generator, from above.
 
     collec : iterable
-        An iterable collection of items, over which samplers will be created.
+        An iterable collection of items, over which samplers will be created
+        as they're activated; sequences (e.g. lists, ranges or arrays) are
+        used as they are, anything else is read into a list.
         NOTE: This must be the first (positional) argument of sampler, or baby
         kittens will die.
 
@@ -239,6 +1043,23 @@ def mux_random_slice(sampler, collec, shape, working_size=10, lam=25,
     working_size : int, default=10, > 0
         Number of generators to keep alive at any point in time.
 
+    manifest : minibench.readers.Manifest, default=None
+        Manifest of the collection. If given, it's passed on to `sampler`
+        (which must take it, like the NPY samplers do), and `pool_weights`
+        may be 'size', weighting each item by its number of elements.
+        Pool weights only decide how the active streamers are interleaved,
+        so 'size' is only allowed without replacement; an item's share of
+        the samples then follows its size while every item is active (i.e.
+        with revive=True, and working_size >= len(collec)). To weight the
+        activations themselves, see `minibench.mux.vmux_random_slice`'s
+        item_weights.
+
+    random_state : int or np.random.RandomState, default=None
+        If given, the mux draws from this generator (see `seeded_mux`),
+        rather than numpy's global one, and every activated streamer gets
+        a `seed` drawn from it too (unless kwargs has one); the stream is
+        then reproducible, and independent of other muxes.
+
     pescador.mux parameters
     -------------------------
     lam : scalar, default=25
@@ -256,13 +1077,134 @@ def mux_random_slice(sampler, collec, shape, working_size=10, lam=25,
     obs : np.ndarray
         Extracted observation with size `shape`.
     """
-    npz_pool = [pescador.Streamer(sampler, item, shape=shape, **kwargs)
-                for item in collec]
+    if isinstance(collec, dict) or not (hasattr(collec, '__len__') and
+                                        hasattr(collec, '__getitem__')):
+        collec = list(collec)
+    if manifest is not None:
+        kwargs.update(manifest=manifest)
+    if isinstance(pool_weights, str):
+        if pool_weights != 'size':
+            raise ValueError("Unknown pool_weights '{}'.".format(
+                pool_weights))
+        elif manifest is None:
+            raise ValueError("pool_weights='size' requires a manifest.")
+        elif with_replacement:
+            raise ValueError("pool_weights='size' has no effect on item "
+                             "shares with replacement; use "
+                             "vmux_random_slice(item_weights='size').")
+        pool_weights = manifest.sizes(collec).astype(np.float64)
+
+    mux_kwargs = dict(n_samples=n_samples, k=working_size, lam=lam,
+                      pool_weights=pool_weights,
+                      with_replacement=with_replacement,
+                      prune_empty_seeds=prune_empty_seeds, revive=revive)
+    if random_state is None:
+        streamers = LazyStreamers(sampler, collec, shape=shape, **kwargs)
+        stream = pescador.mux(seed_pool=streamers, **mux_kwargs)
+    else:
+        if not isinstance(random_state, np.random.RandomState):
+            random_state = np.random.RandomState(random_state)
+        streamers = LazyStreamers(sampler, collec, rng=random_state,
+                                  shape=shape, **kwargs)
+        stream = seeded_mux(streamers, random_state=random_state,
+                            **mux_kwargs)
+    # Bookkeeping only: the streamers' own stages are timed on their own.
+    return instrument.timed(stream, 'mux')
+
+
+def fill_batches(stream, batch_size, n_buffers=2, dtype=None):
+    """Collect observations into preallocated, reused minibatch buffers.
+
+    Observations are written directly into one of `n_buffers` arrays of
+    shape (batch_size, *obs_shape), which are cycled through in turn; no
+    per-batch allocation or stacking copy takes place. As a result, a yielded
+    batch is only valid until `n_buffers - 1` further batches have been
+    requested, after which its memory is overwritten.
+
+    Parameters
+    ----------
+    stream : iterable
+        Iterable of observations, e.g. a sampler from above, where each
+        observation is a dict with the array under 'X'.
+
+    batch_size : int, > 0
+        Number of observations per minibatch.
+
+    n_buffers : int, default=2, > 1
+        Number of buffers to cycle through; the default is double-buffering.
+
+    dtype : np.dtype, default=None
+        Datatype of the buffers; if None, the dtype of the first observation
+        is used.
+
+    Yields
+    ------
+    batch : dict
+        Minibatch with the stacked observations under 'X'. If the stream is
+        exhausted mid-batch, the final batch is truncated.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be positive.")
+    if n_buffers < 2:
+        raise ValueError("n_buffers must be at least 2, or the consumer's "
+                         "batch would be overwritten while in use.")
+    buffers = None
+    buf_idx, count = 0, 0
+    for obs in stream:
+        if buffers is None:
+            obs_x = np.asarray(obs['X'])
+            dtype = obs_x.dtype if dtype is None else dtype
+            buffers = [np.empty((batch_size,) + obs_x.shape, dtype=dtype)
+                       for _ in range(n_buffers)]
+        buffers[buf_idx][count] = obs['X']
+        count += 1
+        if count == batch_size:
+            yield {'X': buffers[buf_idx]}
+            buf_idx = (buf_idx + 1) % n_buffers
+            count = 0
+
+    if count:
+        yield {'X': buffers[buf_idx][:count]}
+
 
-    return pescador.mux(seed_pool=npz_pool, n_samples=n_samples,
-                        k=working_size, lam=lam, pool_weights=pool_weights,
-                        with_replacement=with_replacement,
-                        prune_empty_seeds=prune_empty_seeds, revive=revive)
+def mux_random_batch(sampler, collec, shape, batch_size, n_buffers=2,
+                     dtype=None, **kwargs):
+    """Sample minibatches of random slices from a collection of stuff.
+
+    This is `mux_random_slice` feeding `fill_batches`; see both for details,
+    and in particular for how long a yielded batch stays valid.
+
+    Parameters
+    ----------
+    sampler : func
+        A bag generator, from above.
+
+    collec : iterable
+        An iterable collection of items, over which samplers will be created.
+
+    shape : tuple
+        Shape of the random slice to extract.
+
+    batch_size : int, > 0
+        Number of observations per minibatch.
+
+    n_buffers : int, default=2
+        Number of reused batch buffers to cycle through.
+
+    dtype : np.dtype, default=None
+        Datatype of the batch buffers; defaults to that of the data.
+
+    kwargs : dict
+        Arguments to forward on to `mux_random_slice`; note that `n_samples`
+        counts observations, not batches.
+
+    Yields
+    ------
+    batch : dict
+        Minibatch with shape (batch_size,) + `shape` under 'X'.
+    """
+    stream = mux_random_slice(sampler, collec, shape, **kwargs)
+    return fill_batches(stream, batch_size, n_buffers=n_buffers, dtype=dtype)
 
 
 def zmq_random_slice(**kwargs):
@@ -0,0 +1,263 @@
+"""Emulated slow storage, for benchmarking samplers as if their data lived on
+a network filesystem or an object store rather than a local disk.
+
+Files opened through an `EmulatedStorage` are delayed the way remote storage
+delays them: by a fixed latency per open, a fixed latency per read request,
+and a bandwidth cap shared by every reader. Delays are real sleeps, so they
+release the GIL; concurrent reads (e.g. from `minibench.parallel` threads)
+overlap their latencies, as concurrent requests to a remote store do, while
+their transfers queue up on the shared bandwidth.
+
+Samplers read through the storage by drawing their handles from a
+`minibench.cache.HandlePool` built on one of its openers. Memory-mapped data
+(np.memmap, slabs) is paged in by the kernel, below anything that can be
+intercepted here, and can't be emulated.
+
+Examples
+--------
+Sample an NPY collection with positional reads, as if over NFS.
+
+    > nfs = EmulatedStorage(open_latency=1e-3, read_latency=2e-4,
+    >                       bandwidth=500e6)
+    > pool = minibench.cache.HandlePool(nfs.open_npy_reader)
+    > sampler = minibench.samplers.mux_random_slice(
+    >     sampler=minibench.samplers.one_npy_pread_random_slice,
+    >     collec=npy_files, shape=(16, 16), pool=pool)
+
+Or an HDF5 file, as if from an object store.
+
+    > s3 = EmulatedStorage(open_latency=2e-2, read_latency=1e-2,
+    >                      bandwidth=100e6)
+    > pool = minibench.cache.HandlePool(s3.open_h5py)
+    > sampler = minibench.samplers.mux_random_slice(
+    >     sampler=minibench.samplers.one_h5py_random_slice,
+    >     collec=keys, fp=h5py_file, shape=(16, 16), pool=pool)
+"""
+import h5py
+import io
+import numpy as np
+import threading
+import time
+
+from . import readers
+
+try:
+    timer = time.perf_counter
+except AttributeError:
+    timer = time.time
+
+
+class EmulatedStorage(object):
+    """Storage with configurable open latency, read latency and bandwidth.
+
+    The storage counts the `opens`, read `requests` and `bytes_read` going
+    through it. It may be shared across threads; copies sent to other
+    processes (e.g. by pickling) start over, with their own bandwidth.
+    """
+
+    def __init__(self, open_latency=0.0, read_latency=0.0, bandwidth=None,
+                 request_size=None):
+        """Configure the storage.
+
+        Parameters
+        ----------
+        open_latency : float, default=0.0
+            Seconds taken by every open.
+
+        read_latency : float, default=0.0
+            Seconds taken by every read request, before its data arrives.
+
+        bandwidth : float, default=None
+            Bytes per second shared by all reads; unlimited if None.
+
+        request_size : int, default=None
+            Largest number of bytes one request returns; larger reads are
+            split into several requests, each paying `read_latency`. If
+            None, every read is a single request.
+        """
+        self.open_latency = open_latency
+        self.read_latency = read_latency
+        self.bandwidth = bandwidth
+        self.request_size = request_size
+        self._lock = threading.Lock()
+        self.reset()
+
+    def __repr__(self):
+        return ("EmulatedStorage(open_latency={}, read_latency={}, "
+                "bandwidth={}, request_size={})".format(
+                    self.open_latency, self.read_latency, self.bandwidth,
+                    self.request_size))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Zero the counters, and free up the bandwidth."""
+        with self._lock:
+            self.opens = 0
+            self.requests = 0
+            self.bytes_read = 0
+            self._link_free = 0.0
+
+    def charge_open(self):
+        """Wait out one open."""
+        with self._lock:
+            self.opens += 1
+        _sleep(self.open_latency)
+
+    def charge_read(self, nbytes):
+        """Wait out one read of `nbytes` bytes: its requests' latency, then
+        its turn on the bandwidth.
+
+        Parameters
+        ----------
+        nbytes : int
+            Number of bytes read.
+        """
+        n_requests = 1
+        if self.request_size and nbytes > self.request_size:
+            n_requests = -(-nbytes // self.request_size)
+        arrival = timer() + n_requests * self.read_latency
+        with self._lock:
+            self.requests += n_requests
+            self.bytes_read += nbytes
+            if self.bandwidth:
+                start = max(arrival, self._link_free)
+                transfer = float(nbytes) / self.bandwidth
+                arrival = self._link_free = start + transfer
+        _sleep(arrival - timer())
+
+    def open(self, fpath):
+        """Open a file for reading through the storage.
+
+        Parameters
+        ----------
+        fpath : str
+            Path to the file.
+
+        Returns
+        -------
+        fhandle : EmulatedFile
+            Binary, seekable, read-only file object.
+        """
+        return EmulatedFile(fpath, self)
+
+    def load_npy(self, fpath):
+        """Load an NPY file into memory, like np.load."""
+        with self.open(fpath) as fhandle:
+            return np.load(fhandle)
+
+    def open_npz(self, fpath):
+        """Open an NPZ archive, like np.load; arrays are read, and decoded,
+        as they're accessed."""
+        fhandle = self.open(fpath)
+        try:
+            archive = np.load(fhandle)
+        except Exception:
+            fhandle.close()
+            raise
+        # Closed along with the archive.
+        archive.fid = fhandle
+        return archive
+
+    def open_h5py(self, fpath):
+        """Open an HDF5 file, read-only, as an h5py File."""
+        return h5py.File(self.open(fpath), 'r')
+
+    def open_npy_reader(self, fpath, header=None):
+        """Open an NPY file for positional reads, see `EmulatedNpyReader`."""
+        return EmulatedNpyReader(fpath, self, header=header)
+
+
+def _sleep(seconds):
+    if seconds > 0:
+        time.sleep(seconds)
+
+
+class EmulatedFile(io.RawIOBase):
+    """Read-only file whose reads are delayed by an `EmulatedStorage`.
+
+    Every `readinto` (and so every `read`) is one read of the storage, so
+    small reads, e.g. of headers, each pay a full request's latency, as
+    uncached reads of remote storage do.
+    """
+
+    def __init__(self, fpath, storage):
+        """Open the file.
+
+        Parameters
+        ----------
+        fpath : str
+            Path to the file.
+
+        storage : EmulatedStorage
+            Storage to read it through.
+        """
+        super(EmulatedFile, self).__init__()
+        self._raw = None
+        storage.charge_open()
+        self.name = fpath
+        self.storage = storage
+        self._raw = io.FileIO(fpath, 'r')
+
+    def __repr__(self):
+        return "EmulatedFile(name='{}')".format(self.name)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        nbytes = self._raw.readinto(buffer)
+        self.storage.charge_read(nbytes)
+        return nbytes
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._raw.seek(offset, whence)
+
+    def tell(self):
+        return self._raw.tell()
+
+    def close(self):
+        if self._raw is not None:
+            self._raw.close()
+        super(EmulatedFile, self).close()
+
+
+class EmulatedNpyReader(readers.NpyReader):
+    """NpyReader whose open, header and positional reads are delayed by an
+    `EmulatedStorage`."""
+
+    def __init__(self, fpath, storage, header=None, **kwargs):
+        """Open the file and parse its header.
+
+        Parameters
+        ----------
+        fpath : str
+            Path to an NPY file.
+
+        storage : EmulatedStorage
+            Storage to read it through.
+
+        header, kwargs : see `minibench.readers.NpyReader`
+        """
+        self.storage = storage
+        storage.charge_open()
+        if header is None:
+            header = readers.read_npy_header(fpath)
+            storage.charge_read(header.offset)
+        super(EmulatedNpyReader, self).__init__(fpath, header=header,
+                                                **kwargs)
+
+    def _read_at(self, view, offset):
+        super(EmulatedNpyReader, self)._read_at(view, offset)
+        self.storage.charge_read(len(view))
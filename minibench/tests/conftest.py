@@ -47,3 +47,10 @@ def stash_file(npz_files, workspace):
     fpath = os.path.join(workspace, "test_biggie.hdf5")
     minibench.data.convert_npzs_to_biggie(npz_files, fpath)
     return fpath
+
+
+@pytest.fixture()
+def slab_file(npy_files, workspace):
+    fpath = os.path.join(workspace, "test_slab.slab")
+    minibench.data.convert_npys_to_slab(npy_files, fpath)
+    return fpath
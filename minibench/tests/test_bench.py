@@ -0,0 +1,113 @@
+import numpy as np
+import os
+import pytest
+
+import minibench.bench
+import minibench.memory
+
+
+def counter(n_items=None, shape=(2, 3)):
+    count = 0
+    while n_items is None or count < n_items:
+        yield {'X': np.full(shape, count, dtype=np.float32)}
+        count += 1
+
+
+def test_time_to_first():
+    stream, elapsed = minibench.bench.time_to_first(counter)
+    assert elapsed >= 0
+    # The first observation is drawn.
+    assert next(stream)['X'][0, 0] == 1
+
+
+def test_drain():
+    for materialize in [False, True]:
+        count, n_bytes = minibench.bench.drain(counter(), 10,
+                                               materialize=materialize)
+        assert (count, n_bytes) == (10, 10 * 24)
+
+    assert minibench.bench.drain(counter(4), 10) == (4, 4 * 24)
+
+
+@pytest.mark.skipif(not minibench.bench.CAN_EVICT,
+                    reason="posix_fadvise isn't available")
+def test_evict_page_cache(workspace):
+    fpath = os.path.join(workspace, 'evict.npy')
+    arr = np.arange(2 ** 16, dtype=np.float64)
+    np.save(fpath, arr)
+    minibench.bench.evict_page_cache([fpath])
+    np.testing.assert_array_equal(np.load(fpath), arr)
+
+
+def test_warm_page_cache(workspace):
+    fpath = os.path.join(workspace, 'warm.npy')
+    arr = np.arange(2 ** 16, dtype=np.float64)
+    np.save(fpath, arr)
+    minibench.bench.warm_page_cache([fpath], chunk_size=1000)
+    np.testing.assert_array_equal(np.load(fpath), arr)
+
+
+def test_page_cache_setup(workspace):
+    fpath = os.path.join(workspace, 'setup.npy')
+    np.save(fpath, np.zeros(10))
+    modes = ['warm'] + (['cold'] if minibench.bench.CAN_EVICT else [])
+    for mode in modes:
+        minibench.bench.page_cache_setup(mode, [fpath])()
+
+    with pytest.raises(ValueError):
+        minibench.bench.page_cache_setup('lukewarm', [fpath])
+
+
+def test_evict_page_cache_unsupported(monkeypatch):
+    monkeypatch.setattr(minibench.bench, 'CAN_EVICT', False)
+    with pytest.raises(OSError):
+        minibench.bench.evict_page_cache([])
+    with pytest.raises(OSError):
+        minibench.bench.page_cache_setup('cold', [])
+
+
+def test_benchmark_throughput(benchmark):
+    streams = []
+
+    def make_stream():
+        streams.append(counter(shape=(4, 4, 8)))
+        return streams[-1]
+
+    info = minibench.bench.benchmark_throughput(
+        benchmark, make_stream, n_draws=20, batch_size=4, rounds=3)
+    assert info['n_samples'] == 80
+    assert info['first_sample_s'] >= 0
+    if benchmark.stats is not None:
+        assert info['samples_per_s'] > 0
+        np.testing.assert_allclose(
+            info['MB_per_s'] / info['samples_per_s'], 4 * 4 * 8 * 4 / 4e6)
+    # Every stream is closed once done.
+    assert streams and all([stream.gi_frame is None for stream in streams])
+
+
+def test_benchmark_throughput_before_round(benchmark):
+    calls = []
+    minibench.bench.benchmark_throughput(
+        benchmark, counter, n_draws=5, rounds=3,
+        before_round=lambda: calls.append(len(calls)))
+    # Disabled benchmarks run a single round.
+    assert len(calls) == (1 if benchmark.stats is None else 3)
+
+
+def test_benchmark_throughput_memory(benchmark):
+    streams = []
+
+    def make_stream():
+        streams.append(counter(shape=(100, 100)))
+        return streams[-1]
+
+    info = minibench.bench.benchmark_throughput(
+        benchmark, make_stream, n_draws=10, rounds=2, track_memory=True)
+    assert info['n_samples'] == 10
+    assert info['peak_rss_MB'] > 0
+    # One round of draws replayed, its stream closed too.
+    assert len(streams) == (2 if benchmark.stats is None else 3)
+    assert all([stream.gi_frame is None for stream in streams])
+    if minibench.memory.tracemalloc is not None:
+        assert info['tracemalloc_peak_MB'] >= 100 * 100 * 4 / 1e6
+        assert 'retained_blocks_per_draw' in info
@@ -0,0 +1,116 @@
+import numpy as np
+import threading
+import time
+
+import minibench.cache
+
+
+def test_lru_cache():
+    cache = minibench.cache.LRUCache(3)
+    for key in 'abc':
+        assert cache.put(key, key.upper())
+    assert len(cache) == 3
+
+    # Touch 'a', so 'b' is the least recently used.
+    assert cache.get('a') == 'A'
+    cache.put('d', 'D')
+    assert 'b' not in cache
+    assert cache.get('b', 'missing') == 'missing'
+    assert [k for k in 'acd' if k in cache] == ['a', 'c', 'd']
+
+    assert cache.get_or_load('e', lambda: 'E') == 'E'
+    assert cache.get_or_load('e', lambda: 'oops') == 'E'
+    assert cache.stats() == dict(size=3, n_items=3, hits=2, misses=2,
+                                 evictions=2)
+
+    cache.clear()
+    assert len(cache) == 0 and cache.size == 0
+
+
+def test_array_cache():
+    cache = minibench.cache.ArrayCache(max_bytes=100)
+    small = np.zeros(5)
+    assert cache.put('small', small)
+    assert cache.size == small.nbytes
+
+    # Too big to ever fit; returned, but not stored.
+    assert not cache.put('big', np.zeros(20))
+    assert 'big' not in cache
+    assert cache.get_or_load('big', lambda: np.zeros(20)).shape == (20,)
+    assert 'small' in cache
+
+    cache.put('medium', np.zeros(10))
+    assert 'small' not in cache
+    assert cache.size == 80
+
+
+class FakeHandle(object):
+    def __init__(self, key):
+        self.key = key
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_handle_pool():
+    pool = minibench.cache.HandlePool(FakeHandle, max_open=2)
+    a = pool.acquire('a')
+    assert pool.acquire('a') is a
+    b = pool.acquire('b')
+    c = pool.acquire('c')
+
+    # Everything's pinned, so nothing can be closed yet.
+    assert len(pool) == 3
+    assert not any([h.closed for h in (a, b, c)])
+
+    pool.release('a')
+    assert len(pool) == 3
+    pool.release('a')
+    assert a.closed and 'a' not in pool
+    assert len(pool) == 2
+
+    pool.release('b')
+    pool.release('c')
+    with pool.open('b') as handle:
+        assert handle is b
+    with pool.open('d') as d:
+        assert not d.closed
+    # 'c' is the least-recently-used idle handle.
+    assert c.closed and not b.closed
+    assert pool.stats() == dict(n_open=2, opens=4, hits=2, closes=2)
+
+    pool.close()
+    assert b.closed and d.closed and len(pool) == 0
+
+
+def test_handle_pool_concurrent_opens():
+    def slow_opener(key):
+        time.sleep(0.05)
+        return FakeHandle(key)
+
+    pool = minibench.cache.HandlePool(slow_opener)
+    handles = []
+    threads = [threading.Thread(target=lambda key: handles.append(
+        pool.acquire(key)), args=(key,)) for key in 'abcdaa']
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Opens overlap, rather than queueing up on the pool.
+    assert time.time() - start < 0.2
+    # Keys opened concurrently share a single handle.
+    assert len(pool) == 4
+    assert len(set([id(h) for h in handles if h.key == 'a'])) == 1
+
+
+def test_closing_handle():
+    handle = FakeHandle('x')
+    with minibench.cache.closing_handle(handle) as h:
+        assert h is handle
+    assert handle.closed
+
+    # Things that can't be closed are left alone.
+    with minibench.cache.closing_handle(np.zeros(3)):
+        pass
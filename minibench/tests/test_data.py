@@ -10,6 +10,7 @@ import numpy as np
 import os
 
 import minibench.data
+import minibench.readers
 
 
 def test_random_ndarrays():
@@ -25,6 +26,16 @@ def test_random_ndarrays():
 
     assert count == num_items
 
+    # Items are reproducible, and drawn straight in the requested dtype.
+    first = [arr for key, arr in minibench.data.random_ndarrays(
+        shape, num_items=2, loc=3, scale=0.5, dtype=np.float32, seed=seed)]
+    second = [arr for key, arr in minibench.data.random_ndarrays(
+        shape, num_items=2, loc=3, scale=0.5, dtype=np.float32, seed=seed)]
+    assert first[0].dtype == np.float32
+    np.testing.assert_array_equal(first, second)
+    assert not np.array_equal(first[0], first[1])
+    assert abs(np.mean(first) - 3) < 0.1 and abs(np.std(first) - 0.5) < 0.1
+
 
 def test_create_npy_collection(workspace):
     shape = (20, 20)
@@ -39,6 +50,15 @@ def test_create_npy_collection(workspace):
     data = np.load(npy_files[0])
     assert data.shape == shape
 
+    # The files don't depend on how many processes wrote them.
+    parallel_dir = os.path.join(workspace, "parallel")
+    os.mkdir(parallel_dir)
+    parallel_files = minibench.data.create_npy_collection(
+        shape, num_items, parallel_dir, n_jobs=2, seed=seed)
+    assert len(parallel_files) == num_items
+    for npy, parallel_npy in zip(npy_files, parallel_files):
+        np.testing.assert_array_equal(np.load(npy), np.load(parallel_npy))
+
 
 def test_convert_npys_to_npzs(npy_files, workspace):
     arr_key = 'data'
@@ -52,6 +72,37 @@ def test_convert_npys_to_npzs(npy_files, workspace):
         np.testing.assert_array_equal(arc[arr_key], arr)
 
 
+def test_quantize():
+    arr = np.random.RandomState(0).normal(size=(30, 20))
+    values, scale, offset = minibench.data.quantize(arr, np.uint8)
+    assert values.dtype == np.uint8
+    assert values.min() == 0 and values.max() == 255
+    assert np.abs(values * scale + offset - arr).max() <= scale / 2 + 1e-9
+
+    values, scale, offset = minibench.data.quantize(arr, np.int16)
+    assert values.min() == -2 ** 15 and values.max() == 2 ** 15 - 1
+    assert np.abs(values * scale + offset - arr).max() <= scale / 2 + 1e-9
+
+    values, scale, offset = minibench.data.quantize(arr, np.float16)
+    assert values.dtype == np.float16 and (scale, offset) == (1.0, 0.0)
+
+    # Constant arrays don't divide by zero.
+    values, scale, offset = minibench.data.quantize(np.ones(4), np.uint8)
+    np.testing.assert_array_equal(values * scale + offset, 1)
+
+
+def test_convert_npys_to_npzs_quantized(npy_files, workspace):
+    npz_files = minibench.data.convert_npys_to_npzs(
+        npy_files, 'data', workspace, compressed=True, dtype=np.uint8)
+
+    for npy, npz in zip(npy_files, npz_files):
+        arc = np.load(npz)
+        assert arc['data'].dtype == np.uint8
+        scale, offset = arc['data_scale'], arc['data_offset']
+        np.testing.assert_allclose(arc['data'] * scale + offset,
+                                   np.load(npy), atol=scale / 2 + 1e-9)
+
+
 def test_convert_npys_to_h5py(npy_files, workspace):
     fpath = os.path.join(workspace, "test_h5py.hdf5")
     success = minibench.data.convert_npys_to_h5py(
@@ -83,3 +134,125 @@ def test_convert_npzs_to_biggie(npz_files, workspace):
                 # Update to `entity.get(field)` when biggie:#
                 getattr(entity, field),
                 arc[field])
+
+
+def test_convert_npys_to_h5py_chunked(npy_files, workspace):
+    fpath = os.path.join(workspace, "test_h5py_chunked.hdf5")
+    success = minibench.data.convert_npys_to_h5py(
+        npy_files, fpath, chunks=(8, 64), compression='gzip',
+        compression_opts=4, shuffle=True)
+
+    assert success
+    fhandle = h5py.File(fpath, 'r')
+    for npy in npy_files:
+        dset = fhandle[minibench.data.filebase(npy)]
+        # Chunks are clipped to the (20, 20) datasets.
+        assert dset.chunks == (8, 20)
+        assert dset.compression == 'gzip'
+        assert dset.shuffle
+        np.testing.assert_array_equal(dset[...], np.load(npy))
+
+
+def test_convert_npys_to_h5py_quantized(npy_files, workspace):
+    fpath = os.path.join(workspace, "test_h5py_quantized.hdf5")
+    assert minibench.data.convert_npys_to_h5py(
+        npy_files, fpath, compression='lzf', dtype=np.float16)
+
+    fhandle = h5py.File(fpath, 'r')
+    for npy in npy_files:
+        dset = fhandle[minibench.data.filebase(npy)]
+        assert dset.dtype == np.float16 and dset.compression == 'lzf'
+        assert (dset.attrs['scale'], dset.attrs['offset']) == (1.0, 0.0)
+        np.testing.assert_array_equal(dset[...],
+                                      np.load(npy).astype(np.float16))
+
+
+def test_convert_npys_to_slab(npy_files, workspace):
+    fpath = os.path.join(workspace, "test_convert.slab")
+    assert minibench.data.convert_npys_to_slab(npy_files, fpath,
+                                               alignment=64)
+
+    manifest = minibench.readers.Manifest.load(
+        minibench.readers.slab_index_path(fpath))
+    assert len(manifest) == len(npy_files)
+    assert (manifest.entries['offset'] % 64 == 0).all()
+    for key, npy_file in zip(manifest.keys, npy_files):
+        arr = np.load(npy_file)
+        assert key == minibench.data.filebase(npy_file)
+        assert manifest.shape(key) == arr.shape
+        np.testing.assert_array_equal(manifest.memmap(key), arr)
+
+
+def test_collection_manifests(workspace):
+    shape, num_items = (20, 10), 3
+    npy_manifest = os.path.join(workspace, "npys.manifest.npy")
+    npy_files = minibench.data.create_npy_collection(
+        shape, num_items, workspace, manifest=npy_manifest)
+    npz_manifest = os.path.join(workspace, "npzs.manifest.npy")
+    npz_files = minibench.data.convert_npys_to_npzs(
+        npy_files, 'data', workspace, manifest=npz_manifest)
+    h5py_manifest = os.path.join(workspace, "h5py.manifest.npy")
+    h5py_file = os.path.join(workspace, "test_manifest.hdf5")
+    minibench.data.convert_npys_to_h5py(npy_files, h5py_file,
+                                        manifest=h5py_manifest)
+
+    for fpath, items in [(npy_manifest, npy_files),
+                         (npz_manifest, npz_files),
+                         (h5py_manifest, [h5py_file] * num_items)]:
+        manifest = minibench.readers.Manifest.load(fpath)
+        assert manifest.paths == items
+        np.testing.assert_array_equal(manifest.sizes(), 200)
+
+    # Contiguous datasets can be mapped straight out of the HDF5 file.
+    manifest = minibench.readers.Manifest.load(h5py_manifest)
+    for key, npy_file in zip(manifest.keys, npy_files):
+        np.testing.assert_array_equal(manifest.memmap(key),
+                                      np.load(npy_file))
+
+
+def test_dataset_cache(workspace):
+    root = os.path.join(workspace, "dataset_cache")
+    cache = minibench.data.DatasetCache(root)
+    npy_files = cache.npy_collection((20, 10), 3, seed=4)
+    assert len(npy_files) == 3
+    mtimes = [os.path.getmtime(fpath) for fpath in npy_files]
+
+    # Hits reuse the files, across cache instances too...
+    again = minibench.data.DatasetCache(root).npy_collection(
+        (20, 10), 3, seed=4)
+    assert again == npy_files
+    assert [os.path.getmtime(fpath) for fpath in again] == mtimes
+    # ...while other parameters get their own entries.
+    assert not set(cache.npy_collection((20, 10), 3, seed=5)) & \
+        set(npy_files)
+
+    # Conversions derive from the cached NPY collection.
+    default_npys = cache.npy_collection((20, 10), 3)
+    npz_files = cache.npz_collection((20, 10), 3, compressed=True)
+    for npy, npz in zip(default_npys, npz_files):
+        np.testing.assert_array_equal(np.load(npz)['data'], np.load(npy))
+    h5py_file = cache.h5py_file((20, 10), 3, compression='lzf')
+    assert cache.h5py_file((20, 10), 3, compression='lzf') == h5py_file
+    with h5py.File(h5py_file, 'r') as fhandle:
+        for npy in default_npys:
+            np.testing.assert_array_equal(
+                fhandle[minibench.data.filebase(npy)][...], np.load(npy))
+    slab = minibench.readers.Slab(cache.slab_file((20, 10), 3))
+    assert len(slab) == 3
+
+    # Entries without an index (e.g. from an interrupted build) are rebuilt.
+    calls = []
+
+    def build(output_dir):
+        calls.append(output_dir)
+        fpath = os.path.join(output_dir, "x.npy")
+        np.save(fpath, np.zeros(2))
+        return [fpath]
+
+    fpaths = cache.get('test', dict(a=1), build)
+    assert cache.get('test', dict(a=1), build) == fpaths
+    assert len(calls) == 1
+    os.remove(os.path.join(os.path.dirname(fpaths[0]),
+                           minibench.data.DatasetCache.INDEX))
+    assert cache.get('test', dict(a=1), build) == fpaths
+    assert len(calls) == 2
@@ -0,0 +1,87 @@
+"""
+Important Development Info:
+The data @fixtures live in the conftest.py, making them global
+to the modules in this folder.
+"""
+import numpy as np
+import pytest
+
+import minibench.data
+import minibench.epoch
+
+
+@pytest.mark.parametrize("n", [0, 1, 2, 3, 17, 1000, 4097])
+def test_feistel_permutation(n):
+    permutation = minibench.epoch.FeistelPermutation(n, seed=1)
+    assert len(permutation) == n
+    permuted = permutation(np.arange(n))
+    assert sorted(permuted.tolist()) == list(range(n))
+    np.testing.assert_array_equal(
+        permuted, minibench.epoch.FeistelPermutation(n, seed=1)(np.arange(n)))
+    if n > 100:
+        assert (permuted != np.arange(n)).mean() > 0.9
+        other = minibench.epoch.FeistelPermutation(n, seed=2)(np.arange(n))
+        assert (permuted != other).mean() > 0.9
+
+    with pytest.raises(ValueError):
+        permutation([n])
+
+
+def test_slice_space():
+    space = minibench.epoch.SliceSpace([(5, 4), (2, 2), (4, 6)], (3, 3),
+                                       stride=(1, 2))
+    # 3 x 1 offsets in the first item, none in the second, 2 x 2 in the
+    # third; numbered in storage order.
+    assert len(space) == 7
+    items, offsets = space.locate(np.arange(len(space)))
+    np.testing.assert_array_equal(items, [0, 0, 0, 2, 2, 2, 2])
+    np.testing.assert_array_equal(
+        offsets, [[0, 0], [1, 0], [2, 0], [0, 0], [0, 2], [1, 0], [1, 2]])
+
+    with pytest.raises(ValueError):
+        minibench.epoch.SliceSpace([(2, 2)], (3, 3))
+    with pytest.raises(ValueError):
+        minibench.epoch.SliceSpace([(5, 5)], (3, 3), stride=0)
+
+
+def test_epoch_plan():
+    shapes = [(6, 5), (3, 3), (8, 4)]
+    space = minibench.epoch.SliceSpace(shapes, (3, 3))
+    blocks = list(minibench.epoch.epoch_plan(shapes, (3, 3), n_epochs=2,
+                                             block_size=8, seed=3))
+    pairs = [(item, tuple(offset))
+             for items, offsets in blocks
+             for item, offset in zip(items.tolist(), offsets.tolist())]
+    assert len(pairs) == 2 * len(space)
+    first, second = pairs[:len(space)], pairs[len(space):]
+    # Each epoch covers every pair once, in a fresh order...
+    assert len(set(first)) == len(space)
+    assert set(first) == set(second)
+    assert first != second
+    # ...with each block in storage order.
+    for items, offsets in blocks:
+        keys = np.column_stack([items, offsets]).tolist()
+        assert keys == sorted(keys)
+
+    again = list(minibench.epoch.epoch_plan(shapes, (3, 3), n_epochs=2,
+                                            block_size=8, seed=3))
+    for (items, offsets), (items2, offsets2) in zip(blocks, again):
+        np.testing.assert_array_equal(items, items2)
+        np.testing.assert_array_equal(offsets, offsets2)
+
+
+def test_epoch_random_slice(workspace):
+    # Items holding their own (item, row, col), so slices show where they
+    # were taken from.
+    fpaths = minibench.data.create_npy_collection((6, 5), 3, workspace)
+    for idx, fpath in enumerate(fpaths):
+        np.save(fpath, 100 * idx + np.arange(30).reshape(6, 5))
+    manifest = minibench.data.npy_manifest(fpaths)
+    for kwargs in [dict(), dict(manifest=manifest)]:
+        origins = [int(obs['X'][0, 0]) for obs in
+                   minibench.epoch.epoch_random_slice(
+                       fpaths, (2, 2), stride=2, block_size=4, seed=4,
+                       **kwargs)]
+        expected = [100 * idx + 5 * row + col for idx in range(3)
+                    for row in (0, 2, 4) for col in (0, 2)]
+        assert sorted(origins) == expected
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+import time
+
+import minibench.instrument
+import minibench.samplers
+
+
+def test_instrument_stages():
+    probe = minibench.instrument.Instrument()
+    with probe:
+        assert minibench.instrument.active() is probe
+        with minibench.instrument.stage('outer'):
+            time.sleep(0.02)
+            with minibench.instrument.stage('inner'):
+                time.sleep(0.02)
+        minibench.instrument.count('things', 3)
+        minibench.instrument.count('things')
+    assert minibench.instrument.active() is None
+
+    record = probe.to_dict()
+    assert record['outer_calls'] == record['inner_calls'] == 1
+    assert record['things'] == 4
+    # Stage times are exclusive of nested stages.
+    assert 0.02 <= record['outer_s'] < 0.035
+    assert record['inner_s'] >= 0.02
+
+    probe.reset()
+    assert probe.to_dict() == dict()
+
+
+def test_instrument_timed():
+    probe = minibench.instrument.Instrument()
+    with probe:
+        items = minibench.instrument.timed(
+            (np.zeros(n) for n in range(1, 4)), 'make', count='bytes')
+        assert sum([len(item) for item in items]) == 6
+        assert minibench.instrument.timed_function('add', np.add)(1, 2) == 3
+
+        with pytest.raises(ValueError):
+            list(minibench.instrument.timed(map(int, ['1', 'x']), 'parse'))
+
+    record = probe.to_dict()
+    assert record['make_calls'] == 3
+    assert record['bytes'] == 6 * 8
+    assert record['add_calls'] == 1
+    # The failing step counts; the end of an iterable doesn't.
+    assert record['parse_calls'] == 2
+
+
+def test_instrument_disabled():
+    # Without an active instrument, the hooks hand back what they're given.
+    assert minibench.instrument.active() is None
+    items = iter([1, 2])
+    assert minibench.instrument.timed(items, 'stage') is items
+    assert minibench.instrument.timed_function('stage', np.add) is np.add
+    with minibench.instrument.stage('stage'):
+        minibench.instrument.count('count')
+
+
+def test_instrument_disabled_samplers(npy_files):
+    # Samplers started without an instrument run their plain loops, and so
+    # never report to one activated later.
+    sampler = minibench.samplers.one_npy_random_slice(
+        npy_files[0], (5, 5), mmap_mode='r')
+    next(sampler)
+    with minibench.instrument.Instrument() as probe:
+        next(sampler)
+    assert probe.to_dict() == dict()
+
+
+class FakeBenchmark(object):
+    def __init__(self):
+        self.extra_info = dict(name='fake')
+
+
+def test_instrument_samplers(npy_files, npz_files):
+    with minibench.instrument.Instrument() as probe:
+        stream = minibench.samplers.mux_random_slice(
+            minibench.samplers.one_npy_pread_random_slice, npy_files,
+            (5, 5), n_samples=50, working_size=2, lam=5)
+        assert len(list(stream)) == 50
+    record = probe.to_dict()
+    assert record['mux_calls'] == 50
+    assert record['slice_calls'] >= 50
+    assert record['bytes_served'] == record['slice_calls'] * 25 * 8
+    # The mux may activate a streamer it then never draws from.
+    assert 1 <= record['opens'] == record['open_calls'] <= \
+        record['activations']
+    assert record['header_calls'] == record['opens']
+
+    with minibench.instrument.Instrument() as probe:
+        stream = minibench.samplers.mux_random_slice(
+            minibench.samplers.one_npz_random_slice, npz_files, (5, 5),
+            field='data', n_samples=10)
+        list(stream)
+    assert probe.to_dict()['decode_calls'] == probe.to_dict()['opens']
+
+    info = probe.attach(FakeBenchmark())
+    assert info['name'] == 'fake' and info['decode_calls'] >= 1
@@ -0,0 +1,86 @@
+import numpy as np
+
+import minibench.instrument
+import minibench.memory
+
+
+class FakeBenchmark(object):
+    def __init__(self):
+        self.extra_info = dict(name='fake')
+
+
+def test_peak_rss():
+    assert minibench.memory.peak_rss() > 0
+    assert minibench.memory.reset_peak_rss() in (True, False)
+
+
+def test_memory_tracker():
+    with minibench.memory.MemoryTracker() as tracker:
+        arrays = [np.ones(1000000) for _ in range(4)]
+    record = tracker.to_dict(n_draws=len(arrays))
+    assert record['peak_rss_MB'] > 0
+    # 4 arrays of 8MB each, still held.
+    assert record['tracemalloc_peak_MB'] >= 4 * 8
+    assert record['retained_blocks_per_draw'] >= 1
+    assert 'retained_blocks' in tracker.to_dict()
+
+    info = tracker.attach(FakeBenchmark(), n_draws=len(arrays))
+    assert info['name'] == 'fake' and 'peak_rss_MB' in info
+
+
+def test_track_draws():
+    held = []
+    info = minibench.memory.track_draws(
+        FakeBenchmark(), lambda n: held.append(np.ones(n)), 10, 100000)
+    assert len(held) == 10
+    assert info['tracemalloc_peak_MB'] >= 10 * 0.8
+    assert info['retained_blocks_per_draw'] >= 1
+
+    # Stops early if the function runs out.
+    stream = iter(range(3))
+    info = minibench.memory.track_draws(FakeBenchmark(), next, 10, stream)
+    assert 'retained_blocks_per_draw' in info
+
+    # Or once out of time, after at least one call.
+    calls = []
+    minibench.memory.track_draws(
+        FakeBenchmark(), calls.append, 10, 1, max_time=0)
+    assert calls == [1]
+
+
+def test_track_call():
+    held = []
+
+    def draws():
+        held.extend([np.ones(1000) for _ in range(4)])
+        return len(held)
+
+    info = minibench.memory.track_call(FakeBenchmark(), draws)
+    assert info['retained_blocks_per_draw'] >= 1
+
+
+def test_tracking_memory():
+    calls = []
+
+    def call(benchmark, func, *args, **kwargs):
+        calls.append(func)
+        return func(*args, **kwargs)
+
+    wrapper = minibench.memory.tracking_memory(call, n_draws=5)
+    benchmark = FakeBenchmark()
+    draws = []
+    assert wrapper(benchmark, draws.append, 1) is None
+    # Timed once, then tracked over 5 more draws.
+    assert len(calls) == 1 and len(draws) == 6
+    assert 'tracemalloc_peak_MB' in benchmark.extra_info
+
+
+def test_track_draws_instrument():
+    with minibench.instrument.Instrument() as probe:
+        with minibench.instrument.stage('draw'):
+            pass
+        minibench.memory.track_draws(
+            FakeBenchmark(), minibench.instrument.count, 5, 'draws')
+    # Untimed draws aren't counted.
+    assert probe.to_dict() == {'draw_s': probe.seconds['draw'],
+                               'draw_calls': 1}
@@ -0,0 +1,160 @@
+"""
+Important Development Info:
+The data @fixtures live in the conftest.py, making them global
+to the modules in this folder.
+"""
+import numpy as np
+import pytest
+
+import minibench.data
+import minibench.mux
+
+
+@pytest.mark.parametrize("weights", [[1, 2, 3, 4], [0, 5, 0, 1], [3],
+                                     [2, 2, 2], np.arange(100) ** 2])
+def test_alias_table(weights):
+    table = minibench.mux.AliasTable(weights)
+    assert len(table) == len(weights)
+    assert ((table.prob >= 0) & (table.prob <= 1)).all()
+    # The table's exact distribution matches the weights...
+    expected = np.asarray(weights, dtype=np.float64) / np.sum(weights)
+    probs = np.bincount(np.arange(len(table)), table.prob / len(table),
+                        minlength=len(table)) + \
+        np.bincount(table.alias, (1 - table.prob) / len(table),
+                    minlength=len(table))
+    np.testing.assert_allclose(probs, expected, atol=1e-12)
+
+    # ...and so do draws from it.
+    counts = np.bincount(table.draw(np.random.RandomState(0), 100000),
+                         minlength=len(table))
+    assert np.abs(counts / 100000. - expected).max() < 0.01
+    assert counts[expected == 0].sum() == 0
+
+
+def test_alias_table_invalid():
+    for weights in [[], [0, 0], [1, -1], [[1, 2]]]:
+        with pytest.raises(ValueError):
+            minibench.mux.AliasTable(weights)
+
+
+def test_mux_engine():
+    shapes = [(10, 8), (5, 5), (2, 2), (20, 3)]
+    slice_shape = (3, 3)
+    engine = minibench.mux.MuxEngine(shapes, slice_shape, working_size=2,
+                                     lam=4, seed=7)
+    items, offsets = engine.next_block(500)
+    assert items.shape == (500,)
+    assert offsets.shape == (500, 2)
+    # The third item is too small for a slice.
+    assert set(items.tolist()) == set([0, 1, 3])
+    upper = np.asarray(shapes)[items] - np.asarray(slice_shape)
+    assert (offsets >= 0).all() and (offsets <= upper).all()
+
+    other = minibench.mux.MuxEngine(shapes, slice_shape, working_size=2,
+                                    lam=4, seed=7)
+    other_items, other_offsets = other.next_block(500)
+    np.testing.assert_array_equal(items, other_items)
+    np.testing.assert_array_equal(offsets, other_offsets)
+
+    with pytest.raises(ValueError):
+        minibench.mux.MuxEngine([(2, 2)], slice_shape)
+
+
+def test_mux_engine_lifetimes():
+    engine = minibench.mux.MuxEngine([(10, 10)] * 4, (3, 3), working_size=1,
+                                     lam=None, seed=1)
+    assert len(set(engine.next_items(100).tolist())) == 1
+
+    # Runs of one activation are 1 + Poisson(3) long, but back-to-back
+    # activations of the same item (1 in 4) merge into longer runs.
+    engine = minibench.mux.MuxEngine([(10, 10)] * 4, (3, 3), working_size=1,
+                                     lam=3, seed=1)
+    items = engine.next_items(100000)
+    runs = np.diff(np.flatnonzero(np.diff(items) != 0))
+    assert abs(runs.mean() - 4 / 0.75) < 0.1
+
+
+@pytest.mark.parametrize("working_size", [1, 3])
+def test_mux_engine_without_replacement(working_size):
+    n_items = 6
+    engine = minibench.mux.MuxEngine(
+        [(10, 10)] * n_items, (3, 3), working_size=working_size, lam=2,
+        with_replacement=False, seed=2)
+    items = engine.next_items(1000)
+    assert 0 < len(items) < 1000
+    # Every item is activated exactly once, so it makes up a single run.
+    assert sorted(set(items.tolist())) == list(range(n_items))
+    if working_size == 1:
+        assert len(np.flatnonzero(np.diff(items) != 0)) == n_items - 1
+    assert not len(engine.next_items(10))
+
+    engine = minibench.mux.MuxEngine(
+        [(10, 10)] * n_items, (3, 3), working_size=working_size, lam=2,
+        with_replacement=False, revive=True, seed=2)
+    assert len(engine.next_items(1000)) == 1000
+
+
+def test_mux_engine_weights():
+    engine = minibench.mux.MuxEngine(
+        [(10, 10)] * 2, (3, 3), working_size=2, lam=None,
+        pool_weights=[1, 9], with_replacement=False, seed=3)
+    counts = np.bincount(engine.next_items(20000), minlength=2)
+    assert abs(counts[1] / 20000. - 0.9) < 0.02
+
+
+def test_mux_engine_item_weights():
+    weights = np.array([1, 0, 3, 6], dtype=np.float64)
+    engine = minibench.mux.MuxEngine(
+        [(10, 10)] * 4, (3, 3), working_size=3, lam=2, item_weights=weights,
+        seed=4)
+    counts = np.bincount(engine.next_items(100000), minlength=4)
+    np.testing.assert_allclose(counts / 100000., weights / weights.sum(),
+                               atol=0.02)
+
+    # Without replacement, every item with weight is still used exactly
+    # once, heavier ones tending to come first.
+    n_items = 50
+    engine = minibench.mux.MuxEngine(
+        [(10, 10)] * n_items, (3, 3), working_size=1, lam=0,
+        item_weights=np.arange(n_items), with_replacement=False, seed=5)
+    items = engine.next_items(1000)
+    assert sorted(items.tolist()) == list(range(1, n_items))
+    assert items[:n_items // 2].mean() > items[n_items // 2:].mean()
+
+    with pytest.raises(ValueError):
+        minibench.mux.MuxEngine([(10, 10)] * 2, (3, 3), item_weights=[1])
+
+
+def test_vmux_random_slice(npy_files):
+    slice_shape = (3, 2)
+    manifest = minibench.data.npy_manifest(npy_files)
+    for kwargs in [dict(), dict(manifest=manifest),
+                   dict(manifest=manifest, pool_weights='size',
+                        with_replacement=False, revive=True),
+                   dict(manifest=manifest, item_weights='positions')]:
+        sampler = minibench.mux.vmux_random_slice(
+            npy_files, slice_shape, n_samples=50, block_size=16,
+            working_size=2, lam=3, seed=4, **kwargs)
+        count = 0
+        for obs in sampler:
+            assert obs['X'].shape == slice_shape
+            assert np.isfinite(obs['X']).all()
+            count += 1
+        assert count == 50
+
+    # Pool weights don't shape item shares with replacement.
+    with pytest.raises(ValueError):
+        next(minibench.mux.vmux_random_slice(
+            npy_files, slice_shape, manifest=manifest, pool_weights='size'))
+
+
+def test_vmux_random_slice_values(workspace):
+    # A single item holding its own index, so slices show their offsets.
+    fpath = minibench.data.create_npy_collection((6, 5), 1, workspace)[0]
+    arr = np.arange(30, dtype=np.float64).reshape(6, 5)
+    np.save(fpath, arr)
+    sampler = minibench.mux.vmux_random_slice(
+        [fpath], (2, 2), n_samples=40, working_size=1, lam=2, seed=5)
+    for obs in sampler:
+        row, col = divmod(int(obs['X'][0, 0]), 5)
+        np.testing.assert_array_equal(obs['X'], arr[row:row + 2, col:col + 2])
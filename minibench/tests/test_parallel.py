@@ -0,0 +1,212 @@
+"""
+Important Development Info:
+The data @fixtures live in the conftest.py, making them global
+to the modules in this folder.
+"""
+import numpy as np
+import os
+import pytest
+
+import minibench.parallel
+import minibench.samplers
+
+
+def broken_random_slice(fpath, shape, **kwargs):
+    raise ValueError("Can't read {}".format(fpath))
+    yield
+
+
+def test_shared_ring():
+    ring = minibench.parallel.SharedRing(3, (5, 3), np.float32)
+    assert ring.slot_bytes == 64
+    for idx in range(3):
+        slot = ring.slot(idx)
+        assert slot.shape == (5, 3)
+        assert slot.flags.c_contiguous
+        assert slot.ctypes.data % minibench.parallel.ALIGNMENT == 0
+        slot[...] = idx
+
+    other = minibench.parallel.SharedRing(*ring.spec[:3], name=ring.spec[3])
+    assert not other.owner
+    np.testing.assert_array_equal(other.slot(2), 2)
+    other.close()
+
+    with pytest.raises(IndexError):
+        ring.slot(3)
+    ring.close()
+
+
+def test_process_random_slice(npy_files):
+    slice_shape = (3, 2)
+    sampler = minibench.parallel.process_random_slice(
+        sampler=minibench.samplers.one_npy_random_slice,
+        collec=npy_files, shape=slice_shape, n_workers=2, n_samples=25,
+        mmap_mode='r', seed=1)
+
+    count = 0
+    for obs in sampler:
+        assert obs['X'].shape == slice_shape
+        assert obs['X'].flags.c_contiguous
+        assert np.isfinite(obs['X']).all()
+        count += 1
+    assert count == 25
+
+
+def test_process_random_slice_exhaustion(npy_files):
+    sampler = minibench.parallel.process_random_slice(
+        sampler=minibench.samplers.one_npy_random_slice,
+        collec=npy_files, shape=(3, 2), n_workers=3, max_count=3,
+        with_replacement=False)
+    assert len(list(sampler)) == 3 * len(npy_files)
+
+
+def test_process_random_slice_close(npy_files):
+    sampler = minibench.parallel.process_random_slice(
+        sampler=minibench.samplers.one_npy_random_slice,
+        collec=npy_files, shape=(3, 2), n_workers=2)
+    next(sampler)
+    sampler.close()
+
+
+def test_process_random_slice_error(npy_files):
+    sampler = minibench.parallel.process_random_slice(
+        sampler=broken_random_slice, collec=npy_files, shape=(3, 2),
+        n_workers=2, prune_empty_seeds=False)
+    with pytest.raises(RuntimeError) as excinfo:
+        next(sampler)
+    assert "Can't read" in str(excinfo.value)
+
+
+def counter(start, stop, fail_at=None):
+    for value in range(start, stop):
+        if value == fail_at:
+            raise ValueError("Failed at {}".format(value))
+        yield {'X': np.array([value])}
+
+
+def test_prefetch():
+    streams = [counter(0, 3), counter(10, 15), counter(20, 22)]
+    values = [int(obs['X'][0]) for obs in
+              minibench.parallel.prefetch(streams, lookahead=2)]
+    assert values == [0, 10, 20, 1, 11, 21, 2, 12, 13, 14]
+
+    values = [int(obs['X'][0]) for obs in
+              minibench.parallel.prefetch(counter(0, 10), n_samples=4)]
+    assert values == [0, 1, 2, 3]
+
+
+def test_prefetch_error():
+    sampler = minibench.parallel.prefetch([counter(0, 5, fail_at=2)])
+    assert int(next(sampler)['X'][0]) == 0
+    assert int(next(sampler)['X'][0]) == 1
+    with pytest.raises(ValueError):
+        next(sampler)
+
+
+def test_prefetch_close():
+    stream = counter(0, 10 ** 6)
+    sampler = minibench.parallel.prefetch(stream, lookahead=1)
+    next(sampler)
+    sampler.close()
+    with pytest.raises(StopIteration):
+        next(stream)
+
+
+def test_threaded_random_slice(npy_files):
+    slice_shape = (3, 2)
+    sampler = minibench.parallel.threaded_random_slice(
+        sampler=minibench.samplers.one_npy_pread_random_slice,
+        collec=npy_files, shape=slice_shape, n_threads=2, n_samples=25)
+
+    count = 0
+    for obs in sampler:
+        assert obs['X'].shape == slice_shape
+        assert obs['X'].flags.c_contiguous
+        count += 1
+    assert count == 25
+
+    sampler = minibench.parallel.threaded_random_slice(
+        sampler=minibench.samplers.one_npy_random_slice,
+        collec=npy_files, shape=slice_shape, n_threads=3, max_count=3,
+        with_replacement=False, mmap_mode='r')
+    assert len(list(sampler)) == 3 * len(npy_files)
+
+
+def test_threaded_random_slice_seed(npy_files):
+    def draw(seed):
+        np.random.seed(None)
+        sampler = minibench.parallel.threaded_random_slice(
+            sampler=minibench.samplers.one_npy_random_slice,
+            collec=npy_files, shape=(3, 2), n_threads=3, n_samples=60,
+            working_size=2, lam=3, mmap_mode='r', seed=seed)
+        return np.array([obs['X'] for obs in sampler])
+
+    expected = draw(1)
+    for _ in range(4):
+        np.testing.assert_array_equal(draw(1), expected)
+    assert not np.array_equal(draw(2), expected)
+
+
+def test_threaded_random_slice_materialize(npy_files):
+    # Even whole, contiguous memmap slices are copied on the threads.
+    sampler = minibench.parallel.threaded_random_slice(
+        sampler=minibench.samplers.one_npy_random_slice,
+        collec=npy_files, shape=(20, 20), n_threads=2, n_samples=4,
+        mmap_mode='r')
+    for obs in sampler:
+        assert obs['X'].flags.owndata
+        assert not isinstance(obs['X'], np.memmap)
+
+
+def test_shm_random_slice(npy_files):
+    slice_shape = (3, 2)
+    sampler = minibench.parallel.shm_random_slice(
+        sampler=minibench.samplers.one_npy_random_slice,
+        collec=npy_files, shape=slice_shape, n_samples=25, mmap_mode='r',
+        seed=1)
+
+    count = 0
+    for obs in sampler:
+        assert obs['X'].shape == slice_shape
+        assert obs['X'].flags.c_contiguous
+        assert obs['X'].ctypes.data % minibench.parallel.ALIGNMENT == 0
+        assert np.isfinite(obs['X']).all()
+        count += 1
+    assert count == 25
+
+
+def test_shm_random_slice_exhaustion(npy_files):
+    sampler = minibench.parallel.shm_random_slice(
+        sampler=minibench.samplers.one_npy_random_slice,
+        collec=npy_files, shape=(3, 2), max_count=3,
+        with_replacement=False)
+    assert len(list(sampler)) == 3 * len(npy_files)
+
+
+def test_shm_random_slice_close(npy_files):
+    sampler = minibench.parallel.shm_random_slice(
+        sampler=minibench.samplers.one_npy_random_slice,
+        collec=npy_files, shape=(3, 2), n_slots=2)
+    next(sampler)
+    sampler.close()
+
+
+def test_shm_random_slice_error(npy_files):
+    sampler = minibench.parallel.shm_random_slice(
+        sampler=broken_random_slice, collec=npy_files, shape=(3, 2),
+        prune_empty_seeds=False)
+    with pytest.raises(RuntimeError) as excinfo:
+        next(sampler)
+    assert "Can't read" in str(excinfo.value)
+
+
+def test_shm_random_slice_missing_file(workspace):
+    missing = os.path.join(workspace, 'missing.npy')
+    sampler = minibench.parallel.shm_random_slice(
+        sampler=minibench.samplers.one_npy_random_slice, collec=[missing],
+        shape=(3, 2))
+    with pytest.raises(RuntimeError) as excinfo:
+        next(sampler)
+    # The worker's own error, with its traceback.
+    assert "Traceback" in str(excinfo.value)
+    assert "missing.npy" in str(excinfo.value)
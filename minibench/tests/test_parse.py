@@ -1,56 +1,172 @@
+import logging
+import numpy as np
 import os
+import pytest
 
 import minibench.parse as benchparse
 
 
-def test_parse_benchmark_name():
-    def __test(thing, expected_thing):
-        assert thing == expected_thing, "{} != {}".format(
-            thing, expected_thing)
-
+@pytest.mark.parametrize('test_name,expected_name,expected_params', [
     # Try the basic case
-    test_name = "test_touch_npy_load_random[{u'shape': [64, 64], " \
-                "u'num_items': 100}]"
-    name, params = benchparse.parse_benchmark_name(test_name)
-    yield __test, name, "test_touch_npy_load_random"
-    yield __test, params, '{"shape": [64, 64], "num_items": 100}'
-
-    test_name = "test_touch_npy_load_random"
+    ("test_touch_npy_load_random[{u'shape': [64, 64], u'num_items': 100}]",
+     "test_touch_npy_load_random", '{"shape": [64, 64], "num_items": 100}'),
+    ("test_touch_npy_load_random", "test_touch_npy_load_random", ""),
+    ("test_touch_npy_load_random[boofsaas lj t",
+     "test_touch_npy_load_random", "")])
+def test_parse_benchmark_name(test_name, expected_name, expected_params):
     name, params = benchparse.parse_benchmark_name(test_name)
-    yield __test, name, "test_touch_npy_load_random"
-    yield __test, params, ""
-
-    test_name = "test_touch_npy_load_random[boofsaas lj t"
-    name, params = benchparse.parse_benchmark_name(test_name)
-    yield __test, name, "test_touch_npy_load_random"
-    yield __test, params, ""
+    assert name == expected_name
+    assert params == expected_params
 
 
 def test_load_benchfile():
     bench_fixture_path = os.path.join(os.path.dirname(__file__),
                                       "fixtures", "benchfixture.json")
 
-    def __test_exists(thing):
-        assert thing is not None
-
-    def __test_is(thing, test_type):
-        assert isinstance(thing, test_type)
-
-    def __test_has(thing, key):
-        assert key in thing
-
     benchmarks = benchparse.load(bench_fixture_path)
     # Make sure we got something back
-    yield __test_exists, benchmarks
+    assert benchmarks is not None
 
     # Make sure the thing is of a sane type
-    yield __test_is, benchmarks, benchparse.PytestBenchmarkFile
+    assert isinstance(benchmarks, benchparse.PytestBenchmarkFile)
 
-    yield __test_has, benchmarks, "version"
-    yield __test_has, benchmarks, "commit_info"
-    yield __test_has, benchmarks, "benchmarks"
+    assert "version" in benchmarks
+    assert "commit_info" in benchmarks
+    assert "benchmarks" in benchmarks
 
-    yield __test_exists, benchmarks.to_df()
+    assert benchmarks.to_df() is not None
     df_data = benchmarks.to_df(split_on_params=True)
-    yield __test_exists, df_data
-    yield __test_is, df_data, dict
+    assert df_data is not None
+    assert isinstance(df_data, dict)
+
+
+def test_to_df_extra_info():
+    bench_fixture_path = os.path.join(os.path.dirname(__file__),
+                                      "fixtures", "throughputfixture.json")
+    benchmarks = benchparse.load(bench_fixture_path)
+    columns = ['samples_per_s', 'MB_per_s', 'first_sample_s', 'n_samples']
+
+    df = benchmarks.to_df()
+    assert len(df) == len(benchmarks.benchmarks)
+    for benchmark in benchmarks.benchmarks:
+        row = df.loc[benchmark['name']]
+        assert row['mean'] == benchmark['stats']['mean']
+        for column in columns:
+            assert row[column] == benchmark['extra_info'][column]
+
+    for params, param_df in benchmarks.to_df(split_on_params=True).items():
+        assert set(columns) <= set(param_df.columns)
+
+
+def test_to_df_memory():
+    bench_fixture_path = os.path.join(os.path.dirname(__file__),
+                                      "fixtures", "memoryfixture.json")
+    benchmarks = benchparse.load(bench_fixture_path)
+    stats = list(benchmarks.benchmarks[0]['stats'].keys())
+    columns = benchparse.MEMORY_COLUMNS
+
+    df = benchmarks.to_df()
+    # Memory columns come right after the timing stats.
+    assert list(df.columns[:len(stats) + len(columns)]) == stats + columns
+    for benchmark in benchmarks.benchmarks:
+        row = df.loc[benchmark['name']]
+        assert row['mean'] == benchmark['stats']['mean']
+        for column in columns:
+            if column in benchmark['extra_info']:
+                assert row[column] == benchmark['extra_info'][column]
+            else:
+                # e.g. run without --memory.
+                assert np.isnan(row[column])
+
+    for params, param_df in benchmarks.to_df(split_on_params=True).items():
+        assert list(param_df.columns[len(stats):][:len(columns)]) == columns
+
+
+def test_round_timings():
+    bench_fixture_path = os.path.join(os.path.dirname(__file__),
+                                      "fixtures", "histfixture.json")
+    benchmarks = benchparse.load(bench_fixture_path)
+
+    timings = benchmarks.timings
+    assert list(timings.keys()) == [x['name'] for x in benchmarks.benchmarks]
+    for benchmark in benchmarks.benchmarks:
+        data = timings[benchmark['name']]
+        assert len(data) == benchmark['stats']['rounds']
+        assert data.max() == benchmark['stats']['max']
+    # Converted once, and shared.
+    assert benchmarks.timings is timings
+
+    lower, upper, counts = benchparse.log_histogram(
+        [0.0011, 0.0012, 0.02, 0.0], buckets_per_decade=1)
+    np.testing.assert_allclose(lower[1:], [1e-3, 1e-2])
+    np.testing.assert_allclose(upper[1:], [1e-2, 1e-1])
+    assert list(counts) == [1, 2, 1]
+
+    no_timings = benchparse.load(os.path.join(
+        os.path.dirname(__file__), "fixtures", "memoryfixture.json"))
+    assert len(no_timings.timings) == 0
+    assert len(no_timings.percentiles_df()) == 0
+
+
+def test_percentiles_df():
+    bench_fixture_path = os.path.join(os.path.dirname(__file__),
+                                      "fixtures", "histfixture.json")
+    benchmarks = benchparse.load(bench_fixture_path)
+
+    df = benchmarks.percentiles_df(percentiles=[0, 50, 99, 99.9, 100])
+    assert list(df.columns) == ['benchmark', 'name', 'params', 'rounds',
+                                'iterations', 'percentile', 'seconds']
+    # 200 rounds are too few for the 99.9th percentile.
+    assert len(df) == 4 * len(benchmarks.benchmarks)
+    assert 99.9 not in set(df['percentile'])
+    for benchmark in benchmarks.benchmarks:
+        rows = df[df['benchmark'] == benchmark['name']]
+        assert (rows['rounds'] == benchmark['stats']['rounds']).all()
+        assert (rows['iterations'] == 1).all()
+        seconds = rows.set_index('percentile')['seconds']
+        assert seconds[0] == benchmark['stats']['min']
+        assert seconds[50] == benchmark['stats']['median']
+        assert seconds[100] == benchmark['stats']['max']
+        assert seconds.is_monotonic_increasing
+        assert set(rows['name']) == set([benchmark['name'].split('[')[0]])
+    # Joins with the stats.
+    stats = benchmarks.to_df()
+    assert set(df['benchmark']) == set(stats.index)
+
+
+def test_min_rounds():
+    assert benchparse.min_rounds(0) == benchparse.min_rounds(100) == 1
+    assert benchparse.min_rounds(50) == 2
+    assert benchparse.min_rounds(90) == 10
+    assert benchparse.min_rounds(99.9) == 1000
+    assert benchparse.min_rounds(1) == 100
+
+
+def test_percentiles_df_warnings(caplog):
+    bench_fixture_path = os.path.join(os.path.dirname(__file__),
+                                      "fixtures", "histfixture.json")
+    benchmarks = benchparse.load(bench_fixture_path)
+    benchmarks.benchmarks[0]['stats']['iterations'] = 10
+
+    with caplog.at_level(logging.WARNING):
+        df = benchmarks.percentiles_df(percentiles=[99.9])
+    assert len(df) == 0
+    assert 'iterations' in caplog.text and 'too few rounds' in caplog.text
+
+
+def test_histogram_df():
+    bench_fixture_path = os.path.join(os.path.dirname(__file__),
+                                      "fixtures", "histfixture.json")
+    benchmarks = benchparse.load(bench_fixture_path)
+
+    df = benchmarks.histogram_df(buckets_per_decade=20)
+    assert list(df.columns) == ['benchmark', 'name', 'params', 'rounds',
+                                'iterations', 'lower_s', 'upper_s', 'count']
+    for benchmark in benchmarks.benchmarks:
+        rows = df[df['benchmark'] == benchmark['name']]
+        assert rows['count'].sum() == benchmark['stats']['rounds']
+        assert (rows['count'] > 0).all()
+        assert rows['lower_s'].min() <= benchmark['stats']['min']
+        assert rows['upper_s'].max() > benchmark['stats']['max']
+        np.testing.assert_allclose(rows['upper_s'] / rows['lower_s'],
+                                   10 ** (1. / 20))
@@ -0,0 +1,134 @@
+"""
+Important Development Info:
+The data @fixtures live in the conftest.py, making them global
+to the modules in this folder.
+"""
+import numpy as np
+import os
+import pytest
+
+import minibench.data
+import minibench.readers
+
+
+def test_read_npy_header(npy_files):
+    for fpath in npy_files:
+        header = minibench.readers.read_npy_header(fpath)
+        arr = np.load(fpath, mmap_mode='r')
+        assert header.shape == arr.shape
+        assert header.dtype == arr.dtype
+        assert not header.fortran_order
+        assert header.offset == arr.offset
+
+
+@pytest.mark.parametrize("order", ['C', 'F'])
+@pytest.mark.parametrize("coalesce_bytes", [0, 65536])
+def test_npy_reader(workspace, order, coalesce_bytes):
+    arr = np.asarray(np.random.RandomState(1).normal(size=(7, 30, 9)),
+                     order=order)
+    fpath = os.path.join(workspace, "reader_{}.npy".format(order))
+    np.save(fpath, arr)
+
+    windows = [((0, 0, 0), (7, 30, 9)),
+               ((2, 5, 0), (3, 4, 9)),
+               ((1, 0, 0), (2, 30, 9)),
+               ((6, 29, 8), (1, 1, 1)),
+               ((3, 10, 2), (4, 1, 5))]
+    with minibench.readers.NpyReader(
+            fpath, coalesce_bytes=coalesce_bytes) as reader:
+        assert reader.fortran_order == (order == 'F')
+        for offset, shape in windows:
+            expected = arr[tuple([slice(o, o + n)
+                                  for o, n in zip(offset, shape)])]
+            np.testing.assert_array_equal(reader.read(offset, shape),
+                                          expected)
+
+        out = np.zeros((2, 2, 3, 4))
+        result = reader.read_many([(0, 0, 0), (5, 27, 5)], (2, 3, 4),
+                                  out=out)
+        assert result is out
+        np.testing.assert_array_equal(out[1], arr[5:7, 27:30, 5:9])
+
+        with pytest.raises(ValueError):
+            reader.read((6, 0, 0), (2, 1, 1))
+
+    with pytest.raises(ValueError):
+        reader.read((0, 0, 0), (1, 1, 1))
+
+
+def test_npy_reader_short_reads(npy_files, monkeypatch):
+    expected = np.load(npy_files[0])
+    preadv, pread = getattr(os, 'preadv', None), os.pread
+
+    # At most 7 bytes per call, as reads may return early.
+    def short_preadv(fd, buffers, offset):
+        return preadv(fd, [buffers[0][:7]], offset)
+
+    def short_pread(fd, nbytes, offset):
+        return pread(fd, min(nbytes, 7), offset)
+
+    if preadv is not None:
+        monkeypatch.setattr(os, 'preadv', short_preadv)
+    monkeypatch.setattr(os, 'pread', short_pread)
+    with minibench.readers.NpyReader(npy_files[0]) as reader:
+        np.testing.assert_array_equal(reader.read((2, 0), (5, 20)),
+                                      expected[2:7])
+
+        # Past the end of the file, there's nothing left to read.
+        view = memoryview(bytearray(64))
+        with pytest.raises(IOError):
+            minibench.readers._pread_into(
+                reader._fd, view, os.path.getsize(npy_files[0]) - 16)
+
+
+def test_slab(slab_file, npy_files):
+    with minibench.readers.Slab(slab_file) as slab:
+        assert len(slab) == len(npy_files)
+        keys = [minibench.data.filebase(fpath) for fpath in npy_files]
+        assert slab.keys() == keys
+        for key, npy_file in zip(keys, npy_files):
+            assert key in slab
+            arr = slab[key]
+            assert arr.ctypes.data % 64 == 0
+            np.testing.assert_array_equal(arr, np.load(npy_file))
+            np.testing.assert_array_equal(arr[3:7, 2:4],
+                                          np.load(npy_file)[3:7, 2:4])
+        with pytest.raises(KeyError):
+            slab['missing']
+    # Views outlive the slab, but it serves no new ones.
+    np.testing.assert_array_equal(arr, np.load(npy_files[-1]))
+    with pytest.raises(ValueError):
+        slab[keys[0]]
+
+
+def test_manifest(npy_files, workspace):
+    fpath = os.path.join(workspace, "test_manifest.npy")
+    minibench.data.npy_manifest(npy_files).save(fpath)
+    manifest = minibench.readers.Manifest.load(fpath)
+    assert len(manifest) == len(npy_files)
+    assert manifest.paths == npy_files
+
+    for npy_file, key in zip(npy_files, manifest.keys):
+        arr = np.load(npy_file)
+        assert npy_file in manifest and key in manifest
+        assert manifest.shape(key) == arr.shape
+        assert manifest.dtype(npy_file) == arr.dtype
+        assert manifest.header(npy_file) == \
+            minibench.readers.read_npy_header(npy_file)
+        np.testing.assert_array_equal(manifest.memmap(npy_file), arr)
+
+    np.testing.assert_array_equal(manifest.sizes(), 400)
+    with pytest.raises(KeyError):
+        manifest.row('not-an-item')
+
+
+def test_manifest_sizes():
+    manifest = minibench.readers.Manifest.from_rows(
+        [('a.npy', 'a', 128, 48, 'f8', False, (2, 3)),
+         ('b.npy', 'b', 128, 40, 'f8', False, (5,)),
+         ('c.npy', 'c', -1, 0, 'f8', False, (4, 0))])
+    np.testing.assert_array_equal(manifest.sizes(), [6, 5, 0])
+    np.testing.assert_array_equal(manifest.sizes(['c', 'a.npy']), [0, 6])
+    assert manifest.shape('b') == (5,)
+    with pytest.raises(ValueError):
+        manifest.memmap('c')
@@ -4,36 +4,76 @@ The data @fixtures live in the conftest.py, making them global
 to the modules in this folder.
 """
 import biggie
+import functools
 import h5py
 import numpy as np
+import os
+import pescador
 import pytest
 
+import minibench.cache
 import minibench.data
+import minibench.readers
 import minibench.samplers
 
 
-def __asseq(a, b):
-    assert a == b
-
-
-def test_random_slices():
-    n, m = 8, 5
+@pytest.mark.parametrize('arr_shape,slice_shape', [((40,), (3,)),
+                                                   ((8, 5), (3, 2))])
+def test_random_slices(arr_shape, slice_shape):
     max_count = 3
-    x = np.arange(n*m)
-    slice_shape = (3,)
+    x = np.arange(np.prod(arr_shape)).reshape(arr_shape)
     randomize_slices = minibench.samplers.random_slices(
         x.shape, slice_shape, max_count=max_count)
     for slices in randomize_slices:
         x_sub = x[slices]
-        yield __asseq, x_sub.shape, slice_shape
+        assert x_sub.shape == slice_shape
+
 
-    x = x.reshape(n, m)
+def test_random_offsets():
+    arr_shape = (8, 5)
     slice_shape = (3, 2)
-    randomize_slices = minibench.samplers.random_slices(
-        x.shape, slice_shape, max_count=max_count)
-    for slices in randomize_slices:
-        x_sub = x[slices]
-        yield __asseq, x_sub.shape, slice_shape
+    max_count = 100
+    blocks = list(minibench.samplers.random_offsets(
+        arr_shape, slice_shape, max_count=max_count, seed=123, block_size=32))
+
+    offsets = np.concatenate(blocks)
+    assert offsets.shape == (max_count, len(arr_shape))
+    assert max([len(block) for block in blocks]) <= 32
+    assert (offsets >= 0).all()
+    assert (offsets <= np.array(arr_shape) - np.array(slice_shape)).all()
+
+    # Seeded draws are reproducible.
+    offsets2 = np.concatenate(list(minibench.samplers.random_offsets(
+        arr_shape, slice_shape, max_count=max_count, seed=123,
+        block_size=32)))
+    np.testing.assert_array_equal(offsets, offsets2)
+
+    with pytest.raises(ValueError):
+        next(minibench.samplers.random_offsets((4, 4), (5, 1)))
+
+
+def test_count_slice_positions():
+    counts = minibench.samplers.count_slice_positions(
+        [(5, 4), (2, 9), (3, 3)], (3, 3))
+    np.testing.assert_array_equal(counts, [6, 0, 1])
+    # Every offset random_offsets can draw is counted.
+    offsets = np.concatenate(list(minibench.samplers.random_offsets(
+        (5, 4), (3, 3), max_count=1000, seed=0)))
+    assert len(set(map(tuple, offsets.tolist()))) == counts[0]
+
+
+def test_random_slices_match_offsets():
+    arr_shape = (8, 5)
+    slice_shape = (3, 2)
+    slices = list(minibench.samplers.random_slices(
+        arr_shape, slice_shape, max_count=20, seed=7))
+    offsets = np.concatenate(list(minibench.samplers.random_offsets(
+        arr_shape, slice_shape, max_count=20, seed=7)))
+
+    assert len(slices) == 20
+    for slc, offset in zip(slices, offsets):
+        assert [s.start for s in slc] == list(offset)
+        assert [s.stop - s.start for s in slc] == list(slice_shape)
 
 
 def test_touch_npy_load(npy_files):
@@ -126,6 +166,56 @@ def test_one_h5py_random_slice(h5py_file):
             assert rand_slice['X'].shape == slice_shape
 
 
+def test_dequantize():
+    values = np.arange(6, dtype=np.uint8).reshape(2, 3)
+    np.testing.assert_array_equal(
+        minibench.samplers.dequantize(values, 0.5, -1.0),
+        values * 0.5 - 1.0)
+
+    out = np.zeros((2, 3), dtype=np.float32)
+    result = minibench.samplers.dequantize(values, 2.0, out=out)
+    assert result is out
+    np.testing.assert_array_equal(out, values * 2)
+
+    # Slices of a QuantizedArray keep its scale and offset.
+    arr = minibench.samplers.QuantizedArray(values, 0.5, -1.0)
+    assert (arr[1:].scale, arr[1:].offset) == (0.5, -1.0)
+    assert arr.nbytes == values.nbytes
+
+
+def test_quantized_random_slices(npy_files, workspace):
+    npz_files = minibench.data.convert_npys_to_npzs(
+        npy_files, 'data', workspace, dtype=np.uint8)
+    h5py_file = os.path.join(workspace, "test_quantized_slices.hdf5")
+    minibench.data.convert_npys_to_h5py(npy_files, h5py_file,
+                                        dtype=np.uint8)
+    cache = minibench.cache.ArrayCache(max_bytes=2**20)
+    slice_shape = (3, 2)
+    for npy_file, npz_file in zip(npy_files, npz_files):
+        arr = np.load(npy_file)
+        tolerance = (arr.max() - arr.min()) / 255.
+        samplers = [
+            minibench.samplers.one_npz_random_slice(
+                npz_file, 'data', slice_shape, max_count=3, seed=1),
+            minibench.samplers.one_npz_random_slice(
+                npz_file, 'data', slice_shape, cache=cache, max_count=3,
+                seed=1, dtype=np.float32),
+            minibench.samplers.one_h5py_random_slice(
+                minibench.data.filebase(npy_file), h5py_file, slice_shape,
+                max_count=3, seed=1)]
+        slices = list(minibench.samplers.random_slices(
+            arr.shape, slice_shape, max_count=3, seed=1))
+        for sampler, dtype in zip(samplers, [np.float64, np.float32,
+                                             np.float64]):
+            for obs, expected in zip(sampler, slices):
+                assert obs['X'].dtype == dtype
+                assert type(obs['X']) is np.ndarray
+                np.testing.assert_allclose(obs['X'], arr[expected],
+                                           atol=tolerance)
+    # Quantized arrays are cached as stored.
+    assert cache.size == len(npz_files) * 400
+
+
 def test_one_biggie_random_slice(stash_file):
     max_count = 3
     field = 'data'
@@ -161,6 +251,74 @@ def test_mux_random_slice(npy_files):
         assert rand_slice['X'].shape == slice_shape
 
 
+class CountingList(list):
+    """List that counts item lookups."""
+    lookups = 0
+
+    def __getitem__(self, idx):
+        self.lookups += 1
+        return super(CountingList, self).__getitem__(idx)
+
+
+def shared_random_slice(item, shape, arr, **kwargs):
+    for new_slice in minibench.samplers.random_slices(arr.shape, shape,
+                                                      **kwargs):
+        yield {'X': arr[new_slice]}
+
+
+def test_lazy_streamers():
+    arr = np.arange(20).reshape(4, 5)
+    streamers = minibench.samplers.LazyStreamers(
+        shared_random_slice, range(10 ** 9), shape=(2, 2), arr=arr,
+        max_count=3)
+    assert len(streamers) == 10 ** 9
+    assert len(list(streamers[12345].generate())) == 3
+
+
+def test_mux_random_slice_lazy():
+    collec = CountingList(range(10 ** 5))
+    sampler = minibench.samplers.mux_random_slice(
+        sampler=shared_random_slice, collec=collec, shape=(2, 2),
+        working_size=2, lam=1, n_samples=20, arr=np.zeros((4, 5)))
+    assert len(list(sampler)) == 20
+    # Only the activated streamers were ever built.
+    assert 2 <= collec.lookups <= 20
+
+
+def test_seeded_mux():
+    arr = np.arange(400.).reshape(20, 20)
+    weights = np.arange(1., 11.)
+    for kwargs in [dict(), dict(with_replacement=False, revive=True),
+                   dict(with_replacement=False, pool_weights=weights)]:
+        streamers = minibench.samplers.LazyStreamers(
+            shared_random_slice, range(10), shape=(2, 2), arr=arr,
+            max_count=4, seed=1)
+        # The same draws as pescador.mux, from its own RNG.
+        np.random.seed(7)
+        expected = [obs['X'] for obs in pescador.mux(
+            streamers, n_samples=60, k=3, lam=2, **kwargs)]
+        np.random.seed(0)
+        actual = [obs['X'] for obs in minibench.samplers.seeded_mux(
+            streamers, n_samples=60, k=3, lam=2, random_state=7, **kwargs)]
+        assert len(actual) == len(expected) > 0
+        for x, y in zip(actual, expected):
+            np.testing.assert_array_equal(x, y)
+
+
+def test_mux_random_slice_random_state(npy_files):
+    def draw(random_state):
+        np.random.seed(None)
+        stream = minibench.samplers.mux_random_slice(
+            sampler=minibench.samplers.one_npy_random_slice,
+            collec=npy_files, shape=(3, 2), mmap_mode='r', working_size=2,
+            lam=3, n_samples=40, random_state=random_state)
+        return np.array([obs['X'] for obs in stream])
+
+    # The streamers' offsets are seeded from it too.
+    np.testing.assert_array_equal(draw(5), draw(5))
+    assert not np.array_equal(draw(5), draw(6))
+
+
 def test_zmq_random_slice(npy_files):
     slice_shape = (3, 2)
     sampler = minibench.samplers.zmq_random_slice(
@@ -171,3 +329,299 @@ def test_zmq_random_slice(npy_files):
     # Run the sampler to exhaustion.
     for rand_slice in sampler:
         assert rand_slice['X'].shape == slice_shape
+
+
+def test_fill_batches():
+    stream = ({'X': np.full((3, 2), n, dtype=float)} for n in range(7))
+    batches = minibench.samplers.fill_batches(stream, batch_size=3)
+
+    first = next(batches)
+    assert first['X'].shape == (3, 3, 2)
+    np.testing.assert_array_equal(first['X'][:, 0, 0], [0, 1, 2])
+
+    # Double-buffered: the first batch survives filling the second.
+    second = next(batches)
+    np.testing.assert_array_equal(second['X'][:, 0, 0], [3, 4, 5])
+    np.testing.assert_array_equal(first['X'][:, 0, 0], [0, 1, 2])
+
+    # ...and the partial tail batch reuses the first buffer.
+    last = next(batches)
+    assert last['X'].shape == (1, 3, 2)
+    assert np.shares_memory(last['X'], first['X'])
+    np.testing.assert_array_equal(last['X'][:, 0, 0], [6])
+
+    with pytest.raises(StopIteration):
+        next(batches)
+
+
+def test_mux_random_batch(npy_files):
+    slice_shape = (3, 2)
+    batch_size = 4
+    sampler = minibench.samplers.mux_random_batch(
+        sampler=minibench.samplers.one_npy_random_slice,
+        collec=npy_files, shape=slice_shape, batch_size=batch_size,
+        mmap_mode='r', max_count=3, with_replacement=False)
+
+    count = 0
+    for batch in sampler:
+        assert batch['X'].shape[1:] == slice_shape
+        assert batch['X'].shape[0] <= batch_size
+        count += len(batch['X'])
+
+    assert count == 3 * len(npy_files)
+
+
+def test_gather_slices():
+    shape = (3, 2)
+    x = np.arange(8 * 5).reshape(8, 5)
+    offsets = np.array([[0, 0], [5, 3], [2, 1], [5, 0]])
+    expected = np.array([x[r:r + 3, c:c + 2] for r, c in offsets])
+
+    # C-ordered, F-ordered and non-contiguous views of the same data.
+    strided = np.repeat(x, 2, axis=1)[:, ::2]
+    for arr in [x, np.asfortranarray(x), strided]:
+        result = minibench.samplers.gather_slices(arr, offsets, shape)
+        np.testing.assert_array_equal(result, expected)
+
+        # Large windows take the per-window path.
+        result = minibench.samplers.gather_slices(
+            arr, offsets, shape, max_window=1)
+        np.testing.assert_array_equal(result, expected)
+
+    out = np.zeros((len(offsets),) + shape, dtype=x.dtype)
+    result = minibench.samplers.gather_slices(x, offsets, shape, out=out)
+    assert result is out
+    np.testing.assert_array_equal(out[1], x[5:8, 3:5])
+
+    with pytest.raises(ValueError):
+        minibench.samplers.gather_slices(x, offsets, shape, out=out[:2])
+
+
+def test_one_npy_gather_random_slice(npy_files):
+    max_count = 5
+    slice_shape = (3, 2)
+
+    for fpath in npy_files:
+        sampler = minibench.samplers.one_npy_gather_random_slice(
+            fpath, slice_shape, mmap_mode='r', max_count=max_count, seed=11)
+        slices = minibench.samplers.random_slices(
+            (20, 20), slice_shape, max_count=max_count, seed=11)
+
+        arr = np.load(fpath)
+        count = 0
+        for rand_slice, slc in zip(sampler, slices):
+            assert rand_slice['X'].shape == slice_shape
+            np.testing.assert_array_equal(rand_slice['X'], arr[slc])
+            count += 1
+        assert count == max_count
+
+
+def test_one_npy_pread_random_slice(npy_files):
+    max_count = 5
+    slice_shape = (3, 2)
+
+    for fpath in npy_files:
+        sampler = minibench.samplers.one_npy_pread_random_slice(
+            fpath, slice_shape, max_count=max_count, seed=11)
+        slices = minibench.samplers.random_slices(
+            (20, 20), slice_shape, max_count=max_count, seed=11)
+
+        arr = np.load(fpath)
+        count = 0
+        for rand_slice, slc in zip(sampler, slices):
+            np.testing.assert_array_equal(rand_slice['X'], arr[slc])
+            count += 1
+        assert count == max_count
+
+
+def test_one_npz_random_slice_cache(npz_files):
+    cache = minibench.cache.ArrayCache(max_bytes=2**20)
+    slice_shape = (3, 2)
+    for fpath in npz_files[:2]:
+        for seed in [1, 2]:
+            slicer = minibench.samplers.one_npz_random_slice(
+                fpath, 'data', slice_shape, cache=cache, max_count=3,
+                seed=seed)
+            for rand_slice in slicer:
+                assert rand_slice['X'].shape == slice_shape
+
+    assert len(cache) == 2
+    assert cache.misses == 2
+    assert cache.hits == 2
+
+
+def test_samplers_with_pool(npy_files, npz_files):
+    slice_shape = (3, 2)
+    pools = [
+        (minibench.samplers.one_npy_random_slice, npy_files, {},
+         functools.partial(np.load, mmap_mode='r')),
+        (minibench.samplers.one_npy_pread_random_slice, npy_files, {},
+         minibench.readers.NpyReader),
+        (minibench.samplers.one_npz_random_slice, npz_files,
+         {'field': 'data'}, np.load)]
+
+    for sampler, collec, kwargs, opener in pools:
+        pool = minibench.cache.HandlePool(opener, max_open=2)
+        mux = minibench.samplers.mux_random_slice(
+            sampler=sampler, collec=collec, shape=slice_shape, pool=pool,
+            n_samples=50, working_size=3, lam=2, **kwargs)
+        for rand_slice in mux:
+            assert rand_slice['X'].shape == slice_shape
+
+        # At most `working_size` are pinned, and idle handles are trimmed.
+        assert len(pool) <= 3
+        assert pool.opens <= 50
+        pool.close()
+
+
+def test_one_h5py_random_slice_path(h5py_file):
+    slice_shape = (3, 2)
+    pool = minibench.cache.HandlePool(
+        functools.partial(h5py.File, mode='r'), max_open=1)
+    keys = list(h5py.File(h5py_file, 'r').keys())
+    for key in keys:
+        for fp_pool in [None, pool]:
+            sampler = minibench.samplers.one_h5py_random_slice(
+                key, h5py_file, slice_shape, pool=fp_pool, max_count=3)
+            for rand_slice in sampler:
+                assert rand_slice['X'].shape == slice_shape
+
+    assert pool.opens == 1
+    assert pool.hits == len(keys) - 1
+    pool.close()
+
+
+def test_one_slab_random_slice(slab_file):
+    slice_shape = (3, 2)
+    slab = minibench.readers.Slab(slab_file)
+    pool = minibench.cache.HandlePool(minibench.readers.Slab, max_open=1)
+    for key in slab.keys():
+        for slab_src, slab_pool in [(slab, None), (slab_file, None),
+                                    (slab_file, pool)]:
+            sampler = minibench.samplers.one_slab_random_slice(
+                key, slab_src, slice_shape, pool=slab_pool, max_count=3)
+            count = 0
+            for rand_slice in sampler:
+                assert rand_slice['X'].shape == slice_shape
+                count += 1
+            assert count == 3
+
+    assert pool.opens == 1
+    pool.close()
+
+
+def test_npy_samplers_with_manifest(npy_files):
+    slice_shape = (3, 2)
+    manifest = minibench.data.npy_manifest(npy_files)
+    for sampler in [minibench.samplers.one_npy_random_slice,
+                    minibench.samplers.one_npy_gather_random_slice,
+                    minibench.samplers.one_npy_pread_random_slice]:
+        for npy_file in npy_files:
+            kwargs = dict(max_count=3, seed=5)
+            if sampler is minibench.samplers.one_npy_random_slice:
+                kwargs.update(mmap_mode='r')
+            expected = [obs['X'].copy() for obs in
+                        sampler(npy_file, slice_shape, **kwargs)]
+            observed = [obs['X'].copy() for obs in
+                        sampler(npy_file, slice_shape, manifest=manifest,
+                                **kwargs)]
+            np.testing.assert_array_equal(observed, expected)
+
+
+def test_mux_random_slice_size_weights(workspace):
+    npy_files = minibench.data.create_npy_collection(
+        (4, 4), 1, workspace, seed=1)
+    npy_files += minibench.data.create_npy_collection(
+        (400, 4), 1, workspace, seed=2)
+    manifest = minibench.data.npy_manifest(npy_files)
+    np.random.seed(0)
+    stream = minibench.samplers.mux_random_slice(
+        sampler=minibench.samplers.one_npy_random_slice,
+        collec=npy_files, shape=(4, 4), working_size=2, lam=1,
+        n_samples=200, pool_weights='size', manifest=manifest,
+        with_replacement=False, revive=True, mmap_mode='r')
+    # Both items stay active, and the small one (its own only slice) holds
+    # 1% of the elements.
+    small = np.load(npy_files[0])
+    n_small = sum([np.array_equal(obs['X'], small) for obs in stream])
+    assert n_small < 20
+
+    with pytest.raises(ValueError):
+        minibench.samplers.mux_random_slice(
+            sampler=minibench.samplers.one_npy_random_slice,
+            collec=npy_files, shape=(4, 4), pool_weights='size')
+    # With replacement (the default), activations are uniform whatever the
+    # pool weights, so size weighting is refused.
+    with pytest.raises(ValueError):
+        minibench.samplers.mux_random_slice(
+            sampler=minibench.samplers.one_npy_random_slice,
+            collec=npy_files, shape=(4, 4), pool_weights='size',
+            manifest=manifest)
+
+
+def test_chunk_local_offsets():
+    arr_shape, slice_shape, chunks = (40, 30), (3, 2), (10, 8)
+    locality = 4
+    blocks = list(minibench.samplers.chunk_local_offsets(
+        arr_shape, slice_shape, chunks, locality=locality, max_count=50,
+        seed=3))
+    offsets = np.concatenate(blocks)
+
+    assert offsets.shape == (50, 2)
+    assert (offsets >= 0).all()
+    assert (offsets <= np.array(arr_shape) - slice_shape).all()
+    # Each group of `locality` offsets starts in the same chunk.
+    groups = (offsets // chunks)[:48].reshape(-1, locality, 2)
+    assert (groups == groups[:, :1]).all()
+
+    aligned = np.concatenate(list(minibench.samplers.chunk_local_offsets(
+        arr_shape, slice_shape, chunks, align=True, max_count=50, seed=3)))
+    assert (aligned % chunks == 0).all()
+
+
+def test_read_chunked(workspace):
+    fpath = os.path.join(workspace, "test_read_chunked.hdf5")
+    arr = np.random.RandomState(5).normal(size=(37, 23))
+    with h5py.File(fpath, 'w') as fhandle:
+        fhandle.create_dataset('x', data=arr, chunks=(10, 6),
+                               compression='lzf')
+
+    cache = minibench.cache.ArrayCache(2**20)
+    with h5py.File(fpath, 'r') as fhandle:
+        dset = fhandle['x']
+        for offset, shape in [((0, 0), (37, 23)), ((9, 5), (2, 2)),
+                              ((30, 20), (7, 3)), ((12, 7), (3, 4))]:
+            window = minibench.samplers.read_chunked(dset, offset, shape,
+                                                     cache)
+            np.testing.assert_array_equal(
+                window, arr[offset[0]:offset[0] + shape[0],
+                            offset[1]:offset[1] + shape[1]])
+
+    # The first, full read decoded every chunk; the rest were all hits.
+    assert cache.misses == 4 * 4
+    assert len(cache) == 16
+
+
+def test_one_h5py_chunked_random_slice(workspace, npy_files):
+    fpath = os.path.join(workspace, "test_h5py_chunked_sampler.hdf5")
+    minibench.data.convert_npys_to_h5py(npy_files, fpath, chunks=(10, 10),
+                                        compression='gzip')
+    slice_shape = (3, 2)
+
+    cache = minibench.cache.ArrayCache(2**20)
+    fp = h5py.File(fpath, 'r')
+    for key in fp:
+        sampler = minibench.samplers.one_h5py_chunked_random_slice(
+            key, fp, slice_shape, cache=cache, locality=5, max_count=10)
+        for rand_slice in sampler:
+            assert rand_slice['X'].shape == slice_shape
+
+    assert cache.hits > cache.misses
+
+    # Contiguous datasets are read directly.
+    contiguous = os.path.join(workspace, "test_h5py_contiguous.hdf5")
+    minibench.data.convert_npys_to_h5py(npy_files, contiguous)
+    key = minibench.data.filebase(npy_files[0])
+    sampler = minibench.samplers.one_h5py_chunked_random_slice(
+        key, contiguous, slice_shape, max_count=3)
+    assert [obs['X'].shape for obs in sampler] == [slice_shape] * 3
@@ -0,0 +1,108 @@
+import h5py
+import numpy as np
+import pickle
+import pytest
+import threading
+import time
+
+import minibench.cache
+import minibench.samplers
+import minibench.storage
+
+
+def test_emulated_storage_latency():
+    storage = minibench.storage.EmulatedStorage(
+        open_latency=0.02, read_latency=0.01, request_size=100)
+    start = time.time()
+    storage.charge_open()
+    storage.charge_read(250)
+    # One open, and a read split into three requests.
+    assert time.time() - start >= 0.02 + 3 * 0.01
+    assert (storage.opens, storage.requests, storage.bytes_read) == \
+        (1, 3, 250)
+
+    storage.reset()
+    assert (storage.opens, storage.requests, storage.bytes_read) == \
+        (0, 0, 0)
+
+
+def test_emulated_storage_bandwidth():
+    storage = minibench.storage.EmulatedStorage(bandwidth=1e6)
+    threads = [threading.Thread(target=storage.charge_read, args=(10000,))
+               for _ in range(4)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Concurrent reads share the bandwidth.
+    assert time.time() - start >= 4 * 10000 / 1e6
+
+
+def test_emulated_storage_pickle():
+    storage = minibench.storage.EmulatedStorage(open_latency=0.01)
+    storage.charge_open()
+    clone = pickle.loads(pickle.dumps(storage))
+    assert clone.open_latency == 0.01
+    assert clone.opens == 0
+    clone.charge_open()
+
+
+def test_emulated_file(npy_files):
+    storage = minibench.storage.EmulatedStorage()
+    with storage.open(npy_files[0]) as fhandle:
+        data = fhandle.read()
+        fhandle.seek(0)
+        assert fhandle.read(6) == data[:6]
+    assert fhandle.closed
+    with open(npy_files[0], 'rb') as fhandle:
+        assert data == fhandle.read()
+    assert storage.opens == 1
+    assert storage.bytes_read == len(data) + 6
+
+
+def test_emulated_storage_openers(npy_files, npz_files, h5py_file):
+    storage = minibench.storage.EmulatedStorage()
+    expected = np.load(npy_files[0])
+    np.testing.assert_array_equal(storage.load_npy(npy_files[0]), expected)
+
+    archive = storage.open_npz(npz_files[0])
+    np.testing.assert_array_equal(archive['data'], expected)
+    fhandle = archive.fid
+    archive.close()
+    assert fhandle.closed
+
+    with storage.open_h5py(h5py_file) as fp:
+        assert len(fp.keys()) == len(npy_files)
+
+    with storage.open_npy_reader(npy_files[0]) as reader:
+        np.testing.assert_array_equal(reader.read((2, 3), (4, 5)),
+                                      expected[2:6, 3:8])
+    assert storage.opens == 4
+    assert storage.bytes_read > 0
+
+
+@pytest.mark.parametrize(
+    "sampler,opener,collec,kwargs",
+    [(minibench.samplers.one_npy_random_slice, 'load_npy', 'npy', {}),
+     (minibench.samplers.one_npy_pread_random_slice, 'open_npy_reader',
+      'npy', {}),
+     (minibench.samplers.one_npz_random_slice, 'open_npz', 'npz',
+      dict(field='data')),
+     (minibench.samplers.one_h5py_random_slice, 'open_h5py', 'h5py', {})])
+def test_samplers_emulated_storage(npy_files, npz_files, h5py_file,
+                                   sampler, opener, collec, kwargs):
+    storage = minibench.storage.EmulatedStorage(read_latency=1e-4)
+    pool = minibench.cache.HandlePool(getattr(storage, opener))
+    if collec == 'h5py':
+        with h5py.File(h5py_file, 'r') as fp:
+            collec = list(fp.keys())
+        kwargs = dict(fp=h5py_file)
+    else:
+        collec = dict(npy=npy_files, npz=npz_files)[collec]
+
+    stream = minibench.samplers.mux_random_slice(
+        sampler, collec, (5, 5), n_samples=20, pool=pool, **kwargs)
+    assert all([obs['X'].shape == (5, 5) for obs in stream])
+    assert storage.opens > 0
+    assert storage.requests > 0
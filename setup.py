@@ -21,19 +21,21 @@ setup(
         "License :: OSI Approved :: ISC License (ISCL)",
         "Programming Language :: Python",
         "Intended Audience :: Developers",
-        "Programming Language :: Python :: 2",
-        "Programming Language :: Python :: 2.7",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.5"
+        "Programming Language :: Python :: 3 :: Only",
+        "Programming Language :: Python :: 3.8",
+        "Programming Language :: Python :: 3.9",
+        "Programming Language :: Python :: 3.10",
+        "Programming Language :: Python :: 3.11"
     ],
     keywords='data',
     license='ISC',
+    python_requires='>=3.8',
     install_requires=[
-        'numpy >= 1.8.0',
+        'numpy >= 1.17.0',
         'pescador >= 0.1.2',
         'pytest',
         'pytest-benchmark',
-        'pandas >= 0.16.0',
-        'six'
+        'pandas >= 0.16.0'
     ]
 )
@@ -81,13 +81,31 @@ def zmq_sampler_params(benchmark, npys_params):
     return sampler, params
 
 
-def run_theano_fx(train_fx, sampler):
+@pytest.fixture
+def shm_sampler_params(benchmark, npys_params):
+    npy_files, params = npys_params
+
+    sampler = minibench.parallel.shm_random_slice(
+        sampler=minibench.samplers.one_npy_random_slice,
+        collec=npy_files,
+        shape=params['slice'],
+        n_samples=100,
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True)
+    yield sampler, params
+    # Stop the worker, and release the shared memory, with the test.
+    sampler.close()
+
+
+def run_theano_fx(train_fx, sampler, copy=True):
     """Make some data and make sure the function runs"""
     errs = []
     for sample in sampler:
-        # the np.array is required here because pescador is producing
-        # unaligned numpy arrays :(
-        errs += [train_fx(np.array(sample['X']))]
+        # The copy is required for samplers producing unaligned numpy
+        # arrays, like pescador's zmq stream :(
+        X = np.array(sample['X']) if copy else sample['X']
+        errs += [train_fx(X)]
     return np.mean(errs)
 
 
@@ -100,16 +118,20 @@ def test_pescador_same_thread(benchmark, npy_sampler_params):
     assert benchmark(run_theano_fx, train_fx, sampler)
 
 
-def test_zmq_sampling_no_copy(benchmark, zmq_sampler_params):
+def test_zmq_sampling_copy(benchmark, zmq_sampler_params):
     sampler, params = zmq_sampler_params
 
     train_fx = theano_test_fx(n_dots=5, w_shape=(params['slice'][-1],)*2)
 
     # run_theano_fx(train_fx, sampler, weights)
-    # Forcing a copy in the run_ function, so this is actually
-    #  doing the copy all the time, even though this says no copy.
-    assert benchmark(run_theano_fx, train_fx, sampler)
+    assert benchmark(run_theano_fx, train_fx, sampler, copy=True)
+
+
+def test_shm_sampling_no_copy(benchmark, shm_sampler_params):
+    sampler, params = shm_sampler_params
+
+    train_fx = theano_test_fx(n_dots=5, w_shape=(params['slice'][-1],)*2)
 
+    # Arrays from shared memory are aligned and C-contiguous already.
+    assert benchmark(run_theano_fx, train_fx, sampler, copy=False)
 
-# def test_zmq_sampling_copy():
-#     pass
@@ -21,10 +21,14 @@ for to successfully generate a json output file.
   $ py.test -vs testbench_performance.py --benchmark-save=bench1
 """
 import biggie
+import functools
 import h5py
+import itertools
 import logging
+import numpy as np
 import os
 import pytest
+import zipfile
 
 import minibench
 
@@ -53,7 +57,7 @@ def test_npy_load(benchmark, npys_params):
         working_size=params['working_size'],
         with_replacement=True)
     obs = benchmark(next, sampler)
-    assert obs.shape == tuple(params['slice'])
+    assert obs['X'].shape == tuple(params['slice'])
 
 
 def test_npy_memmap(benchmark, npys_params):
@@ -70,7 +74,7 @@ def test_npy_memmap(benchmark, npys_params):
         mmap_mode='r')
 
     obs = benchmark(next, sampler)
-    assert obs.shape == tuple(params['slice'])
+    assert obs['X'].shape == tuple(params['slice'])
 
 
 def test_npz_load(benchmark, npzs_params):
@@ -87,17 +91,17 @@ def test_npz_load(benchmark, npzs_params):
         field='data')
 
     obs = benchmark(next, sampler)
-    assert obs.shape == tuple(params['slice'])
+    assert obs['X'].shape == tuple(params['slice'])
 
 
 def test_h5py(benchmark, h5py_params):
     h5py_file, params = h5py_params
     logging.debug("\nWorkspace: {}".format(os.path.dirname(h5py_file)))
 
-    fp = h5py.File(h5py_file)
+    fp = h5py.File(h5py_file, 'r')
     sampler = minibench.samplers.mux_random_slice(
         sampler=minibench.samplers.one_h5py_random_slice,
-        collec=fp.keys(),
+        collec=list(fp.keys()),
         shape=params['slice'],
         n_samples=None,
         lam=params['lam'],
@@ -106,7 +110,26 @@ def test_h5py(benchmark, h5py_params):
         fp=fp)
 
     obs = benchmark(next, sampler)
-    assert obs.shape == tuple(params['slice'])
+    assert obs['X'].shape == tuple(params['slice'])
+
+
+def test_slab(benchmark, slab_params):
+    slab_file, params = slab_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(slab_file)))
+
+    slab = minibench.readers.Slab(slab_file)
+    sampler = minibench.samplers.mux_random_slice(
+        sampler=minibench.samplers.one_slab_random_slice,
+        collec=slab.keys(),
+        shape=params['slice'],
+        n_samples=None,
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True,
+        slab=slab)
+
+    obs = benchmark(next, sampler)
+    assert obs['X'].shape == tuple(params['slice'])
 
 
 def test_biggie(benchmark, stash_params):
@@ -126,4 +149,517 @@ def test_biggie(benchmark, stash_params):
         field='data')
 
     obs = benchmark(next, sampler)
+    assert obs['X'].shape == tuple(params['slice'])
+
+
+def test_npy_memmap_batch(benchmark, npys_params):
+    npy_files, params = npys_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npy_files[0])))
+    batch_size = 32
+    sampler = minibench.samplers.mux_random_batch(
+        sampler=minibench.samplers.one_npy_random_slice,
+        collec=npy_files,
+        shape=params['slice'],
+        batch_size=batch_size,
+        n_samples=None,
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True,
+        mmap_mode='r')
+
+    batch = benchmark(next, sampler)
+    assert batch['X'].shape == (batch_size,) + tuple(params['slice'])
+
+
+def test_npy_memmap_gather(benchmark, npys_params):
+    npy_files, params = npys_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npy_files[0])))
+    sampler = minibench.samplers.mux_random_slice(
+        sampler=minibench.samplers.one_npy_gather_random_slice,
+        collec=npy_files,
+        shape=params['slice'],
+        n_samples=None,
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True,
+        mmap_mode='r')
+
+    obs = benchmark(next, sampler)
+    assert obs['X'].shape == tuple(params['slice'])
+
+
+def test_npy_pread(benchmark, npys_params):
+    npy_files, params = npys_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npy_files[0])))
+    sampler = minibench.samplers.mux_random_slice(
+        sampler=minibench.samplers.one_npy_pread_random_slice,
+        collec=npy_files,
+        shape=params['slice'],
+        n_samples=None,
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True)
+
+    obs = benchmark(next, sampler)
+    assert obs['X'].shape == tuple(params['slice'])
+
+
+def test_npy_memmap_manifest(benchmark, npys_params):
+    npy_files, params = npys_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npy_files[0])))
+    manifest = minibench.data.npy_manifest(npy_files)
+    sampler = minibench.samplers.mux_random_slice(
+        sampler=minibench.samplers.one_npy_random_slice,
+        collec=manifest.paths,
+        shape=params['slice'],
+        n_samples=None,
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True,
+        manifest=manifest,
+        mmap_mode='r')
+
+    obs = benchmark(next, sampler)
+    assert obs['X'].shape == tuple(params['slice'])
+
+
+def test_npz_load_cached(benchmark, npzs_params):
+    npz_files, params = npzs_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npz_files[0])))
+    sampler = minibench.samplers.mux_random_slice(
+        sampler=minibench.samplers.one_npz_random_slice,
+        collec=npz_files,
+        shape=params['slice'],
+        n_samples=None,
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True,
+        field='data',
+        cache=minibench.cache.ArrayCache(max_bytes=512 * 2**20))
+
+    obs = benchmark(next, sampler)
+    assert obs['X'].shape == tuple(params['slice'])
+
+
+def test_npy_memmap_pooled(benchmark, npys_params):
+    npy_files, params = npys_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npy_files[0])))
+    pool = minibench.cache.HandlePool(
+        functools.partial(np.load, mmap_mode='r'), max_open=64)
+    sampler = minibench.samplers.mux_random_slice(
+        sampler=minibench.samplers.one_npy_random_slice,
+        collec=npy_files,
+        shape=params['slice'],
+        n_samples=None,
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True,
+        pool=pool)
+
+    obs = benchmark(next, sampler)
+    assert obs['X'].shape == tuple(params['slice'])
+    pool.close()
+
+
+def test_h5py_chunked(benchmark, h5py_chunked_params):
+    h5py_file, params = h5py_chunked_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(h5py_file)))
+
+    fp = h5py.File(h5py_file, 'r')
+    sampler = minibench.samplers.mux_random_slice(
+        sampler=minibench.samplers.one_h5py_random_slice,
+        collec=list(fp.keys()),
+        shape=params['slice'],
+        n_samples=None,
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True,
+        fp=fp)
+
+    obs = benchmark(next, sampler)
+    assert obs['X'].shape == tuple(params['slice'])
+
+
+@pytest.mark.parametrize("locality", [1, 8])
+def test_h5py_chunk_cached(benchmark, h5py_chunked_params, locality):
+    h5py_file, params = h5py_chunked_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(h5py_file)))
+
+    fp = h5py.File(h5py_file, 'r')
+    sampler = minibench.samplers.mux_random_slice(
+        sampler=minibench.samplers.one_h5py_chunked_random_slice,
+        collec=list(fp.keys()),
+        shape=params['slice'],
+        n_samples=None,
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True,
+        fp=fp,
+        cache=minibench.cache.ArrayCache(max_bytes=256 * 2**20),
+        locality=locality)
+
+    obs = benchmark(next, sampler)
+    assert obs['X'].shape == tuple(params['slice'])
+
+
+@pytest.mark.parametrize("n_workers", [1, 2, 4])
+def test_npy_memmap_processes(benchmark, npys_params, n_workers):
+    npy_files, params = npys_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npy_files[0])))
+    sampler = minibench.parallel.process_random_slice(
+        sampler=minibench.samplers.one_npy_random_slice,
+        collec=npy_files,
+        shape=params['slice'],
+        n_workers=n_workers,
+        n_samples=None,
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True,
+        mmap_mode='r')
+
+    obs = benchmark(next, sampler)
+    assert obs['X'].shape == tuple(params['slice'])
+    sampler.close()
+
+
+WORKER_MODES = [('threads', 1), ('threads', 4),
+                ('processes', 1), ('processes', 4)]
+
+
+def _parallel_sampler(mode, n_workers, **kwargs):
+    if mode == 'threads':
+        return minibench.parallel.threaded_random_slice(
+            n_threads=n_workers, **kwargs)
+    return minibench.parallel.process_random_slice(
+        n_workers=n_workers, **kwargs)
+
+
+@pytest.mark.parametrize("mode,n_workers", WORKER_MODES)
+def test_npy_pread_parallel(benchmark, npys_params, mode, n_workers):
+    npy_files, params = npys_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npy_files[0])))
+    sampler = _parallel_sampler(
+        mode, n_workers,
+        sampler=minibench.samplers.one_npy_pread_random_slice,
+        collec=npy_files,
+        shape=params['slice'],
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True)
+
+    obs = benchmark(next, sampler)
+    assert obs['X'].shape == tuple(params['slice'])
+    sampler.close()
+
+
+@pytest.mark.parametrize("mode,n_workers", WORKER_MODES)
+def test_npy_memmap_parallel(benchmark, npys_params, mode, n_workers):
+    npy_files, params = npys_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npy_files[0])))
+    sampler = _parallel_sampler(
+        mode, n_workers,
+        sampler=minibench.samplers.one_npy_random_slice,
+        collec=npy_files,
+        shape=params['slice'],
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True,
+        mmap_mode='r')
+
+    obs = benchmark(next, sampler)
+    assert obs['X'].shape == tuple(params['slice'])
+    sampler.close()
+
+
+@pytest.mark.parametrize("mode,n_workers", WORKER_MODES)
+def test_npz_load_parallel(benchmark, npzs_params, mode, n_workers):
+    npz_files, params = npzs_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npz_files[0])))
+    sampler = _parallel_sampler(
+        mode, n_workers,
+        sampler=minibench.samplers.one_npz_random_slice,
+        collec=npz_files,
+        shape=params['slice'],
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True,
+        field='data')
+
+    obs = benchmark(next, sampler)
+    assert obs['X'].shape == tuple(params['slice'])
+    sampler.close()
+
+
+@pytest.mark.parametrize("mode,n_workers", WORKER_MODES)
+def test_h5py_parallel(benchmark, h5py_params, mode, n_workers):
+    h5py_file, params = h5py_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(h5py_file)))
+    with h5py.File(h5py_file, 'r') as fp:
+        keys = list(fp.keys())
+
+    # Open handles can't be shared with other processes, so every worker
+    # opens the file by path.
+    sampler = _parallel_sampler(
+        mode, n_workers,
+        sampler=minibench.samplers.one_h5py_random_slice,
+        collec=keys,
+        shape=params['slice'],
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True,
+        fp=h5py_file)
+
+    obs = benchmark(next, sampler)
+    assert obs['X'].shape == tuple(params['slice'])
+    sampler.close()
+
+
+TRANSPORTS = {'zmq': minibench.samplers.zmq_random_slice,
+              'shm': minibench.parallel.shm_random_slice}
+
+
+@pytest.mark.parametrize("transport", sorted(TRANSPORTS))
+def test_npy_memmap_transport(benchmark, npys_params, transport):
+    npy_files, params = npys_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npy_files[0])))
+    sampler = TRANSPORTS[transport](
+        sampler=minibench.samplers.one_npy_random_slice,
+        collec=npy_files,
+        shape=params['slice'],
+        n_samples=None,
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True,
+        mmap_mode='r')
+
+    # Make the observation usable as-is by numerical code; a no-op for
+    # arrays arriving aligned and contiguous.
+    obs = benchmark(lambda: np.require(next(sampler)['X'],
+                                       requirements=['A', 'C']))
     assert obs.shape == tuple(params['slice'])
+    sampler.close()
+
+
+PLAN_SIZE = 1024
+
+
+def plan_random_slice(item, shape, shapes, **kwargs):
+    """Plan slices of an item without reading it, to isolate mux overhead."""
+    for offsets in minibench.samplers.random_offsets(shapes[item], shape,
+                                                     **kwargs):
+        for offset in offsets:
+            yield item, offset
+
+
+def test_mux_overhead_pescador(benchmark, npys_params):
+    npy_files, params = npys_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npy_files[0])))
+    manifest = minibench.data.npy_manifest(npy_files)
+    stream = minibench.samplers.mux_random_slice(
+        sampler=plan_random_slice,
+        collec=range(len(npy_files)),
+        shape=params['slice'],
+        n_samples=None,
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True,
+        shapes=[manifest.shape(fpath) for fpath in npy_files])
+
+    plans = benchmark(lambda: list(itertools.islice(stream, PLAN_SIZE)))
+    assert len(plans) == PLAN_SIZE
+
+
+def test_mux_overhead_engine(benchmark, npys_params):
+    npy_files, params = npys_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npy_files[0])))
+    manifest = minibench.data.npy_manifest(npy_files)
+    engine = minibench.mux.MuxEngine(
+        [manifest.shape(fpath) for fpath in npy_files],
+        params['slice'],
+        working_size=params['working_size'],
+        lam=params['lam'],
+        with_replacement=True)
+
+    items, offsets = benchmark(engine.next_block, PLAN_SIZE)
+    assert len(items) == PLAN_SIZE
+
+
+def test_npy_memmap_vmux(benchmark, npys_params):
+    npy_files, params = npys_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npy_files[0])))
+    sampler = minibench.mux.vmux_random_slice(
+        collec=npy_files,
+        shape=params['slice'],
+        manifest=minibench.data.npy_manifest(npy_files),
+        n_samples=None,
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True)
+
+    obs = benchmark(next, sampler)
+    assert obs['X'].shape == tuple(params['slice'])
+
+
+def shared_random_slice(item, shape, arr, **kwargs):
+    """Slice one shared array for every item, to isolate mux startup."""
+    for new_slice in minibench.samplers.random_slices(arr.shape, shape,
+                                                      **kwargs):
+        yield {'X': arr[new_slice]}
+
+
+@pytest.mark.parametrize("num_items", [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6])
+def test_mux_startup(benchmark, num_items):
+    arr = np.zeros((64, 64))
+    collec = np.arange(num_items)
+
+    def startup():
+        sampler = minibench.samplers.mux_random_slice(
+            sampler=shared_random_slice,
+            collec=collec,
+            shape=(16, 16),
+            n_samples=None,
+            lam=1,
+            working_size=1,
+            with_replacement=True,
+            arr=arr)
+        return next(sampler)
+
+    obs = benchmark(startup)
+    assert obs['X'].shape == (16, 16)
+
+
+SELECTORS = {
+    'choice': lambda rng, weights: lambda: rng.choice(
+        len(weights), p=weights / weights.sum()),
+    'alias': lambda rng, weights: functools.partial(
+        minibench.mux.AliasTable(weights).draw, rng)}
+
+
+@pytest.mark.parametrize("selector", sorted(SELECTORS))
+@pytest.mark.parametrize("num_items", [10 ** 3, 10 ** 6])
+def test_weighted_selection(benchmark, selector, num_items):
+    rng = np.random.RandomState(0)
+    weights = rng.pareto(1.0, size=num_items) + 1
+    select = SELECTORS[selector](rng, weights)
+
+    item = benchmark(select)
+    assert 0 <= item < num_items
+
+
+def test_npy_memmap_vmux_positions(benchmark, npys_params):
+    npy_files, params = npys_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npy_files[0])))
+    sampler = minibench.mux.vmux_random_slice(
+        collec=npy_files,
+        shape=params['slice'],
+        manifest=minibench.data.npy_manifest(npy_files),
+        n_samples=None,
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True,
+        item_weights='positions')
+
+    obs = benchmark(next, sampler)
+    assert obs['X'].shape == tuple(params['slice'])
+
+
+@pytest.mark.parametrize("sort_blocks", [False, True])
+def test_npy_memmap_epoch(benchmark, npys_params, sort_blocks):
+    npy_files, params = npys_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npy_files[0])))
+    sampler = minibench.epoch.epoch_random_slice(
+        collec=npy_files,
+        shape=params['slice'],
+        manifest=minibench.data.npy_manifest(npy_files),
+        n_epochs=None,
+        sort_blocks=sort_blocks)
+
+    obs = benchmark(next, sampler)
+    assert obs['X'].shape == tuple(params['slice'])
+
+
+def report_throughput(benchmark, stored_bytes, served_bytes):
+    """Record samples/s, and the MB/s of sample data that makes both as
+    stored on disk and as served, in the benchmark's extra_info."""
+    if benchmark.stats is None:
+        return
+    samples_per_s = 1.0 / benchmark.stats.stats.mean
+    benchmark.extra_info['samples_per_s'] = samples_per_s
+    benchmark.extra_info['stored_MB_per_s'] = \
+        samples_per_s * stored_bytes / 1e6
+    benchmark.extra_info['served_MB_per_s'] = \
+        samples_per_s * served_bytes / 1e6
+
+
+def stored_nbytes(obs, dtype, compression_ratio=1.0):
+    """Size on disk of an observation's data, stored in `dtype` (float64 if
+    None) and compressed by `compression_ratio` (on-disk over raw size)."""
+    return obs['X'].size * np.dtype(dtype or np.float64).itemsize * \
+        compression_ratio
+
+
+def npz_compression_ratio(npz_files, field):
+    """On-disk over raw size of `field` in a collection of NPZ files."""
+    on_disk, raw = 0, 0
+    for fpath in npz_files:
+        with zipfile.ZipFile(fpath) as archive:
+            info = archive.getinfo('{}.npy'.format(field))
+        on_disk += info.compress_size
+        raw += info.file_size
+    return float(on_disk) / raw
+
+
+def h5py_compression_ratio(fp):
+    """On-disk over raw size of the datasets in an open HDF5 file."""
+    on_disk, raw = 0, 0
+    for key in fp.keys():
+        dset = fp[key]
+        on_disk += dset.id.get_storage_size()
+        raw += dset.size * dset.dtype.itemsize
+    return float(on_disk) / raw
+
+
+def test_npz_load_storage(benchmark, npz_storage_params):
+    npz_files, params = npz_storage_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npz_files[0])))
+    sampler = minibench.samplers.mux_random_slice(
+        sampler=minibench.samplers.one_npz_random_slice,
+        collec=npz_files,
+        field='data',
+        shape=params['slice'],
+        n_samples=None,
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True)
+
+    ratio = npz_compression_ratio(npz_files, 'data')
+    benchmark.extra_info['compression_ratio'] = ratio
+    obs = benchmark(next, sampler)
+    report_throughput(benchmark, stored_nbytes(obs, params['dtype'], ratio),
+                      obs['X'].nbytes)
+    assert obs['X'].shape == tuple(params['slice'])
+    assert obs['X'].dtype == np.float64
+
+
+def test_h5py_storage(benchmark, h5py_storage_params):
+    h5py_file, params = h5py_storage_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(h5py_file)))
+
+    fp = h5py.File(h5py_file, 'r')
+    sampler = minibench.samplers.mux_random_slice(
+        sampler=minibench.samplers.one_h5py_random_slice,
+        collec=list(fp.keys()),
+        shape=params['slice'],
+        n_samples=None,
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True,
+        fp=fp)
+
+    ratio = h5py_compression_ratio(fp)
+    benchmark.extra_info['compression_ratio'] = ratio
+    obs = benchmark(next, sampler)
+    report_throughput(benchmark, stored_nbytes(obs, params['dtype'], ratio),
+                      obs['X'].nbytes)
+    assert obs['X'].shape == tuple(params['slice'])
+    assert obs['X'].dtype == np.float64
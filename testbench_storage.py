@@ -0,0 +1,141 @@
+"""Throughput of the sampling backends as storage latency grows.
+
+Every backend reads its collection through a `minibench.storage`
+`EmulatedStorage`, which delays each open and each read request by a given
+latency and caps the bandwidth. Samples are drawn on the consumer's thread
+('none'), or prefetched by a few threads whose reads overlap ('threads', see
+`minibench.parallel.threaded_random_slice`). Each round opens its files
+afresh. The latency and prefetch strategy are recorded in each benchmark's
+extra_info, next to the throughput (see `minibench.bench`) and the opens,
+read requests and MB read in the last round.
+
+Memory-mapped backends (NPY memmaps, slabs) are left out: their reads are
+page faults, which can't be delayed from Python.
+
+Sample Calls
+------------
+Run the suite, saving the results for `minibench.parse`...
+
+  $ py.test -vs testbench_storage.py --benchmark-save=storage
+
+...and then compare how each backend and strategy holds up.
+
+  > df = minibench.parse.last_benchmark().to_df()
+  > df.pivot_table('samples_per_s', index=['name', 'prefetch'],
+  >                columns='latency_s')
+"""
+import h5py
+import logging
+import os
+import pytest
+
+import minibench
+
+# Seconds of latency per open, and per read request.
+LATENCIES = [0.0, 1e-3, 1e-2]
+# Bytes per second.
+BANDWIDTH = 200e6
+PREFETCH = ['none', 'threads']
+N_THREADS = 4
+N_DRAWS = 64
+ROUNDS = 3
+
+
+@pytest.fixture(params=LATENCIES, ids=["{}s".format(x) for x in LATENCIES])
+def storage(request, benchmark):
+    """Emulated storage with the given latency, recorded in the
+    benchmark's extra_info."""
+    benchmark.extra_info.update(latency_s=request.param,
+                                bandwidth_MB_per_s=BANDWIDTH / 1e6)
+    return minibench.storage.EmulatedStorage(
+        open_latency=request.param, read_latency=request.param,
+        bandwidth=BANDWIDTH)
+
+
+@pytest.fixture(params=PREFETCH)
+def prefetch(request, benchmark):
+    benchmark.extra_info['prefetch'] = request.param
+    return request.param
+
+
+def benchmark_storage(benchmark, storage, opener, prefetch, sampler, collec,
+                      params, **kwargs):
+    """Benchmark the throughput of `sampler` over `collec`, opening every
+    item with `opener`, a method of `storage`, through a fresh pool each
+    round."""
+    pools = []
+
+    def close_pools():
+        while pools:
+            pools.pop().close()
+
+    def before_round():
+        close_pools()
+        storage.reset()
+
+    def make_stream():
+        pools.append(minibench.cache.HandlePool(getattr(storage, opener)))
+        stream_kwargs = dict(
+            kwargs, sampler=sampler, collec=collec, shape=params['slice'],
+            n_samples=None, lam=params['lam'],
+            working_size=params['working_size'], with_replacement=True,
+            pool=pools[-1])
+        if prefetch == 'threads':
+            return minibench.parallel.threaded_random_slice(
+                n_threads=N_THREADS, **stream_kwargs)
+        return minibench.samplers.mux_random_slice(**stream_kwargs)
+
+    try:
+        minibench.bench.benchmark_throughput(
+            benchmark, make_stream, N_DRAWS, rounds=ROUNDS,
+            before_round=before_round)
+    finally:
+        close_pools()
+    benchmark.extra_info.update(opens=storage.opens,
+                                requests=storage.requests,
+                                MB_read=storage.bytes_read / 1e6)
+
+
+def test_npy_load_storage(benchmark, npys_params, storage, prefetch):
+    npy_files, params = npys_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npy_files[0])))
+    benchmark_storage(benchmark, storage, 'load_npy', prefetch,
+                      minibench.samplers.one_npy_random_slice,
+                      npy_files, params)
+
+
+def test_npy_pread_storage(benchmark, npys_params, storage, prefetch):
+    npy_files, params = npys_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npy_files[0])))
+    benchmark_storage(benchmark, storage, 'open_npy_reader', prefetch,
+                      minibench.samplers.one_npy_pread_random_slice,
+                      npy_files, params)
+
+
+def test_npz_load_storage(benchmark, npzs_params, storage, prefetch):
+    npz_files, params = npzs_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npz_files[0])))
+    benchmark_storage(benchmark, storage, 'open_npz', prefetch,
+                      minibench.samplers.one_npz_random_slice,
+                      npz_files, params, field='data')
+
+
+def test_h5py_storage(benchmark, h5py_params, storage, prefetch):
+    h5py_file, params = h5py_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(h5py_file)))
+    with h5py.File(h5py_file, 'r') as fp:
+        keys = list(fp.keys())
+    benchmark_storage(benchmark, storage, 'open_h5py', prefetch,
+                      minibench.samplers.one_h5py_random_slice,
+                      keys, params, fp=h5py_file)
+
+
+def test_h5py_chunked_storage(benchmark, h5py_chunked_params, storage,
+                              prefetch):
+    h5py_file, params = h5py_chunked_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(h5py_file)))
+    with h5py.File(h5py_file, 'r') as fp:
+        keys = list(fp.keys())
+    benchmark_storage(benchmark, storage, 'open_h5py', prefetch,
+                      minibench.samplers.one_h5py_chunked_random_slice,
+                      keys, params, fp=h5py_file)
@@ -0,0 +1,270 @@
+"""Sustained-throughput benchmarks of every sampling backend.
+
+Where testbench_performance.py times one draw per call, each round here
+starts a fresh sampler and times `N_DRAWS` draws in a row; the samples/s,
+MB/s and time to first sample are recorded in each benchmark's extra_info
+(see `minibench.bench.benchmark_throughput`).
+
+Every benchmark runs twice: against a warm page cache, holding the data it
+reads, and a cold one, from which that data is evicted before each round
+(see `minibench.bench.evict_page_cache`). Cold numbers are what datasets
+much larger than RAM get.
+
+Sample Calls
+------------
+Run the suite, saving the results for `minibench.parse`...
+
+  $ py.test -vs testbench_throughput.py --benchmark-save=throughput
+
+...and then load them, throughput columns and all.
+
+  > df = minibench.parse.last_benchmark().to_df()
+  > df[['mean', 'samples_per_s', 'MB_per_s', 'first_sample_s']]
+"""
+import biggie
+import functools
+import h5py
+import logging
+import os
+import pytest
+
+import minibench
+
+# Number of draws timed per round.
+N_DRAWS = 256
+BATCH_SIZE = 32
+
+
+@pytest.fixture(params=['warm', 'cold'])
+def page_cache(request, benchmark):
+    """Page cache mode of a benchmark, recorded in its extra_info; cold
+    benchmarks evict the data they read before every round."""
+    if request.param == 'cold' and not minibench.bench.CAN_EVICT:
+        pytest.skip("Page cache eviction isn't supported here.")
+    benchmark.extra_info['page_cache'] = request.param
+    return request.param
+
+
+def mux_stream(sampler, collec, params, **kwargs):
+    """Return a function starting a fresh mux of `sampler` over `collec`."""
+    return functools.partial(
+        minibench.samplers.mux_random_slice,
+        sampler=sampler,
+        collec=collec,
+        shape=params['slice'],
+        n_samples=None,
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True,
+        **kwargs)
+
+
+def opened_stream(open_handle, name, sampler, collec, params, **kwargs):
+    """Return a function starting a fresh mux of `sampler` over `collec`,
+    passing it a handle freshly opened by `open_handle` as keyword `name`;
+    the handle is closed along with the stream."""
+    def make_stream():
+        with open_handle() as handle:
+            stream = mux_stream(sampler, collec, params,
+                                **dict(kwargs, **{name: handle}))()
+            try:
+                for obs in stream:
+                    yield obs
+            finally:
+                minibench.bench.close_stream(stream)
+    return make_stream
+
+
+def test_npy_load_throughput(benchmark, npys_params, page_cache):
+    npy_files, params = npys_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npy_files[0])))
+    minibench.bench.benchmark_throughput(
+        benchmark, mux_stream(minibench.samplers.one_npy_random_slice,
+                              npy_files, params),
+        N_DRAWS,
+        before_round=minibench.bench.page_cache_setup(page_cache, npy_files))
+
+
+def test_npy_memmap_throughput(benchmark, npys_params, page_cache):
+    npy_files, params = npys_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npy_files[0])))
+    minibench.bench.benchmark_throughput(
+        benchmark, mux_stream(minibench.samplers.one_npy_random_slice,
+                              npy_files, params, mmap_mode='r'),
+        N_DRAWS,
+        before_round=minibench.bench.page_cache_setup(page_cache, npy_files))
+
+
+def test_npy_memmap_gather_throughput(benchmark, npys_params, page_cache):
+    npy_files, params = npys_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npy_files[0])))
+    minibench.bench.benchmark_throughput(
+        benchmark, mux_stream(minibench.samplers.one_npy_gather_random_slice,
+                              npy_files, params),
+        N_DRAWS,
+        before_round=minibench.bench.page_cache_setup(page_cache, npy_files))
+
+
+def test_npy_pread_throughput(benchmark, npys_params, page_cache):
+    npy_files, params = npys_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npy_files[0])))
+    minibench.bench.benchmark_throughput(
+        benchmark, mux_stream(minibench.samplers.one_npy_pread_random_slice,
+                              npy_files, params),
+        N_DRAWS,
+        before_round=minibench.bench.page_cache_setup(page_cache, npy_files))
+
+
+def test_npy_memmap_batch_throughput(benchmark, npys_params, page_cache):
+    npy_files, params = npys_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npy_files[0])))
+    make_stream = functools.partial(
+        minibench.samplers.mux_random_batch,
+        sampler=minibench.samplers.one_npy_random_slice,
+        collec=npy_files,
+        shape=params['slice'],
+        batch_size=BATCH_SIZE,
+        n_samples=None,
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True,
+        mmap_mode='r')
+    minibench.bench.benchmark_throughput(
+        benchmark, make_stream, N_DRAWS // BATCH_SIZE, batch_size=BATCH_SIZE,
+        before_round=minibench.bench.page_cache_setup(page_cache, npy_files))
+
+
+def test_npz_load_throughput(benchmark, npzs_params, page_cache):
+    npz_files, params = npzs_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npz_files[0])))
+    minibench.bench.benchmark_throughput(
+        benchmark, mux_stream(minibench.samplers.one_npz_random_slice,
+                              npz_files, params, field='data'),
+        N_DRAWS,
+        before_round=minibench.bench.page_cache_setup(page_cache, npz_files))
+
+
+def h5py_keys(h5py_file):
+    with h5py.File(h5py_file, 'r') as fp:
+        return list(fp.keys())
+
+
+def test_h5py_throughput(benchmark, h5py_params, page_cache):
+    h5py_file, params = h5py_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(h5py_file)))
+    keys = h5py_keys(h5py_file)
+
+    # Reopen the file every round, dropping HDF5's own chunk cache.
+    make_stream = opened_stream(
+        functools.partial(h5py.File, h5py_file, 'r'), 'fp',
+        minibench.samplers.one_h5py_random_slice, keys, params)
+
+    minibench.bench.benchmark_throughput(
+        benchmark, make_stream, N_DRAWS,
+        before_round=minibench.bench.page_cache_setup(
+            page_cache, [h5py_file]))
+
+
+def test_h5py_chunked_throughput(benchmark, h5py_chunked_params, page_cache):
+    h5py_file, params = h5py_chunked_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(h5py_file)))
+    keys = h5py_keys(h5py_file)
+
+    def make_stream():
+        return opened_stream(
+            functools.partial(h5py.File, h5py_file, 'r'), 'fp',
+            minibench.samplers.one_h5py_chunked_random_slice, keys, params,
+            cache=minibench.cache.ArrayCache(max_bytes=256 * 2**20))()
+
+    minibench.bench.benchmark_throughput(
+        benchmark, make_stream, N_DRAWS,
+        before_round=minibench.bench.page_cache_setup(
+            page_cache, [h5py_file]))
+
+
+def test_slab_throughput(benchmark, slab_params, page_cache):
+    slab_file, params = slab_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(slab_file)))
+    index_file = minibench.readers.slab_index_path(slab_file)
+    manifest = minibench.readers.Manifest.load(index_file)
+
+    # Map the slab afresh every round, so cold rounds read from storage;
+    # given the manifest, that's O(1) in the number of items.
+    make_stream = opened_stream(
+        functools.partial(minibench.readers.Slab, slab_file,
+                          manifest=manifest), 'slab',
+        minibench.samplers.one_slab_random_slice, manifest.keys, params)
+
+    minibench.bench.benchmark_throughput(
+        benchmark, make_stream, N_DRAWS,
+        before_round=minibench.bench.page_cache_setup(
+            page_cache, [slab_file]))
+
+
+def test_biggie_throughput(benchmark, stash_params, page_cache):
+    stash_file, params = stash_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(stash_file)))
+
+    stash = biggie.Stash(stash_file)
+    minibench.bench.benchmark_throughput(
+        benchmark, mux_stream(minibench.samplers.one_biggie_random_slice,
+                              stash.keys(), params, stash=stash,
+                              field='data'),
+        N_DRAWS,
+        before_round=minibench.bench.page_cache_setup(
+            page_cache, [stash_file]))
+
+
+TRANSPORTS = {'zmq': minibench.samplers.zmq_random_slice,
+              'shm': minibench.parallel.shm_random_slice}
+
+
+@pytest.mark.parametrize("transport", sorted(TRANSPORTS))
+def test_npy_memmap_transport_throughput(benchmark, npys_params, page_cache,
+                                         transport):
+    npy_files, params = npys_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npy_files[0])))
+    make_stream = functools.partial(
+        TRANSPORTS[transport],
+        sampler=minibench.samplers.one_npy_random_slice,
+        collec=npy_files,
+        shape=params['slice'],
+        n_samples=None,
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True,
+        mmap_mode='r')
+    minibench.bench.benchmark_throughput(
+        benchmark, make_stream, N_DRAWS,
+        before_round=minibench.bench.page_cache_setup(page_cache, npy_files))
+
+
+def test_npy_memmap_vmux_throughput(benchmark, npys_params, page_cache):
+    npy_files, params = npys_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npy_files[0])))
+    make_stream = functools.partial(
+        minibench.mux.vmux_random_slice,
+        collec=npy_files,
+        shape=params['slice'],
+        manifest=minibench.data.npy_manifest(npy_files),
+        n_samples=None,
+        lam=params['lam'],
+        working_size=params['working_size'],
+        with_replacement=True)
+    minibench.bench.benchmark_throughput(
+        benchmark, make_stream, N_DRAWS,
+        before_round=minibench.bench.page_cache_setup(page_cache, npy_files))
+
+
+def test_npy_memmap_epoch_throughput(benchmark, npys_params, page_cache):
+    npy_files, params = npys_params
+    logging.debug("\nWorkspace: {}".format(os.path.dirname(npy_files[0])))
+    make_stream = functools.partial(
+        minibench.epoch.epoch_random_slice,
+        collec=npy_files,
+        shape=params['slice'],
+        manifest=minibench.data.npy_manifest(npy_files),
+        n_epochs=None)
+    minibench.bench.benchmark_throughput(
+        benchmark, make_stream, N_DRAWS,
+        before_round=minibench.bench.page_cache_setup(page_cache, npy_files))